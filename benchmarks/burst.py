@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Measure sustained burst throughput against the simulated stick.
+
+Usage: burst.py [transfer size in bytes, default 65536] [transfers, default 5]
+
+Sends bursts with a BurstSender and reports bytes/s. Then measures
+BurstReceiver reassembly alone, and bursts sent by a virtual device
+through the event pump. The simulated stick moves packets as fast as the
+host handles them, so this measures host overhead rather than the radio.
+'''
+
+import sys
+import time
+
+import ant.core.burst as antburst
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.node as antnode
+import ant.core.simulator as antsim
+
+SIZE = 65536
+TRANSFERS = 5
+RECEIVE_SIZE = 4096
+RECEIVE_PERIOD = 4096
+
+
+class Channel():
+    '''Stands in for a channel when only reassembly is measured. '''
+    def registerCallback(self, callback):
+        pass
+
+    def removeCallback(self, callback):
+        pass
+
+
+def startNode(device):
+    node = antnode.Node(antsim.SimulatedDriver(devices=[device]))
+    node.start()
+    channel = node.getFreeChannel()
+    channel.apply(antnode.ChannelConfig(
+        node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+        device_type=120, period=device.period))
+    with channel.stream() as stream:
+        channel.open()
+        stream.get(timeout=2)
+    return node, channel
+
+
+def measureSend(size, transfers):
+    node, channel = startNode(antsim.VirtualDevice(1, 120, period=328))
+    data = bytes(range(256)) * (size // 256)
+    start = time.perf_counter()
+    for _ in range(transfers):
+        antburst.BurstSender(channel).send(data)
+    elapsed = time.perf_counter() - start
+    node.stop()
+    return size * transfers / elapsed
+
+
+def measureReassembly(size, transfers):
+    packets = antburst.Packets(0, bytes(range(256)) * (size // 256))
+    messages = antevt.ProcessBuffer(b''.join(packets))[1]
+    receiver = antburst.BurstReceiver(Channel(), size)
+    start = time.perf_counter()
+    for _ in range(transfers):
+        for msg in messages:
+            receiver.process(msg)
+        receiver.get()
+    return size * transfers / (time.perf_counter() - start)
+
+
+def measureReceive(size, transfers):
+    # The whole burst is queued at once, it has to fit the stick's buffer
+    size = min(size, RECEIVE_SIZE)
+    device = antsim.VirtualDevice(1, 120, period=RECEIVE_PERIOD, burst_every=1,
+                                  burst_length=size // antburst.PACKET_SIZE)
+    node, channel = startNode(device)
+    with channel.receiveBursts(size) as receiver:
+        try:
+            receiver.get(timeout=5)  # Skip a burst that may have started early
+        except antex.BurstError:
+            pass
+        start = time.perf_counter()
+        for _ in range(transfers):
+            receiver.get(timeout=5)
+        elapsed = time.perf_counter() - start
+    node.stop()
+    return size * transfers / elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    transfers = int(sys.argv[2]) if len(sys.argv) > 2 else TRANSFERS
+    rate = measureSend(size, transfers)
+    print('send:               %10.0f bytes/s' % rate)
+    rate = measureReassembly(size, transfers)
+    print('reassembly:         %10.0f bytes/s' % rate)
+    rate = measureReceive(size, transfers)
+    print('receive:            %10.0f bytes/s (%d byte bursts every %.0f ms)' %
+          (rate, min(size, RECEIVE_SIZE),
+           RECEIVE_PERIOD * 1000 / antsim.CLOCK_RATE))
+
+
+if __name__ == '__main__':
+    main()
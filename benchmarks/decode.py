@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Compare single-process and parallel decoding of a generated capture.
+
+Usage: decode.py [size in MB, default 64] [workers, default all cores]
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import ant.core.decode as antdec
+import ant.core.log as antlog
+
+from logreader import generate
+
+SIZE_MB = 64
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE_MB
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    filename = os.path.join(tempfile.gettempdir(), 'python-ant.bench-decode.ant')
+
+    if not os.path.exists(filename) or os.path.getsize(filename) < size * 1024 * 1024:
+        print('Generating %d MB log at %s...' % (size, filename))
+        generate(filename, size * 1024 * 1024)
+
+    start = time.perf_counter()
+    counter = antdec.TypeCounter()
+    with antlog.LogReader(filename) as reader:
+        expected = counter.start()
+        for frame in antdec.Frames(reader):
+            expected = counter.process(expected, frame)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    counts = antdec.Decode(filename, counter, workers=workers)
+    parallel = time.perf_counter() - start
+
+    frames = sum(expected.values())
+    print('frames:       %d' % frames)
+    print('1 process:    %.1f s (%.0f frames/s)' % (single, frames / single))
+    print('%d processes:  %.1f s (%.0f frames/s, %.2fx)' %
+          (workers, parallel, frames / parallel, single / parallel))
+    print('identical:    %s' % (counts == expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Measure SQLite ingestion throughput on a generated frame-level capture.
+
+Usage: ingest.py [frames, default 1000000]
+
+Decoding alone is timed too, to tell the Python side apart from SQLite.
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import ant.core.decode as antdec
+import ant.core.ingest as antingest
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+FRAMES = 1000000
+
+
+def generate(filename, frames):
+    writer = antlog.LogWriter(filename, version=antlog.LOG_VERSION_2,
+                              delta=True, frames=True)
+    writer.logOpen()
+    for i in range(frames):
+        writer.logFrame(antlog.DIRECTION_IN, antmsg.ChannelBroadcastDataMessage(
+            number=i % 8, data=bytes([i % 256]) * 8))
+    writer.logClose()
+    writer.close()
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    filename = os.path.join(tempfile.gettempdir(), 'python-ant.bench-ingest.ant')
+    database = os.path.join(tempfile.gettempdir(), 'python-ant.bench-ingest.db')
+
+    print('Generating %d frames at %s...' % (frames, filename))
+    generate(filename, frames)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+    start = time.perf_counter()
+    with antlog.LogReader(filename) as reader:
+        decoded = sum(1 for _ in antdec.Frames(reader))
+    print('decode rows/s: %.0f' % (decoded / (time.perf_counter() - start)))
+
+    start = time.perf_counter()
+    with antingest.Database(database) as db:
+        rows = db.ingest(filename)
+    elapsed = time.perf_counter() - start
+
+    print('rows:          %d' % rows)
+    print('rows/s:        %.0f' % (rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Compare size and write/read throughput of the log formats.
+
+Usage: logformats.py [events, default 1000000]
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+EVENTS = 1000000
+
+FORMATS = [
+    ('v1', {}),
+    ('v2', {'version': antlog.LOG_VERSION_2}),
+    ('v2 delta', {'version': antlog.LOG_VERSION_2, 'delta': True}),
+    ('v2 zlib', {'version': antlog.LOG_VERSION_2, 'delta': True,
+                 'compression': antlog.COMPRESSION_ZLIB}),
+    ('v2 lzma', {'version': antlog.LOG_VERSION_2, 'delta': True,
+                 'compression': antlog.COMPRESSION_LZMA}),
+]
+
+
+def chunks():
+    '''20 byte reads of a stream of broadcast frames with a running counter. '''
+    stream = b''.join(antmsg.ChannelBroadcastDataMessage(
+        number=i % 4, data=(i // 4).to_bytes(8, 'little')).encode()
+                      for i in range(4096))
+    return [stream[i:i + 20] for i in range(0, len(stream), 20)]
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    data = chunks()
+    filename = os.path.join(tempfile.gettempdir(), 'python-ant.bench.ant')
+
+    print('%-10s %10s %12s %12s' % ('format', 'MB', 'write ev/s', 'read ev/s'))
+    for name, options in FORMATS:
+        start = time.perf_counter()
+        writer = antlog.LogWriter(filename, **options)
+        for i in range(events):
+            writer.logRead(data[i % len(data)])
+        writer.close()
+        write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with antlog.LogReader(filename) as reader:
+            read = sum(1 for _ in reader)
+        read_time = time.perf_counter() - start
+        assert read == events
+
+        print('%-10s %10.2f %12.0f %12.0f' % (
+            name, os.path.getsize(filename) / 1024.0 / 1024.0,
+            events / write_time, events / read_time))
+
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Measure LogReader throughput and peak memory on a generated capture.
+
+Usage: logreader.py [size in MB, default 1024] [file]
+'''
+
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+SIZE_MB = 1024
+
+
+def generate(filename, size):
+    frame = antmsg.ChannelBroadcastDataMessage(number=0, data=b'\x00' * 8).encode()
+    chunks = [(frame * 2)[i:i + 20] for i in range(len(frame))]
+
+    writer = antlog.LogWriter(filename)
+    writer.logOpen()
+    i = 0
+    # Only look at the file size every 100000 events
+    while i % 100000 or writer.fd.tell() < size:
+        writer.logRead(chunks[i % len(chunks)])
+        i += 1
+    writer.logClose()
+    writer.close()
+
+
+def peakRSS():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE_MB
+    filename = sys.argv[2] if len(sys.argv) > 2 else \
+        os.path.join(tempfile.gettempdir(), 'python-ant.bench.ant')
+
+    if not os.path.exists(filename) or os.path.getsize(filename) < size * 1024 * 1024:
+        print('Generating %d MB log at %s...' % (size, filename))
+        generate(filename, size * 1024 * 1024)
+
+    rss = peakRSS()
+    start = time.perf_counter()
+    events = 0
+    with antlog.LogReader(filename) as reader:
+        for _ in reader:
+            events += 1
+    elapsed = time.perf_counter() - start
+
+    print('events:       %d' % events)
+    print('events/s:     %.0f' % (events / elapsed))
+    print('MB/s:         %.1f' % (os.path.getsize(filename) / elapsed / 1024 / 1024))
+    print('peak RSS:     %.1f MB (%.1f MB before reading)' % (peakRSS(), rss))
+
+
+if __name__ == '__main__':
+    main()
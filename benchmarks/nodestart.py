@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Measure Node start/stop time against the simulated stick.
+
+Usage: nodestart.py [runs, default 5]
+
+Compares sticks that send the startup message after a reset with ones
+that don't, for which Node falls back to sleeping RESET_DELAY, and breaks
+the start of a stick with 8 networks and 15 channels down into phases.
+'''
+
+import sys
+import time
+
+import ant.core.node as antnode
+import ant.core.simulator as antsim
+
+RUNS = 5
+
+
+def measure(startup_message, runs, **kwargs):
+    starts, stops = [], []
+    for _ in range(runs):
+        node = antnode.Node(antsim.SimulatedDriver(startup_message=startup_message,
+                                                   **kwargs))
+        start = time.perf_counter()
+        node.start()
+        starts.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        node.stop()
+        stops.append(time.perf_counter() - start)
+    return min(starts), min(stops)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    for title, startup_message in (('startup message', True),
+                                   ('no startup message', False)):
+        start, stop = measure(startup_message, runs)
+        print('%-20s start %7.1f ms   stop %7.1f ms' %
+              (title + ':', start * 1000, stop * 1000))
+
+    node = antnode.Node(antsim.SimulatedDriver(max_channels=15, max_networks=8))
+    node.start()
+    node.stop()
+    timings = node.getTimings()
+    print('8 networks, 15 channels: %.1f ms' % (sum(timings.values()) * 1000))
+    for phase, seconds in timings.items():
+        print('  %-14s %7.1f ms' % (phase, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''
+Measure how well ProcessBuffer recovers frames from a corrupted byte stream.
+
+For every fault profile a fixed capture of broadcast frames is read through a
+FaultInjectingDriver and parsed, reporting frames recovered per second and
+frames lost.
+'''
+
+import sys
+import time
+
+import ant.core.driver as antdrv
+import ant.core.event as antevt
+import ant.core.message as antmsg
+import ant.core.simulator as antsim
+
+FRAMES = 200000
+
+PROFILES = [
+    ('clean', {}),
+    ('fragmented', {'fragment_rate': 0.5}),
+    ('drop 0.1%', {'drop_rate': 0.001}),
+    ('drop 1%', {'drop_rate': 0.01}),
+    ('flip 0.1%', {'flip_rate': 0.001}),
+    ('flip 1%', {'flip_rate': 0.01}),
+    ('duplicate 1%', {'duplicate_rate': 0.01}),
+    ('mixed 1%', {'drop_rate': 0.01, 'flip_rate': 0.01,
+                  'duplicate_rate': 0.01, 'fragment_rate': 0.5}),
+]
+
+
+class StreamDriver(antdrv.Driver):
+    '''Serves a fixed byte stream. '''
+    def __init__(self, stream):
+        antdrv.Driver.__init__(self, 'stream')
+        self.stream = stream
+        self.position = 0
+
+    def _open(self):
+        self.position = 0
+
+    def _close(self):
+        pass
+
+    def _read(self, count):
+        data = self.stream[self.position:self.position + count]
+        self.position += count
+        return data
+
+    def _write(self, data):
+        return len(data)
+
+
+def capture(frames):
+    return b''.join(antmsg.ChannelBroadcastDataMessage(
+        number=i % 8, data=(i & 0xFFFFFFFF).to_bytes(8, 'little')).encode()
+                    for i in range(frames))
+
+
+def run(stream, frames, name, faults):
+    driver = antsim.FaultInjectingDriver(StreamDriver(stream), seed=1, **faults)
+    driver.open()
+
+    stats = {}
+    buffer_ = b''
+    start = time.perf_counter()
+    data = driver.read(20)
+    while data:
+        buffer_, _ = antevt.ProcessBuffer(buffer_ + data, stats)
+        data = driver.read(20)
+    elapsed = time.perf_counter() - start
+    driver.close()
+
+    recovered = stats.get('frames', 0)
+    print('%-14s %10d %10d %12.0f %8d %8d' % (
+        name, recovered, max(frames - recovered, 0), recovered / elapsed,
+        stats.get('checksum', 0), stats.get('sync', 0) + stats.get('length', 0)))
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    stream = capture(frames)
+
+    print('%-14s %10s %10s %12s %8s %8s' % (
+        'profile', 'recovered', 'lost', 'frames/s', 'checksum', 'resync'))
+    for name, faults in PROFILES:
+        run(stream, frames, name, faults)
+
+
+if __name__ == '__main__':
+    main()
@@ -32,11 +32,10 @@ key = antnode.NetworkKey('N:ANT+', NETKEY)
 node.setNetworkKey(0, key)
 channel = node.getFreeChannel()
 channel.name = 'C:HRM'
-channel.assign('N:ANT+', antc.CHANNEL_TYPE_TWOWAY_RECEIVE)
-channel.setID(120, 0, 0)
-channel.setSearchTimeout(antc.TIMEOUT_NEVER)
-channel.setPeriod(8070)
-channel.setFrequency(57)
+channel.apply(antnode.ChannelConfig('N:ANT+', antc.CHANNEL_TYPE_TWOWAY_RECEIVE,
+                                    device_type=120,
+                                    search_timeout=antc.TIMEOUT_NEVER,
+                                    period=8070, frequency=57))
 channel.open()
 
 # Setup callback
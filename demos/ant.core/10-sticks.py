@@ -0,0 +1,27 @@
+'''List every attached ANT USB stick and open them all at once. '''
+
+import ant.core.driver as antdrv
+import ant.core.exceptions as antex
+
+# Enumerate sticks on the bus (bus order, so indexes are stable until replug)
+sticks = antdrv.DriverFactory.enumerate()
+for index, info in enumerate(sticks):
+    print('%d: bus %03d address %03d product 0x%04X serial %s' % (
+        index, info.bus, info.address, info.product_id, info.serial))
+
+if not sticks:
+    print('No ANT USB sticks found.')
+
+# A single stick can be opened by index or serial number, e.g.:
+#stick = antdrv.DriverFactory.create('USB2', index=1)
+#stick = antdrv.DriverFactory.create('USB2', serial=sticks[0].serial)
+
+# Or open all of them in parallel
+pool = antdrv.DriverFactory.createPool()
+try:
+    pool.open()
+except antex.DriverError as e:
+    print(e)
+else:
+    print('Opened %d sticks.' % len(pool))
+    pool.close()
@@ -2,6 +2,8 @@
 
 '''Configuration for Demos. '''
 
+import logging
+
 import ant.core.log as antl
 
 # Type of Driver to use - USB1 or USB2
@@ -17,6 +19,10 @@ SERIAL = '/dev/ttyUSB0'
 # are doing, leave it as is.
 DEBUG = True
 
+# Driver hex dumps are logged at DEBUG level
+if DEBUG:
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+
 # Set to None to disable logging
 #LOG = None
 LOG = antl.LogWriter()
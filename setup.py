@@ -60,4 +60,13 @@ setup(
         'pyusb',
         'msgpack-python'
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': [
+            'ant-log = ant.core.logtool:main',
+            'ant-log-ingest = ant.core.ingest:main',
+        ],
+    },
 )
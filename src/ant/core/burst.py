@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""Burst Transfers
+
+Splits data into burst packets and sends them, and reassembles the bursts
+received on a channel.
+"""
+
+import queue
+import threading
+import time
+
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+
+PACKET_SIZE = 8
+SEQUENCE_LAST = 0x04
+# Bytes preallocated to reassemble a received burst, grown when needed
+BURST_BUFFER = 4096
+# How long to wait for the transfer to start and for its outcome (seconds)
+BURST_TIMEOUT = 5.0
+
+
+def Sequence(index, count):
+    '''Returns the sequence number of packet index of a count packet burst. '''
+    sequence = 0 if index == 0 else (index - 1) % 3 + 1
+    if index == count - 1:
+        sequence |= SEQUENCE_LAST
+    return sequence
+
+
+def Packets(number, data):
+    '''Returns the encoded burst packets carrying data on channel number.
+    The last packet is padded with zeroes. '''
+    count = max((len(data) + PACKET_SIZE - 1) // PACKET_SIZE, 1)
+    packets = []
+    for index in range(count):
+        chunk = bytes(data[index * PACKET_SIZE:(index + 1) * PACKET_SIZE])
+        msg = antmsg.ChannelBurstDataMessage(
+            number=number, data=chunk.ljust(PACKET_SIZE, b'\x00'))
+        msg.setSequenceNumber(Sequence(index, count))
+        packets.append(msg.encode())
+    return packets
+
+
+class BurstSender(antevt.EventCallback):
+    '''Sends one burst on a channel. See Channel.sendBurst().
+
+    The stick reports no progress between the start and the end of a
+    transfer, so once it started the driver's flow control paces the rest
+    of the packets. They are written one at a time, which frees the driver
+    for the event pump between them and keeps each transfer short.
+    '''
+    def __init__(self, channel):
+        self.channel = channel
+        self.started = False
+        self.result = None
+        self._cond = threading.Condition()
+
+    def process(self, msg):
+        if not isinstance(msg, antmsg.ChannelEventMessage):
+            return
+
+        code = msg.getMessageCode()
+        with self._cond:
+            if msg.getMessageID() == 0x01:
+                if code == msgtypes.EVENT_TRANSFER_TX_START:
+                    self.started = True
+                elif code in (msgtypes.EVENT_TRANSFER_TX_COMPLETED,
+                              msgtypes.EVENT_TRANSFER_TX_FAILED,
+                              msgtypes.EVENT_CHANNEL_CLOSED):
+                    self.result = code
+            elif msg.getMessageID() == msgtypes.MESSAGE_CHANNEL_BURST_DATA and \
+                    code != msgtypes.RESPONSE_NO_ERROR:
+                self.result = code
+            self._cond.notify_all()
+
+    def _wait(self, predicate, deadline):
+        with self._cond:
+            return self._cond.wait_for(predicate, deadline - time.monotonic())
+
+    def _write(self, data):
+        '''Writes all of data, carrying on after short writes. '''
+        driver = self.channel.node.driver
+        while data:
+            count = driver.write(data)
+            if not count:
+                raise antex.BurstError('Burst transfer failed (short write).')
+            data = data[count:]
+
+    def send(self, data, timeout=BURST_TIMEOUT):
+        packets = Packets(self.channel.number, data)
+        deadline = time.monotonic() + timeout
+
+        self.channel.registerCallback(self)
+        try:
+            # Only stream the rest once the stick took the first packet
+            self._write(packets[0])
+            if len(packets) > 1:
+                self._wait(lambda: self.started or self.result is not None,
+                           deadline)
+                for packet in packets[1:]:
+                    if not self.started or self.result is not None:
+                        break
+                    self._write(packet)
+            self._wait(lambda: self.result is not None, deadline)
+        finally:
+            self.channel.removeCallback(self)
+
+        if self.result is None:
+            raise antex.BurstError('Burst transfer timed out.')
+        if self.result != msgtypes.EVENT_TRANSFER_TX_COMPLETED:
+            raise antex.BurstError('Burst transfer failed (0x%02X).' % self.result)
+
+
+class BurstReceiver(antevt.EventCallback):
+    '''Reassembles the bursts received on a channel. See
+    Channel.receiveBursts().
+
+    Packets are copied into a preallocated buffer as they arrive. A burst
+    with a sequence error, or one the stick reported failed, is dropped and
+    surfaces as a BurstError from get().
+    '''
+    def __init__(self, channel, size=BURST_BUFFER):
+        self.channel = channel
+        self.buffer = bytearray(size)
+        self.length = 0
+        self.active = False
+        self.sequence = 0
+        self.completed = 0
+        self.failed = 0
+        self.closed = False
+        self._transfers = queue.Queue()
+        channel.registerCallback(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _fail(self, reason):
+        self.active = False
+        self.failed += 1
+        self._transfers.put(antex.BurstError(reason))
+
+    def process(self, msg):
+        if isinstance(msg, antmsg.ChannelBurstDataMessage):
+            sequence = msg.getSequenceNumber()
+            counter = sequence & 0x03
+            if counter == 0:
+                if self.active:
+                    self._fail('Burst transfer restarted.')
+                self.active = True
+                self.length = 0
+            elif not self.active:
+                return  # Missed the start of this one
+            elif counter != self.sequence:
+                self._fail('Burst sequence error (expected %d, got %d).' %
+                           (self.sequence, counter))
+                return
+            self.sequence = counter % 3 + 1
+
+            end = self.length + PACKET_SIZE
+            if end > len(self.buffer):
+                self.buffer.extend(bytes(len(self.buffer)))
+            self.buffer[self.length:end] = msg.getPayload()[1:PACKET_SIZE + 1]
+            self.length = end
+
+            if sequence & SEQUENCE_LAST:
+                self.active = False
+                self.completed += 1
+                self._transfers.put(bytes(self.buffer[:self.length]))
+        elif isinstance(msg, antmsg.ChannelEventMessage) and self.active and \
+                msg.getMessageID() == 0x01:
+            code = msg.getMessageCode()
+            if code == msgtypes.EVENT_TRANSFER_RX_FAILED:
+                self._fail('Burst transfer failed.')
+            elif code == msgtypes.EVENT_CHANNEL_CLOSED:
+                self._fail('Channel closed during burst transfer.')
+
+    def close(self):
+        self.channel.removeCallback(self)
+        self.closed = True
+        self._transfers.put(None)
+
+    def get(self, timeout=None):
+        '''Returns the data of the next burst received, None on timeout or
+        once closed. Raises BurstError if that burst failed. '''
+        try:
+            transfer = self._transfers.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if transfer is None:
+            self._transfers.put(None)
+        elif isinstance(transfer, antex.BurstError):
+            raise transfer
+        return transfer
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''Batch decoding of log files into frames.
+
+Frames are (timestamp, direction, type, payload) tuples. Frames() decodes
+a stream of log events on one core, Decode() splits logs into chunks at
+record boundaries and decodes them in parallel worker processes with
+exactly the same result.
+'''
+
+import concurrent.futures
+import heapq
+
+import ant.core.event as antevt
+import ant.core.log as antlog
+
+# Events decoded by each worker task
+CHUNK_EVENTS = 100000
+
+# Points where a chunk's decoder had an empty buffer, kept to splice the
+# chunk onto the exact decoder state left by the one before it
+MAX_SYNCS = 16
+
+
+class Reducer():
+    '''Folds decoded frames into a result.
+
+    Decode() runs process() on every frame of a chunk in a worker, in order,
+    then merge()s chunk results in order, so reducers must be picklable.
+    '''
+    def start(self):
+        return None
+
+    def process(self, result, frame):
+        return result
+
+    def merge(self, result, other):
+        return result
+
+
+class FrameList(Reducer):
+    '''Collects the frames themselves. '''
+    def start(self):
+        return []
+
+    def process(self, result, frame):
+        result.append(frame)
+        return result
+
+    def merge(self, result, other):
+        result.extend(other)
+        return result
+
+
+class TypeCounter(Reducer):
+    '''Counts frames per (direction, type). '''
+    def start(self):
+        return {}
+
+    def process(self, result, frame):
+        key = (frame[1], frame[2],)
+        result[key] = result.get(key, 0) + 1
+        return result
+
+    def merge(self, result, other):
+        for key, count in other.items():
+            result[key] = result.get(key, 0) + count
+        return result
+
+
+class Decoder():
+    '''Turns log events into frames the way the event pump parses reads.
+
+    buffer holds received bytes not yet forming a whole frame. If given,
+    stats counts parse errors like ProcessBuffer does, including the ones
+    recorded in frame-level logs.
+    '''
+    def __init__(self, buffer_=b'', stats=None):
+        self.buffer = buffer_
+        self.stats = stats
+
+    def process(self, event):
+        type_ = event[0]
+        if type_ == antlog.EVENT_READ:
+            self.buffer, messages = antevt.ProcessBuffer(self.buffer + event[2],
+                                                         self.stats)
+            direction = antlog.DIRECTION_IN
+        elif type_ == antlog.EVENT_WRITE:
+            # Writes are whole encoded messages
+            messages = antevt.ProcessBuffer(event[2])[1]
+            direction = antlog.DIRECTION_OUT
+        elif type_ == antlog.EVENT_FRAME:
+            direction, msg_type, _, payload = event[2]
+            return [(event[1], direction, msg_type, payload,)]
+        elif type_ in (antlog.EVENT_PARSE_ERROR, antlog.EVENT_RESYNC):
+            if self.stats is not None:
+                reason, data = event[2]
+                self.stats[reason] = self.stats.get(reason, 0) + 1
+                self.stats['discarded'] = self.stats.get('discarded', 0) + len(data)
+            return []
+        else:
+            if type_ == antlog.EVENT_OPEN:
+                self.buffer = b''
+            return []
+
+        return [(event[1], direction, msg.getType(), msg.getPayload(),)
+                for msg in messages]
+
+
+def Frames(events):
+    '''Yields the frames of a stream of log events (e.g. a LogReader). '''
+    decoder = Decoder()
+    for event in events:
+        yield from decoder.process(event)
+
+
+def MergeFrames(readers, duplicates=False, window=antlog.DUPLICATE_WINDOW):
+    '''Decodes several logs, e.g. one per stick, into one frame stream.
+
+    Yields (source, frame) in timestamp order, see log.MergeReader.
+    '''
+    duplicate_filter = antlog.DuplicateFilter(window) if duplicates else None
+    streams = [antlog.Tag(source, Frames(reader), lambda frame: frame[0])
+               for source, reader in enumerate(readers)]
+
+    for timestamp, source, _, frame in heapq.merge(*streams):
+        if duplicate_filter is not None and \
+           duplicate_filter.isDuplicate(source, *frame):
+            continue
+        yield (source, frame,)
+
+
+def FindChunks(filename, chunk_events=CHUNK_EVENTS):
+    '''Splits a log into (entry, count) chunks starting at record boundaries.
+
+    entry is suitable for LogReader.seekEntry(), count is the number of
+    events in the chunk (None for the last one, which runs to the end).
+    Compressed logs are split at block headers, others at sidecar index
+    entries. Logs without an index are indexed first (see log.BuildIndex),
+    or decoded as a single chunk if the index can't be written.
+    '''
+    with antlog.LogReader(filename) as reader:
+        if reader.compression is not None:
+            starts = []
+            block = reader.skipBlock()
+            while block is not None:
+                starts.append(block[0])
+                block = reader.skipBlock()
+        else:
+            starts = reader.getIndex().entries
+            if not starts:
+                try:
+                    starts = antlog.BuildIndex(filename).entries
+                except (IOError, OSError):
+                    pass
+
+    entries = []
+    for entry in starts:
+        if not entries or entry[0] - entries[-1][0] >= chunk_events:
+            entries.append(entry)
+    if not entries or entries[0][0] != 0:
+        entries.insert(0, None)
+
+    numbers = [0 if entry is None else entry[0] for entry in entries]
+    counts = [b - a for a, b in zip(numbers, numbers[1:])] + [None]
+    return list(zip(entries, counts))
+
+
+def _DecodeChunk(filename, entry, count, reducer):
+    decoder = Decoder()
+    head, syncs = [], []
+    result = reducer.start()
+
+    with antlog.LogReader(filename) as reader:
+        reader.seekEntry(entry)
+        i = 0
+        while count is None or i < count:
+            event = reader.read()
+            if event is None:
+                break
+
+            frames = decoder.process(event)
+            if len(syncs) < MAX_SYNCS:
+                head.extend(frames)
+                if not decoder.buffer:
+                    syncs.append((i, len(head),))
+            else:
+                for frame in frames:
+                    result = reducer.process(result, frame)
+            i += 1
+
+    return (head, syncs, result, decoder.buffer,)
+
+
+def _Redecode(filename, entry, count, buffer_, head, syncs):
+    '''Decodes a chunk from the real decoder state until it meets the
+    worker's. Returns (frames, buffer, spliced). '''
+    decoder = Decoder(buffer_)
+    syncs = dict(syncs)
+    frames = []
+
+    with antlog.LogReader(filename) as reader:
+        reader.seekEntry(entry)
+        i = 0
+        while count is None or i < count:
+            event = reader.read()
+            if event is None:
+                break
+
+            frames.extend(decoder.process(event))
+            if not decoder.buffer and i in syncs:
+                return (frames + head[syncs[i]:], b'', True,)
+            i += 1
+
+    return (frames, decoder.buffer, False,)
+
+
+def Decode(filenames, reducer=None, workers=None, chunk_events=CHUNK_EVENTS):
+    '''Decodes one or more logs, as one stream, on `workers` processes.
+
+    The result is what reducer (FrameList by default) makes of the frames,
+    which are the same as Frames() would yield over the logs in order.
+    '''
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    if reducer is None:
+        reducer = FrameList()
+
+    chunks = [(filename, entry, count,)
+              for filename in filenames
+              for entry, count in FindChunks(filename, chunk_events)]
+
+    total = reducer.start()
+    buffer_ = b''
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_DecodeChunk, filename, entry, count, reducer)
+                   for filename, entry, count in chunks]
+
+        for (filename, entry, count), future in zip(chunks, futures):
+            head, syncs, result, tail = future.result()
+            if buffer_:
+                # A frame straddles the chunk boundary
+                head, buffer_, spliced = _Redecode(filename, entry, count,
+                                                   buffer_, head, syncs)
+                if spliced:
+                    buffer_ = tail
+                else:
+                    result = reducer.start()
+            else:
+                buffer_ = tail
+
+            for frame in head:
+                total = reducer.process(total, frame)
+            total = reducer.merge(total, result)
+
+    return total
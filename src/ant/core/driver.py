@@ -26,6 +26,10 @@
 """Drivers
 """
 
+import errno
+import logging
+import queue
+import threading
 from array import array
 from abc import ABC, abstractmethod
 
@@ -39,16 +43,151 @@ import ant.core.exceptions as antex
 
 import _thread
 
+logger = logging.getLogger(__name__)
+
+USB_VENDOR_ID = 0x0fcf
+USB_PRODUCT_IDS = (0x1008, 0x1009,)
+LIBUSB_ERROR_NO_DEVICE = -4
+
+
+class USBDeviceInfo():
+    '''Describes an ANT USB stick attached to the bus. '''
+    def __init__(self, bus, address, product_id, serial=None):
+        self.bus = bus
+        self.address = address
+        self.product_id = product_id
+        self.serial = serial
+
+    def __repr__(self):
+        return (f'<USBDeviceInfo bus={self.bus} address={self.address} '
+                f'product=0x{self.product_id:04X} serial={self.serial}>')
+
+
+def _findUSBDevices():
+    devices = usb.core.find(find_all=True, idVendor=USB_VENDOR_ID,
+                            custom_match=lambda d: d.idProduct in USB_PRODUCT_IDS)
+    return sorted(devices, key=lambda d: (d.bus, d.address))
+
+
+def _isUSBDeviceLost(ex):
+    return ex.errno == errno.ENODEV or \
+        getattr(ex, 'backend_error_code', None) == LIBUSB_ERROR_NO_DEVICE
+
+
+def _getUSBSerial(dev):
+    try:
+        return usb.util.get_string(dev, dev.iSerialNumber)
+    except (usb.core.USBError, ValueError, NotImplementedError):
+        # Reading string descriptors may need more permissions than we have
+        return None
+
+
+def HexDump(data, title, length=8):
+    '''Formats data as a hex dump, length bytes per line. '''
+    lines = ['========== [{0}] =========='.format(title)]
+
+    line = 0
+    while data:
+        row = data[:length]
+        data = data[length:]
+        hex_data = ['%02X' % byte for byte in row]
+        lines.append('%04X ' % line + ' '.join(hex_data))
+        line += length
+
+    return '\n'.join(lines)
+
+
+class DebugTracer():
+    '''Hex dumps driver traffic to the ant.core.driver logger at DEBUG level.
+
+    Buffers are handed to a background thread through a bounded queue, so
+    tracing never formats or does I/O on the read/write path. When the queue
+    is full buffers are dropped. read_rate and write_rate are the fraction of
+    buffers traced in each direction.
+    '''
+    def __init__(self, read_rate=1.0, write_rate=1.0, max_queue=1024):
+        self.rates = {'READ': read_rate, 'WRITE': write_rate}
+        self.traced = 0
+        self.skipped = 0
+        self.dropped = 0
+        self._credit = {'READ': 0.0, 'WRITE': 0.0}
+        # Reads and writes are traced from different threads
+        self._credit_lock = _thread.allocate_lock()
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._thread_lock = _thread.allocate_lock()
+
+    def trace(self, data, title):
+        if not data or not logger.isEnabledFor(logging.DEBUG):
+            return
+
+        # Deterministic sampling: trace once every 1 / rate buffers
+        with self._credit_lock:
+            self._credit[title] += self.rates[title]
+            if self._credit[title] < 1.0:
+                self.skipped += 1
+                return
+            self._credit[title] -= 1.0
+
+        if self._thread is None:
+            self._start()
+
+        try:
+            self._queue.put_nowait((title, bytes(data)))
+            self.traced += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        '''Blocks until every queued buffer has been logged. '''
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self):
+        self._thread_lock.acquire()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='ant-driver-tracer')
+            self._thread.start()
+        self._thread_lock.release()
+
+    def _run(self):
+        while True:
+            title, data = self._queue.get()
+            try:
+                logger.debug('%s', HexDump(data, title))
+            finally:
+                self._queue.task_done()
+
 
 class Driver(ABC):
-    '''The abstract class representing the communication methods to interface with ANT nodes. '''
-    _lock = _thread.allocate_lock()
+    '''The abstract class representing the communication methods to interface with ANT nodes.
 
+    debug may be True or a DebugTracer to hex dump traffic through logging.
+    '''
     def __init__(self, device, log=None, debug=False):
+        self._lock = _thread.allocate_lock()
         self.device = device
         self.debug = debug
         self.log = log
         self.is_open = False
+        self.tracer = None
+        if isinstance(debug, DebugTracer):
+            self.tracer = debug
+        elif debug:
+            self.tracer = DebugTracer()
+
+    def getIdentity(self) -> str:
+        '''Names the physical stick, e.g. to cache what is known about it. '''
+        return '%s:%s' % (type(self).__name__, self.device)
+
+    def getFrameHook(self):
+        '''Returns what the event pump hands parsed messages to, through
+        logReadFrame(msg), logParseError(reason, data) and logResync(reason,
+        data): the log if it logs frames rather than raw reads, else None. '''
+        if getattr(self.log, 'frames', False):
+            return self.log
+        return None
 
     def isOpen(self) -> bool:
         self._lock.acquire()
@@ -85,6 +224,25 @@ class Driver(ABC):
         finally:
             self._lock.release()
 
+    def reconnect(self):
+        '''Reopens a device that went away (DeviceLostError) and came back. '''
+        self._lock.acquire()
+
+        try:
+            if self.is_open:
+                try:
+                    self._close()
+                except (antex.DriverError, OSError):
+                    pass    # Device is gone, nothing left to release
+                self.is_open = False
+
+            self._open()
+            self.is_open = True
+            if self.log:
+                self.log.logOpen()
+        finally:
+            self._lock.release()
+
     def read(self, count):
         self._lock.acquire()
 
@@ -97,12 +255,12 @@ class Driver(ABC):
             data = self._read(count)
             if self.log:
                 self.log.logRead(data)
-
-            if self.debug:
-                self._dump(data, 'READ')
         finally:
             self._lock.release()
 
+        if self.tracer:
+            self.tracer.trace(data, 'READ')
+
         return data
 
     def write(self, data):
@@ -114,32 +272,16 @@ class Driver(ABC):
             if len(data) <= 0:
                 raise antex.DriverError("Could not write to device (no data).")
 
-            if self.debug:
-                self._dump(data, 'WRITE')
-
             ret = self._write(data)
             if self.log:
                 self.log.logWrite(data[0:ret])
         finally:
             self._lock.release()
 
-        return ret
-
-    def _dump(self, data, title):
-        if len(data) == 0:
-            return
-
-        print('========== [{0}] =========='.format(title))
-
-        length = 8
-        line = 0
-        while data:
-            row = data[:length]
-            data = data[length:]
-            hex_data = ['%02X' % byte for byte in row]
-            print('%04X' % line, ' '.join(hex_data))
+        if self.tracer:
+            self.tracer.trace(data[0:ret], 'WRITE')
 
-        print('')
+        return ret
 
     @abstractmethod
     def _open(self):
@@ -181,7 +323,10 @@ class USB1Driver(Driver):
         self._serial.close()
 
     def _read(self, count):
-        return self._serial.read(count)
+        try:
+            return self._serial.read(count)
+        except serial.SerialException as ex:
+            raise antex.DeviceLostError(str(ex))
 
     def _write(self, data):
         try:
@@ -189,15 +334,57 @@ class USB1Driver(Driver):
             self._serial.flush()
         except serial.SerialTimeoutException as ex:
             raise antex.DriverError(str(ex))
+        except serial.SerialException as ex:
+            raise antex.DeviceLostError(str(ex))
 
         return count
 
 
 class USB2Driver(Driver):
-    '''USB Driver using PyUSB. '''
+    '''USB Driver using PyUSB.
+
+    The stick is picked by position in the bus order (index), by USB serial
+    number or by passing a USBDeviceInfo as device. Defaults to the first one.
+    '''
+    def __init__(self, device=None, log=None, debug=False, index=None, serial=None):
+        Driver.__init__(self, device, log, debug)
+        self.index = index
+        self.serial = serial
+        self._dev = None
+
+    def _find(self):
+        devices = _findUSBDevices()
+
+        if isinstance(self.device, USBDeviceInfo):
+            # Replugging changes the address, so prefer the serial number
+            for dev in devices:
+                if self.device.serial is not None:
+                    if _getUSBSerial(dev) == self.device.serial:
+                        return dev
+                elif (dev.bus, dev.address) == (self.device.bus, self.device.address):
+                    return dev
+        elif self.serial is not None:
+            for dev in devices:
+                if _getUSBSerial(dev) == self.serial:
+                    return dev
+        elif devices:
+            index = self.index or 0
+            if index < len(devices):
+                return devices[index]
+
+        return None
+
     def _open(self):
+        # A stick still enumerating after a replug fails in all sorts of
+        # places, callers retrying on DriverError must see one
+        try:
+            self._connect()
+        except usb.core.USBError as ex:
+            raise antex.DriverError('Could not open device (%s)' % ex)
+
+    def _connect(self):
         # Most of this is straight from the PyUSB example documentation
-        dev = usb.core.find(idVendor=0x0fcf, idProduct=0x1008)
+        dev = self._find()
 
         if dev is None:
             raise antex.DriverError('Could not open device (not found)')
@@ -227,21 +414,45 @@ class USB2Driver(Driver):
         self._dev = dev
         self._int = interface_number
 
+    def getIdentity(self):
+        '''The USB serial number of the stick, or its bus position if it
+        has none. Only known once open unless the stick is picked by serial
+        number. '''
+        serial = self.serial
+        if serial is None and isinstance(self.device, USBDeviceInfo):
+            serial = self.device.serial
+        if serial is None:
+            if self._dev is None:
+                raise antex.DriverError('Could not identify device (not open).')
+            serial = _getUSBSerial(self._dev)
+        if serial:
+            return 'USB:' + serial
+        return 'USB:%d:%d' % (self._dev.bus, self._dev.address)
+
     def _close(self):
-        usb.util.release_interface(self._dev, self._int)
+        try:
+            usb.util.release_interface(self._dev, self._int)
+        finally:
+            usb.util.dispose_resources(self._dev)
 
     def _read(self, count):
         arr_inp = array('B')
         try:
             arr_inp = self._ep_in.read(count)
-        except usb.core.USBError:
+        except usb.core.USBError as ex:
+            if _isUSBDeviceLost(ex):
+                raise antex.DeviceLostError(str(ex))
             # Timeout errors seem to occasionally be expected
-            pass
 
-        return arr_inp.tostring()
+        return arr_inp.tobytes()
 
     def _write(self, data):
-        count = self._ep_out.write(data)
+        try:
+            count = self._ep_out.write(data)
+        except usb.core.USBError as ex:
+            if _isUSBDeviceLost(ex):
+                raise antex.DeviceLostError(str(ex))
+            raise antex.DriverError(str(ex))
 
         return count
 
@@ -250,15 +461,86 @@ class DriverFactory():
     '''Factory to create Driver's. '''
 
     @staticmethod
-    def create(type_, device=None, log=None, debug=False) -> Driver:
+    def create(type_, device=None, log=None, debug=False, index=None,
+               serial=None) -> Driver:
         ''' Create ANT driver based on type specified. '''
         driver = None
 
         if type_ == 'USB1':
             driver = USB1Driver(device, log=log, debug=debug)
         elif type_ == 'USB2':
-            driver = USB2Driver(None, log=log, debug=debug)
+            driver = USB2Driver(None, index=index, serial=serial, log=log,
+                                debug=debug)
         else:
             raise antex.DriverError('Unknown driver type.')
 
         return driver
+
+    @staticmethod
+    def enumerate() -> list:
+        ''' List every ANT USB stick attached to the bus. '''
+        return [USBDeviceInfo(dev.bus, dev.address, dev.idProduct,
+                              _getUSBSerial(dev))
+                for dev in _findUSBDevices()]
+
+    @staticmethod
+    def createPool(log_factory=None, debug=False) -> 'DriverPool':
+        ''' Create a pool with a USB2 driver for every attached ANT USB stick.
+
+        log_factory, if given, is called with each USBDeviceInfo and returns
+        the log for that stick.
+        '''
+        drivers = []
+        for info in DriverFactory.enumerate():
+            log = log_factory(info) if log_factory else None
+            drivers.append(USB2Driver(info, log=log, debug=debug))
+
+        return DriverPool(drivers)
+
+
+class DriverPool():
+    '''A set of drivers opened and closed together. '''
+    def __init__(self, drivers):
+        self.drivers = list(drivers)
+
+    def __iter__(self):
+        return iter(self.drivers)
+
+    def __len__(self):
+        return len(self.drivers)
+
+    def __getitem__(self, index):
+        return self.drivers[index]
+
+    def _parallel(self, method):
+        errors = []
+
+        def run(driver):
+            try:
+                method(driver)
+            except antex.DriverError as ex:
+                errors.append((driver, ex))
+
+        threads = [threading.Thread(target=run, args=(driver,))
+                   for driver in self.drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return errors
+
+    def open(self):
+        ''' Open every driver in parallel, all or none. '''
+        errors = self._parallel(Driver.open)
+        if errors:
+            self._parallel(lambda driver: driver.isOpen() and driver.close())
+            raise antex.DriverError('Could not open pool (%s).' % '; '.join(
+                f'{driver.device}: {ex}' for driver, ex in errors))
+
+    def close(self):
+        ''' Close every open driver in parallel. '''
+        errors = self._parallel(lambda driver: driver.isOpen() and driver.close())
+        if errors:
+            raise antex.DriverError('Could not close pool (%s).' % '; '.join(
+                f'{driver.device}: {ex}' for driver, ex in errors))
@@ -28,37 +28,121 @@
 # don't-fix-it-if-it-ain't-broken kind of threaded code ahead.
 #
 
+import threading
 import time
 import _thread
 
+import ant.core.constants as msgtypes
 import ant.core.message as antmsg
 import ant.core.exceptions as antex
 
 MAX_ACK_QUEUE = 25
 MAX_MSG_QUEUE = 25
+# Bytes asked of the driver per read: a full USB packet, so bursts are not
+# held up by reads returning a frame and a half at a time
+READ_SIZE = 64
 
+# Backoff between reconnect attempts after the device is lost (seconds)
+RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 5.0
 
-def ProcessBuffer(buffer_):
+
+def _Resync(buffer_):
+    index = buffer_.find(bytes([msgtypes.MESSAGE_TX_SYNC]), 1)
+    if index < 0:
+        return b''
+    return buffer_[index:]
+
+
+def ProcessBuffer(buffer_, stats=None, hook=None):
     messages = []
 
-    while True:
+    while buffer_:
         hf = antmsg.Message()
         try:
             msg = hf.getHandler(buffer_)
             buffer_ = buffer_[len(msg.getPayload()) + 4:]
             messages.append(msg)
+            if hook is not None:
+                # Here rather than afterwards, so records keep stream order
+                hook.logReadFrame(msg)
         except antex.MessageError as ex:
-            if ex.internal == "CHECKSUM":
-                buffer_ = buffer_[buffer_[1] + 4:]
-            else:
-                # any error not related to checksum we should exit
-                # could be incomplete message that has not yet been
-                # fully received
+            if ex.internal == "INCOMPLETE":
+                # message has not yet been fully received
                 break
 
+            if ex.internal == "UNKNOWN":
+                # well formed, we just don't know what it is
+                skipped = len(hf.getPayload()) + 4
+                if hook is not None:
+                    hook.logParseError('unknown', buffer_[:skipped])
+                buffer_ = buffer_[skipped:]
+            else:
+                # bad sync, length or checksum: bytes were dropped or
+                # corrupted, so skip ahead to the next sync byte
+                resynced = _Resync(buffer_)
+                skipped = len(buffer_) - len(resynced)
+                if hook is not None:
+                    hook.logResync(ex.internal.lower() or 'error',
+                                   buffer_[:skipped])
+                buffer_ = resynced
+
+            if stats is not None:
+                key = ex.internal.lower() or 'error'
+                stats[key] = stats.get(key, 0) + 1
+                stats['discarded'] = stats.get('discarded', 0) + skipped
+
+    if stats is not None:
+        stats['frames'] = stats.get('frames', 0) + len(messages)
+
     return (buffer_, messages,)
 
 
+def Reconnect(evm):
+    lost = time.monotonic()
+    evm.addMetrics({'disconnects': 1})
+
+    delay = RECONNECT_DELAY
+    while True:
+        evm.running_lock.acquire()
+        running = evm.running
+        evm.running_lock.release()
+        if not running:
+            return False
+
+        try:
+            evm.driver.reconnect()
+            break
+        except antex.DriverError:
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    reconnected = time.monotonic()
+    evm.addMetrics({'reconnects': 1}, last_outage=reconnected - lost)
+    evm.ack_lock.acquire()
+    evm.ack = []
+    evm.ack_lock.release()
+    evm.msg_lock.acquire()
+    evm.msg = []
+    evm.msg_lock.release()
+
+    # Replaying state needs this thread pumping the replies
+    _thread.start_new_thread(Recover, (evm, reconnected,))
+    return True
+
+
+def Recover(evm, reconnected):
+    try:
+        if evm.recovery_handler is not None:
+            evm.recovery_handler()
+    except antex.ANTException:
+        evm.addMetrics({'recovery_failures': 1})
+        return
+
+    evm.addMetrics({'recoveries': 1},
+                   last_recovery=time.monotonic() - reconnected)
+
+
 def EventPump(evm):
     evm.pump_lock.acquire()
     evm.pump = True
@@ -72,22 +156,34 @@ def EventPump(evm):
             go = False
         evm.running_lock.release()
 
-        buffer_ += evm.driver.read(20)
+        try:
+            data = evm.driver.read(READ_SIZE)
+        except antex.DeviceLostError:
+            buffer_ = b''
+            go = Reconnect(evm)
+            continue
+
+        stats = {'reads': 1, 'bytes': len(data)}
+        buffer_ += data
         if len(buffer_) == 0:
+            evm.addMetrics(stats)
             continue
 
-        buffer_, messages = ProcessBuffer(buffer_)
+        hook = evm.driver.getFrameHook()
+        buffer_, messages = ProcessBuffer(buffer_, stats, hook)
+        evm.addMetrics(stats)
 
+        # Callbacks run without the lock, they may block or (un)register
         evm.callbacks_lock.acquire()
+        callbacks = list(evm.callbacks)
+        evm.callbacks_lock.release()
         for message in messages:
-            for callback in evm.callbacks:
+            for callback in callbacks:
                 try:
                     callback.process(message)
                 except antex.CallbackError:
                     pass
 
-        evm.callbacks_lock.release()
-
         time.sleep(0.002)
 
     evm.pump_lock.acquire()
@@ -126,7 +222,8 @@ class MsgCallback(EventCallback):
 
 
 class EventMachine():
-    callbacks_lock = _thread.allocate_lock()
+    # Reentrant: a Channel collected while it is held removes itself
+    callbacks_lock = threading.RLock()
     running_lock = _thread.allocate_lock()
     pump_lock = _thread.allocate_lock()
     ack_lock = _thread.allocate_lock()
@@ -139,9 +236,36 @@ class EventMachine():
         self.pump = False
         self.ack = []
         self.msg = []
+        self.recovery_handler = None
+        self.metrics = {'reads': 0, 'bytes': 0, 'frames': 0,
+                        'disconnects': 0, 'reconnects': 0, 'recoveries': 0,
+                        'recovery_failures': 0, 'last_outage': None,
+                        'last_recovery': None}
+        self.metrics_lock = threading.Lock()
         self.registerCallback(AckCallback(self))
         self.registerCallback(MsgCallback(self))
 
+    def setRecoveryHandler(self, handler):
+        '''Sets the function called, off the pump thread, after the driver
+        reconnected. How long the device was gone is reported as
+        metrics['last_outage'] and how long the handler took, from the
+        reconnect on, as metrics['last_recovery']. '''
+        self.recovery_handler = handler
+
+    def getMetrics(self):
+        self.metrics_lock.acquire()
+        metrics = dict(self.metrics)
+        self.metrics_lock.release()
+        return metrics
+
+    def addMetrics(self, counts, **values):
+        '''Adds counts to the metrics and sets values, from any thread. '''
+        self.metrics_lock.acquire()
+        for key, count in counts.items():
+            self.metrics[key] = self.metrics.get(key, 0) + count
+        self.metrics.update(values)
+        self.metrics_lock.release()
+
     def registerCallback(self, callback):
         self.callbacks_lock.acquire()
         if callback not in self.callbacks:
@@ -154,19 +278,28 @@ class EventMachine():
             self.callbacks.remove(callback)
         self.callbacks_lock.release()
 
-    def waitForAck(self, msg):
+    def waitForAck(self, msg, timeout=None, number=None):
+        '''Returns the response code to msg, None after timeout seconds.
+        With number only a response on that channel (or network) counts. '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
         while True:
             self.ack_lock.acquire()
             for emsg in self.ack:
                 if msg.getType() != emsg.getMessageID():
                     continue
+                if number is not None and emsg.getChannelNumber() != number:
+                    continue
                 self.ack.remove(emsg)
                 self.ack_lock.release()
                 return emsg.getMessageCode()
             self.ack_lock.release()
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
             time.sleep(0.002)
 
-    def waitForMessage(self, class_):
+    def waitForMessage(self, class_, timeout=None):
+        '''Returns the next message of class_, or None after timeout seconds. '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
         while True:
             self.msg_lock.acquire()
             for emsg in self.msg:
@@ -176,8 +309,16 @@ class EventMachine():
                 self.msg_lock.release()
                 return emsg
             self.msg_lock.release()
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
             time.sleep(0.002)
 
+    def clearMessages(self, class_):
+        '''Drops the queued messages of class_. '''
+        self.msg_lock.acquire()
+        self.msg = [emsg for emsg in self.msg if not isinstance(emsg, class_)]
+        self.msg_lock.release()
+
     def start(self, driver=None):
         self.running_lock.acquire()
 
@@ -32,6 +32,10 @@ class DriverError(ANTException):
     pass
 
 
+class DeviceLostError(DriverError):
+    pass
+
+
 class CallbackError(Exception):
     pass
 
@@ -48,3 +52,11 @@ class NodeError(ANTException):
 
 class ChannelError(ANTException):
     pass
+
+
+class TransferError(ChannelError):
+    pass
+
+
+class BurstError(TransferError):
+    pass
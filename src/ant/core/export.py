@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''Columnar export of logs to NumPy .npz files.
+
+Frames are written in row groups of ROW_GROUP rows, each group stored as
+one array per column named <column>_<group>, e.g. timestamp_000003.
+Groups are written to the archive as they fill up, so memory use does not
+depend on the size of the log. Requires numpy.
+
+Columns:
+    timestamp       float64, seconds since the epoch
+    direction       uint8, DIRECTION_IN or DIRECTION_OUT
+    type            uint8, message type
+    channel         int16, -1 for messages not tied to a channel
+    length          uint8, payload length
+    payload         uint8 (rows x 9), zero padded
+    device_number   uint16 \\
+    device_type     uint8   > of the channel's device, 0 while unknown
+    trans_type      uint8  /
+'''
+
+import zipfile
+
+import numpy
+
+import ant.core.decode as antdec
+import ant.core.log as antlog
+
+ROW_GROUP = 65536
+MAX_PAYLOAD = 9
+
+COLUMNS = (
+    ('timestamp', numpy.float64),
+    ('direction', numpy.uint8),
+    ('type', numpy.uint8),
+    ('channel', numpy.int16),
+    ('length', numpy.uint8),
+    ('payload', numpy.uint8),
+    ('device_number', numpy.uint16),
+    ('device_type', numpy.uint8),
+    ('trans_type', numpy.uint8),
+)
+
+
+class NpzWriter():
+    '''Writes frames to a .npz archive one row group at a time. '''
+    def __init__(self, filename, row_group=ROW_GROUP):
+        self.filename = filename
+        self.row_group = row_group
+        self.groups = 0
+        self.rows = 0
+        self.devices = antlog.DeviceTracker()
+        self.zip = zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED,
+                                   allowZip64=True)
+        self._clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _clear(self):
+        self._columns = {name: [] for name, _ in COLUMNS}
+
+    def write(self, frame):
+        timestamp, direction, type_, payload = frame
+        channel = antlog.FrameChannel(frame)
+        device = self.devices.process(frame) or (0, 0, 0,)
+
+        columns = self._columns
+        columns['timestamp'].append(timestamp)
+        columns['direction'].append(direction)
+        columns['type'].append(type_)
+        columns['channel'].append(-1 if channel is None else channel)
+        columns['length'].append(len(payload))
+        columns['payload'].append(payload.ljust(MAX_PAYLOAD, b'\x00'))
+        columns['device_number'].append(device[0])
+        columns['device_type'].append(device[1])
+        columns['trans_type'].append(device[2])
+
+        if len(columns['timestamp']) >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        '''Writes out the rows collected so far as a row group. '''
+        rows = len(self._columns['timestamp'])
+        if rows == 0:
+            return
+
+        for name, dtype in COLUMNS:
+            if name == 'payload':
+                array = numpy.frombuffer(b''.join(self._columns[name]),
+                                         dtype=dtype).reshape(rows, MAX_PAYLOAD)
+            else:
+                array = numpy.array(self._columns[name], dtype=dtype)
+            with self.zip.open('%s_%06d.npy' % (name, self.groups), 'w',
+                               force_zip64=True) as fd:
+                numpy.lib.format.write_array(fd, array, allow_pickle=False)
+
+        self.groups += 1
+        self.rows += rows
+        self._clear()
+
+    def close(self):
+        if self.zip is not None:
+            self.flush()
+            self.zip.close()
+            self.zip = None
+
+
+def ExportNpz(filename, output, row_group=ROW_GROUP):
+    '''Exports the frames of a log, or of a rotated log series, to output.
+
+    Returns the number of rows written.
+    '''
+    with antlog.OpenLog(filename) as reader, NpzWriter(output, row_group) as writer:
+        for frame in antdec.Frames(reader):
+            writer.write(frame)
+    return writer.rows
+
+
+def LoadGroups(filename, columns=None):
+    '''Yields the row groups of an exported archive as dicts of arrays. '''
+    columns = columns or [name for name, _ in COLUMNS]
+    with numpy.load(filename) as archive:
+        group = 0
+        while '%s_%06d' % (columns[0], group) in archive:
+            yield {name: archive['%s_%06d' % (name, group)] for name in columns}
+            group += 1
+
+
+def LoadNpz(filename, columns=None):
+    '''Loads whole columns of an exported archive. '''
+    groups = list(LoadGroups(filename, columns))
+    if not groups:
+        return {name: numpy.zeros((0, MAX_PAYLOAD) if name == 'payload' else 0,
+                                  dtype=dtype)
+                for name, dtype in COLUMNS if columns is None or name in columns}
+    return {name: numpy.concatenate([group[name] for group in groups])
+            for name in groups[0]}
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''Bulk loading of logs into a SQLite database for ad-hoc analysis.
+
+Frames are decoded into the frames table:
+
+    frames(source, timestamp, direction, type, channel, device_number,
+           device_type, trans_type, payload)
+
+with indexes on timestamp, (channel, type) and the device ID. The sources
+table remembers how far each log file was loaded, so loading a rotated
+series again only reads new segments and the new end of a growing one.
+'''
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+import ant.core.decode as antdec
+import ant.core.log as antlog
+
+# Rows inserted per executemany() call
+BATCH_ROWS = 50000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    events INTEGER NOT NULL,
+    buffer BLOB NOT NULL,
+    devices TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    source INTEGER NOT NULL REFERENCES sources (id),
+    timestamp REAL NOT NULL,
+    direction INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    channel INTEGER,
+    device_number INTEGER,
+    device_type INTEGER,
+    trans_type INTEGER,
+    payload BLOB NOT NULL
+);
+'''
+
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp);
+CREATE INDEX IF NOT EXISTS frames_channel_type ON frames (channel, type);
+CREATE INDEX IF NOT EXISTS frames_device
+    ON frames (device_number, device_type, trans_type);
+'''
+INDEX_NAMES = ('frames_timestamp', 'frames_channel_type', 'frames_device',)
+
+# Page cache size, negative meaning KiB
+CACHE_SIZE = -65536
+
+
+class Database():
+    '''A SQLite database of decoded frames. '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('PRAGMA cache_size = %d' % CACHE_SIZE)
+        self.connection.executescript(SCHEMA + INDEXES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def _getSource(self, filename):
+        return self.execute('SELECT id, size, events, buffer, devices FROM sources '
+                            'WHERE filename = ?', (filename,)).fetchone()
+
+    def ingest(self, filename):
+        '''Loads a log, or every segment of a rotated series, returning the
+        number of frames added.
+
+        Loading into an empty table builds the indexes afterwards, which is
+        much faster than maintaining them row by row, and skips syncing,
+        since a load cut short can simply be started over.
+        '''
+        bulk = self.execute('SELECT 1 FROM frames LIMIT 1').fetchone() is None
+        if bulk:
+            for name in INDEX_NAMES:
+                self.execute('DROP INDEX IF EXISTS %s' % name)
+            self.execute('PRAGMA synchronous = OFF')
+
+        try:
+            segments = antlog.ListSegments(filename)
+            if os.path.exists(filename) or not segments:
+                return self.ingestFile(filename)
+
+            rows = 0
+            state = None
+            for _, segment in segments:
+                rows += self.ingestFile(segment, state)
+                source = self._getSource(os.path.abspath(segment))
+                state = (source[3], source[4],) if source else None
+            return rows
+        finally:
+            if bulk:
+                self.connection.executescript(INDEXES)
+                self.execute('PRAGMA synchronous = NORMAL')
+
+    def ingestFile(self, filename, state=None):
+        '''Loads what was not loaded yet of one log file.
+
+        state is the (buffer, devices) a previous segment ended with, as
+        stored in the sources table.
+        '''
+        filename = os.path.abspath(filename)
+        size = os.path.getsize(filename)
+        source = self._getSource(filename)
+        if source is not None:
+            source_id, loaded_size, events, buffer_, devices = source
+            if loaded_size == size:
+                return 0
+        else:
+            source_id = None
+            events = 0
+            buffer_, devices = state if state is not None else (b'', '{}',)
+
+        decoder = antdec.Decoder(buffer_)
+        tracker = antlog.DeviceTracker()
+        tracker.devices = {int(channel): tuple(device)
+                           for channel, device in json.loads(devices).items()}
+
+        rows = 0
+        batch = []
+        insert = 'INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+        with self.connection, antlog.LogReader(filename) as reader:
+            if source_id is None:
+                source_id = self.execute(
+                    'INSERT INTO sources (filename, size, events, buffer, devices) '
+                    'VALUES (?, 0, 0, ?, ?)', (filename, buffer_, devices,)).lastrowid
+            if events:
+                reader.seek(events)
+
+            for event in reader:
+                for frame in decoder.process(event):
+                    device = tracker.process(frame) or (None, None, None,)
+                    batch.append((source_id, frame[0], frame[1], frame[2],
+                                  antlog.FrameChannel(frame)) + device +
+                                 (frame[3],))
+                if len(batch) >= BATCH_ROWS:
+                    self.connection.executemany(insert, batch)
+                    rows += len(batch)
+                    batch = []
+
+            self.connection.executemany(insert, batch)
+            rows += len(batch)
+            self.execute('UPDATE sources SET size = ?, events = ?, buffer = ?, '
+                         'devices = ? WHERE id = ?',
+                         (size, reader.event_number, decoder.buffer,
+                          json.dumps(tracker.devices), source_id,))
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='ant-log-ingest', description='Load ANT logs into a SQLite database.')
+    parser.add_argument('database', help='SQLite database, created if missing')
+    parser.add_argument('logs', nargs='+',
+                        help='log files, or names of rotated log series')
+    args = parser.parse_args(argv)
+
+    with Database(args.database) as database:
+        for filename in args.logs:
+            try:
+                rows = database.ingest(filename)
+            except (IOError, OSError) as ex:
+                parser.exit(1, 'ant-log-ingest: %s\n' % ex)
+            print('%s: %d frames' % (filename, rows))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,93 +23,1068 @@
 #
 ##############################################################################
 
+import bisect
+import collections
+import glob
+import heapq
+import lzma
+import os
+import re
+import queue
+import struct
+import threading
 import time
+import zlib
 import datetime
 import msgpack
 
+import ant.core.constants as msgtypes
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+
 EVENT_OPEN = 0x01
 EVENT_CLOSE = 0x02
 EVENT_READ = 0x03
 EVENT_WRITE = 0x04
 
+# Frame-level events, written instead of raw reads and writes by logs
+# opened with frames=True. Frames are stored as
+# [direction, type, channel, payload], channel being None for messages not
+# tied to a channel. Parse errors and resyncs are stored as [reason, bytes]
+# with the lowercased MessageError tag as reason.
+EVENT_FRAME = 0x05
+EVENT_PARSE_ERROR = 0x06
+EVENT_RESYNC = 0x07
+DIRECTION_IN = 0x00
+DIRECTION_OUT = 0x01
+
+# Log format versions. Version 1 stores whole seconds of wall-clock time,
+# version 2 nanoseconds of both wall-clock and monotonic time, optionally
+# as deltas from the previous event (FLAG_DELTA).
+LOG_VERSION_1 = 0x01
+LOG_VERSION_2 = 0x02
+FLAG_DELTA = 0x01
+
+# Version 2 logs may group events into independently compressed blocks,
+# each stored as [count, first wall_ns, last wall_ns, compressed events].
+# Delta encoding restarts at every block.
+FLAG_ZLIB = 0x02
+FLAG_LZMA = 0x04
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_LZMA = 'lzma'
+BLOCK_EVENTS = 4096
+
+# Bytes pulled from the file at a time while reading
+READ_SIZE = 65536
+
+# Background writer: what to do with events when the queue is full
+OVERFLOW_DROP = 'drop'
+OVERFLOW_BLOCK = 'block'
+
+# Background writer: when to fsync the log
+FSYNC_NEVER = 'never'
+FSYNC_FLUSH = 'flush'
+FSYNC_CLOSE = 'close'
+
+# Most events the background writer packs before writing them out
+WRITE_BATCH = 1024
+# Queued to make the background writer write out everything it has
+FLUSH = []
+
+# Digits of the segment number in rotated log file names
+SEGMENT_DIGITS = 6
+
+# Frames of these types seen by several sticks within DUPLICATE_WINDOW
+# seconds are taken as sightings of the same device transmission
+DUPLICATE_TYPES = (msgtypes.MESSAGE_CHANNEL_BROADCAST_DATA,
+                   msgtypes.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                   msgtypes.MESSAGE_CHANNEL_BURST_DATA,)
+DUPLICATE_WINDOW = 0.05
+
+# Default spacing of time index entries
+INDEX_EVENTS = 1000
+INDEX_SECONDS = 60
+
+
+def _Compress(compression, data):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data)
+    return lzma.compress(data)
+
+
+def _Decompress(compression, data):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    return lzma.decompress(data)
+
+
+def FrameRecord(direction, msg):
+    '''The data of the EVENT_FRAME record for a message. '''
+    channel = None
+    if isinstance(msg, antmsg.ChannelMessage):
+        channel = msg.getChannelNumber()
+        if msg.getType() == msgtypes.MESSAGE_CHANNEL_BURST_DATA:
+            channel &= 0x1F  # upper bits are the burst sequence number
+    return [direction, msg.getType(), channel, msg.getPayload()]
+
+
+def _ChannelTypes():
+    types = set()
+    for type_ in range(0x100):
+        try:
+            msg = antmsg.Message(type_, b'\x00').getHandler()
+        except antex.MessageError:
+            continue
+        if isinstance(msg, antmsg.ChannelMessage):
+            types.add(type_)
+    return frozenset(types)
+
+
+# Message types whose first payload byte is a channel number
+CHANNEL_TYPES = _ChannelTypes()
+
+
+def FrameChannel(frame):
+    '''Channel number of a frame, None if it is not a channel message. '''
+    if frame[2] not in CHANNEL_TYPES or not frame[3]:
+        return None
+    if frame[2] == msgtypes.MESSAGE_CHANNEL_BURST_DATA:
+        return frame[3][0] & 0x1F  # upper bits are the burst sequence number
+    return frame[3][0]
+
+
+class DeviceTracker():
+    '''Follows which device each channel talks to from channel ID frames.
+
+    Received channel IDs are what the channel paired with, sent ones count
+    unless they are wildcards.
+    '''
+    def __init__(self):
+        self.devices = {}
+
+    def process(self, frame):
+        '''Returns (device number, device type, transmission type) of the
+        frame's channel, or None if it is not known yet. '''
+        channel = FrameChannel(frame)
+        if channel is None:
+            return None
+
+        if frame[2] == msgtypes.MESSAGE_CHANNEL_ID and len(frame[3]) == 5:
+            device = struct.unpack('<HBB', frame[3][1:5])
+            if frame[1] == DIRECTION_IN or device[0] != 0:
+                self.devices[channel] = device
+        return self.devices.get(channel)
+
+
+def ReadFrames(reader):
+    '''Yields (timestamp, direction, message) for every frame in a log. '''
+    for event in reader:
+        if event[0] != EVENT_FRAME:
+            continue
+        direction, type_, _, payload = event[2]
+        try:
+            msg = antmsg.Message(type_, payload).getHandler()
+        except antex.MessageError:
+            msg = antmsg.Message(type_, payload)
+        yield (event[1], direction, msg,)
+
+
+def SegmentFilename(filename, number):
+    '''Name of segment number of a rotated log, e.g. capture.000003.ant. '''
+    root, ext = os.path.splitext(filename)
+    return '%s.%0*d%s' % (root, SEGMENT_DIGITS, number, ext)
+
+
+def ListSegments(filename):
+    '''Returns (number, filename) of every segment of a rotated log, in order. '''
+    root, ext = os.path.splitext(filename)
+    pattern = re.compile(re.escape(root) + r'\.(\d{%d,})' % SEGMENT_DIGITS +
+                         re.escape(ext) + '$')
+
+    segments = []
+    for name in glob.glob(glob.escape(root) + '.*' + glob.escape(ext)):
+        match = pattern.match(name)
+        if match:
+            segments.append((int(match.group(1)), name,))
+    return sorted(segments)
+
+
+class LogIndex():
+    '''Sidecar time index of a log file (<log>.idx).
+
+    Every `events` events or `seconds` seconds, whichever comes first, the
+    event number, timestamp and byte offset of an event are recorded so
+    readers can seek without scanning the log from the start.
+    '''
+    def __init__(self, filename, events=INDEX_EVENTS, seconds=INDEX_SECONDS):
+        self.filename = filename
+        self.events = events
+        self.seconds = seconds
+        self.entries = []
+        # Event numbers and timestamps of the entries, for bisect
+        self.numbers = []
+        self.timestamps = []
+        self.size = 0
+        self.fd = None
+        self.packer = msgpack.Packer()
+
+    @staticmethod
+    def getFilename(log_filename):
+        return log_filename + '.idx'
+
+    def load(self):
+        entries = []
+        with open(self.filename, 'rb') as fd:
+            unpacker = msgpack.Unpacker(fd, read_size=READ_SIZE)
+            try:
+                header = unpacker.unpack()
+            except msgpack.exceptions.UnpackException:
+                header = None
+            if header != [b'ANT-IDX', 0x01]:
+                raise IOError('Could not open index file (unknown format).')
+
+            # A partially written trailing entry is simply not returned
+            self.size = unpacker.tell()
+            for entry in unpacker:
+                entries.append(tuple(entry))
+                self.size = unpacker.tell()
+        self.entries = entries
+        self.numbers = [entry[0] for entry in entries]
+        self.timestamps = [entry[1] for entry in entries]
+        return self
+
+    def create(self):
+        self.close()
+        self.entries = []
+        self.numbers = []
+        self.timestamps = []
+        self.fd = open(self.filename, 'wb')
+        self.fd.write(self.packer.pack([b'ANT-IDX', 0x01]))  # [MAGIC, VERSION]
+        self.size = self.fd.tell()
+
+    def close(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+    def update(self, number, timestamp, offset, state=()):
+        '''Records the event if enough events or time passed since the last entry.
+
+        state is whatever the reader needs to resume decoding at offset.
+        '''
+        if self.entries:
+            last_number, last_timestamp = self.entries[-1][0:2]
+            if number - last_number < self.events and \
+               timestamp - last_timestamp < self.seconds:
+                return
+
+        if self.fd is None:
+            # Resuming, drop whatever follows the last complete entry
+            self.fd = open(self.filename, 'r+b')
+            self.fd.truncate(self.size)
+            self.fd.seek(self.size)
+        entry = (number, timestamp, offset,) + tuple(state)
+        self.entries.append(entry)
+        self.numbers.append(number)
+        self.timestamps.append(timestamp)
+        self.fd.write(self.packer.pack(entry))
+
+    def findEvent(self, number):
+        '''Returns the last entry at or before the event number, if any. '''
+        index = bisect.bisect_right(self.numbers, number)
+        return self.entries[index - 1] if index else None
+
+    def findTime(self, timestamp):
+        '''Returns the last entry strictly before timestamp, if any. '''
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        return self.entries[index - 1] if index else None
+
+
+def BuildIndex(filename, events=INDEX_EVENTS, seconds=INDEX_SECONDS):
+    '''Builds the sidecar index of a log in one streaming pass.
+
+    An existing index is resumed from its last entry rather than rebuilt.
+    '''
+    index = LogIndex(LogIndex.getFilename(filename), events, seconds)
+    reader = LogReader(filename)
+
+    try:
+        index.load()
+    except (IOError, OSError):
+        index.create()
+
+    if reader.compression is not None:
+        # Blocks are the only places decoding can start from
+        if index.entries:
+            reader.seekEntry(index.entries[-1])
+            reader.skipBlock()      # Already indexed
+        block = reader.skipBlock()
+        while block is not None:
+            index.update(*block[0])
+            block = reader.skipBlock()
+        reader.close()
+        index.close()
+        return index
+
+    if index.entries:
+        reader.seekEntry(index.entries[-1])
+        reader.read()   # Already indexed
+
+    offset, state = reader.tell(), reader.getState()
+    event = reader.read()
+    while event is not None:
+        index.update(reader.event_number - 1, event[1], offset, state)
+        offset, state = reader.tell(), reader.getState()
+        event = reader.read()
+
+    reader.close()
+    index.close()
+    return index
+
 
 class LogReader():
-    '''Log Reader. '''
-    def __init__(self, filename):
+    '''Log Reader.
+
+    Events are streamed from the file READ_SIZE bytes at a time, so memory
+    use does not depend on the size of the log. Iterating over the reader
+    yields the remaining events.
+
+    seek() and seekTime() use the sidecar index (see LogIndex) when there is
+    one and fall back to scanning from the start otherwise.
+
+    Both log format versions are read. Events are returned as
+    [event, timestamp, data] (no data for open/close events), timestamp
+    being seconds since the epoch: an int for version 1 logs and a float for
+    version 2 logs, whose exact nanosecond wall-clock and monotonic times of
+    the last event read are also available as wall_ns and monotonic_ns.
+    With monotonic=True events are [event, timestamp, data, monotonic]
+    instead, data being None for open/close events and monotonic the
+    event's monotonic time in seconds (None for version 1 logs).
+    Compressed logs are detected from the header and decompressed one block
+    at a time.
+    '''
+    def __init__(self, filename, monotonic=False):
         self.is_open = False
+        self.monotonic = monotonic
         self.open(filename)
 
     def __del__(self):
         if self.is_open:
             self.fd.close()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        event = self.read()
+        while event is not None:
+            yield event
+            event = self.read()
+
     def open(self, filename):
         if self.is_open is True:
             self.close()
 
+        self.filename = filename
         self.fd = open(filename, 'rb')
         self.is_open = True
-        self.unpacker = msgpack.Unpacker()
-
-        self.unpacker.feed(self.fd.read())
-        self.fd.close()
+        self.index = None
+        self._openUnpacker(0)
 
-        header = self.unpacker.unpack()
-        if len(header) != 2 or header[0] != b'ANT-LOG' or header[1] != 0x01:
+        try:
+            header = self.unpacker.unpack()
+        except msgpack.exceptions.UnpackException:
+            header = None
+        self.compression = None
+        if header == [b'ANT-LOG', LOG_VERSION_1]:
+            self.version = LOG_VERSION_1
+            self.delta = False
+        elif isinstance(header, list) and len(header) == 3 and \
+                header[0:2] == [b'ANT-LOG', LOG_VERSION_2]:
+            self.version = LOG_VERSION_2
+            self.delta = bool(header[2] & FLAG_DELTA)
+            if header[2] & FLAG_ZLIB:
+                self.compression = COMPRESSION_ZLIB
+            elif header[2] & FLAG_LZMA:
+                self.compression = COMPRESSION_LZMA
+        else:
+            self.close()
             raise IOError('Could not open log file (unknown format).')
 
+        self.data_offset = self.tell()
+        self.event_number = 0
+        self.wall_ns = None
+        self.monotonic_ns = None
+        self._peek = None
+
+    def _openUnpacker(self, offset):
+        self.fd.seek(offset)
+        self.unpacker = msgpack.Unpacker(self.fd, read_size=READ_SIZE)
+        self._base = offset
+        self._block = None
+
+    def _nextBlock(self):
+        try:
+            return self.unpacker.unpack()
+        except msgpack.exceptions.UnpackException:
+            return None
+
+    def skipBlock(self):
+        '''Skips the next block of a compressed log without decompressing it.
+
+        Must be called at a block boundary. Returns (entry, count), entry
+        being the (number, timestamp, offset) of the block's first event as
+        seekEntry() takes it, or None at the end of the log.
+        '''
+        offset = self.tell()
+        block = self._nextBlock()
+        if block is None:
+            return None
+        entry = (self.event_number, block[1] / 1e9, offset,)
+        self.event_number += block[0]
+        return (entry, block[0],)
+
+    def _skipBlocks(self, event_number=None, timestamp=None):
+        '''Skips blocks ending before the target without decompressing them. '''
+        while True:
+            offset = self.tell()
+            block = self._nextBlock()
+            if block is None:
+                return
+            if (event_number is not None and
+                    self.event_number + block[0] <= event_number) or \
+               (timestamp is not None and block[2] / 1e9 < timestamp):
+                self.event_number += block[0]
+                continue
+            self._openUnpacker(offset)
+            return
+
+    def _nextRecord(self):
+        if self.compression is None:
+            try:
+                return self.unpacker.unpack()
+            except msgpack.exceptions.UnpackException:
+                return None
+
+        while True:
+            if self._block is not None:
+                try:
+                    return self._block.unpack()
+                except msgpack.exceptions.UnpackException:
+                    self._block = None
+
+            block = self._nextBlock()
+            if block is None:
+                return None
+            self._block = msgpack.Unpacker()
+            self._block.feed(_Decompress(self.compression, block[3]))
+            self.wall_ns = None
+            self.monotonic_ns = None
+
+    def _next(self):
+        record = self._nextRecord()
+        if record is None:
+            return None
+
+        if self.version == LOG_VERSION_1:
+            if self.monotonic:
+                return record + [None] * (4 - len(record))
+            return record
+
+        # [event, wall_ns, monotonic_ns, data]
+        wall_ns, monotonic_ns = record[1], record[2]
+        if self.delta and self.wall_ns is not None:
+            wall_ns += self.wall_ns
+            monotonic_ns += self.monotonic_ns
+        self.wall_ns = wall_ns
+        self.monotonic_ns = monotonic_ns
+
+        event = [record[0], wall_ns / 1e9]
+        if self.monotonic:
+            event.extend((record[3] if len(record) > 3 else None,
+                          monotonic_ns / 1e9,))
+        elif len(record) > 3:
+            event.append(record[3])
+        return event
+
     def close(self):
         if self.is_open:
             self.fd.close()
             self.is_open = False
 
     def read(self):
-        try:
-            return self.unpacker.unpack()
-        except msgpack.exceptions.UnpackException:
+        if not self.is_open:
             return None
 
+        if self._peek is not None:
+            event, self._peek = self._peek, None
+        else:
+            event = self._next()
+
+        if event is not None:
+            self.event_number += 1
+        return event
+
+    def peek(self):
+        '''Returns the event the next read() will, without consuming it. '''
+        if self._peek is None and self.is_open:
+            self._peek = self._next()
+        return self._peek
+
+    def tell(self):
+        '''Byte offset of the next event. '''
+        return self._base + self.unpacker.tell()
+
+    def getState(self):
+        '''Decoder state needed to resume reading at tell(). '''
+        if self.delta:
+            return (self.wall_ns, self.monotonic_ns,)
+        return ()
+
+    def getIndex(self):
+        '''Loads the sidecar index, if there is a usable one. '''
+        if self.index is None:
+            try:
+                self.index = LogIndex(LogIndex.getFilename(self.filename)).load()
+            except (IOError, OSError):
+                self.index = LogIndex(None)
+        return self.index
+
+    def seekEntry(self, entry=None):
+        '''Positions the reader at an index entry, or the first event. '''
+        if entry is None:
+            entry = (0, None, self.data_offset, None, None)
+        self._openUnpacker(entry[2])
+        self.event_number = entry[0]
+        if len(entry) > 3:
+            self.wall_ns, self.monotonic_ns = entry[3:5]
+        else:
+            self.wall_ns, self.monotonic_ns = None, None
+        self._peek = None
+
+    def seek(self, event_number):
+        '''Positions the reader so the next read returns event event_number. '''
+        self.seekEntry(self.getIndex().findEvent(event_number))
+        if self.compression is not None:
+            self._skipBlocks(event_number=event_number)
+        while self.event_number < event_number:
+            if self.read() is None:
+                break
+
+    def seekTime(self, timestamp):
+        '''Positions the reader at the first event logged at or after timestamp. '''
+        self.seekEntry(self.getIndex().findTime(timestamp))
+        if self.compression is not None:
+            self._skipBlocks(timestamp=timestamp)
+        event = self._next()
+        while event is not None and event[1] < timestamp:
+            self.event_number += 1
+            event = self._next()
+        self._peek = event
+
+
+class LogSeriesReader():
+    '''Reads the segments of a rotated log (see LogWriter) as one log.
+
+    filename is the name the series was written under. event_number counts
+    events across all segments still on disk. monotonic is passed on to
+    each segment's LogReader.
+    '''
+    def __init__(self, filename, monotonic=False):
+        self.filename = filename
+        self.monotonic = monotonic
+        self.segments = [name for _, name in ListSegments(filename)]
+        self.reader = None
+        self.is_open = True
+        self.seekSegment(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        event = self.read()
+        while event is not None:
+            yield event
+            event = self.read()
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.is_open = False
+
+    def seekSegment(self, segment, event_number=0):
+        '''Positions the reader at the start of a segment. '''
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.segment = segment
+        self.event_number = event_number
+        if segment < len(self.segments):
+            self.reader = LogReader(self.segments[segment], self.monotonic)
+
+    def read(self):
+        while self.reader is not None:
+            event = self.reader.read()
+            if event is not None:
+                self.event_number += 1
+                return event
+            self.seekSegment(self.segment + 1, self.event_number)
+        return None
+
+    def seek(self, event_number):
+        '''Positions the reader so the next read returns event event_number. '''
+        self.seekSegment(0)
+        while self.reader is not None:
+            self.reader.seek(event_number - self.event_number)
+            if self.reader.event_number == event_number - self.event_number:
+                self.event_number = event_number
+                return
+            self.seekSegment(self.segment + 1,
+                             self.event_number + self.reader.event_number)
+
+    def seekTime(self, timestamp):
+        '''Positions the reader at the first event logged at or after timestamp. '''
+        self.seek(0)
+        while self.reader is not None:
+            base = self.event_number
+            self.reader.seekTime(timestamp)
+            if self.reader.peek() is not None:
+                self.event_number = base + self.reader.event_number
+                return
+            self.seekSegment(self.segment + 1, base + self.reader.event_number)
+
+
+def OpenLog(filename, monotonic=False):
+    '''Opens a log, or the segments of a rotated log written as filename. '''
+    if not os.path.exists(filename) and ListSegments(filename):
+        return LogSeriesReader(filename, monotonic)
+    return LogReader(filename, monotonic)
+
+
+class DuplicateFilter():
+    '''Spots received data frames another source already reported.
+
+    Data is compared without the channel number, which is local to each
+    stick, but with the device each source's channel talks to (see
+    DeviceTracker), so identical data from different devices is kept.
+    Memory is bounded by the frames seen within window seconds.
+    '''
+    def __init__(self, window=DUPLICATE_WINDOW):
+        self.window = window
+        self.seen = {}
+        self.order = collections.deque()
+        self.devices = collections.defaultdict(DeviceTracker)
+
+    def isDuplicate(self, source, timestamp, direction, type_, payload):
+        '''Frames, channel IDs included, must be checked in timestamp order. '''
+        while self.order and timestamp - self.order[0][0] > self.window:
+            old_timestamp, key = self.order.popleft()
+            if self.seen.get(key, (None,))[0] == old_timestamp:
+                del self.seen[key]
+
+        device = self.devices[source].process((timestamp, direction, type_,
+                                               payload,))
+        if direction != DIRECTION_IN or type_ not in DUPLICATE_TYPES:
+            return False
+
+        key = (device, type_, payload[1:],)
+        last = self.seen.get(key)
+        if last is not None and last[1] != source:
+            return True
+        self.seen[key] = (timestamp, source,)
+        self.order.append((timestamp, key,))
+        return False
+
+
+def Tag(source, items, key):
+    '''Turns items into heap merge entries ordered by key, then source. '''
+    for number, item in enumerate(items):
+        yield (key(item), source, number, item,)
+
+
+def MergeReader(readers, duplicates=False, window=DUPLICATE_WINDOW):
+    '''Merges the events of several logs, e.g. one per stick, by timestamp.
+
+    Yields (source, event), source being the index of the event's reader.
+    Only the next event of each reader is held in memory. Events with equal
+    timestamps come in reader order. With duplicates=True, frame records
+    (see EVENT_FRAME) already reported by another reader within window
+    seconds are left out.
+    '''
+    duplicate_filter = DuplicateFilter(window) if duplicates else None
+    streams = [Tag(source, reader, lambda event: event[1])
+               for source, reader in enumerate(readers)]
+
+    for timestamp, source, _, event in heapq.merge(*streams):
+        if duplicate_filter is not None and event[0] == EVENT_FRAME and \
+           duplicate_filter.isDuplicate(source, timestamp, *event[2][0:2],
+                                        event[2][3]):
+            continue
+        yield (source, event,)
+
 
 class LogWriter():
-    '''Log Writer. '''
-    def __init__(self, filename=''):
+    '''Log Writer.
+
+    version selects the log format (LOG_VERSION_*). Version 2 logs store
+    nanosecond timestamps, as deltas from the previous event if delta=True.
+    They can also be compressed (COMPRESSION_ZLIB or COMPRESSION_LZMA) in
+    blocks of block_events events.
+
+    With index=True a sidecar time index (see LogIndex) is written alongside
+    the log, with an entry every index_events events or index_seconds seconds.
+
+    With background=True log calls only queue the event (up to max_queue of
+    them) and a writer thread packs and writes them in batches, flushing
+    every flush_interval seconds. overflow is OVERFLOW_DROP or
+    OVERFLOW_BLOCK and fsync one of the FSYNC_* policies. See getStats().
+
+    With max_bytes and/or max_seconds the log is rotated: filename only
+    names the series and events go to numbered segments (SegmentFilename),
+    each a complete log of its own. Numbering continues from segments
+    already on disk and only the newest `retention` segments are kept.
+    Read a series back with LogSeriesReader.
+
+    With frames=True raw reads are not logged. The event pump logs each
+    parsed message as an EVENT_FRAME record instead (see logFrame), along
+    with parse errors and resyncs, and writes are split into frames too.
+    Read them back with ReadFrames.
+
+    Log calls are safe from several threads, e.g. the event pump logging
+    frames while another thread writes to the driver.
+    '''
+    def __init__(self, filename='', index=False, index_events=INDEX_EVENTS,
+                 index_seconds=INDEX_SECONDS, background=False,
+                 max_queue=65536, flush_interval=1.0, overflow=OVERFLOW_DROP,
+                 fsync=FSYNC_NEVER, version=LOG_VERSION_1, delta=False,
+                 compression=None, block_events=BLOCK_EVENTS, max_bytes=None,
+                 max_seconds=None, retention=None, frames=False):
         self.packer = msgpack.Packer()
         self.is_open = False
-        self.open(filename)
+        if version not in (LOG_VERSION_1, LOG_VERSION_2):
+            raise ValueError('Could not create log writer (unknown version).')
+        if compression not in (None, COMPRESSION_ZLIB, COMPRESSION_LZMA):
+            raise ValueError('Could not create log writer (unknown compression).')
+        if compression is not None and version != LOG_VERSION_2:
+            raise ValueError('Could not create log writer '
+                             '(compression needs version 2).')
+        self.compression = compression
+        self.block_events = block_events
+        self.version = version
+        self.delta = delta and version == LOG_VERSION_2
+        self.index = None
+        self.index_events = index_events
+        self.index_seconds = index_seconds
+        self.background = background
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.retention = retention
+        self.frames = frames
+        self.queued = 0
+        self.dropped = 0
+        # First error of the writer thread, raised by flush() or close()
+        self._error = None
+        # Serialises writes made without the background thread, and the
+        # queued/dropped counts with it
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        # Closes rotated out segments of synchronous writers
+        self._retiring = None
+        self.open(filename, index)
 
     def __del__(self):
         if self.is_open:
-            self.fd.close()
+            self.close()
 
-    def open(self, filename=''):
+    def open(self, filename='', index=False):
         if filename == '':
             filename = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.ant'
-        self.filename = filename
 
         if self.is_open is True:
             self.close()
+        self.base_filename = filename
+        self.use_index = index
+        self.events = 0
 
-        self.fd = open(filename, 'wb')
+        if self.max_bytes or self.max_seconds:
+            segments = ListSegments(filename)
+            self.segment = segments[-1][0] + 1 if segments else 0
+            self._openFile(SegmentFilename(filename, self.segment))
+        else:
+            self.segment = None
+            self._openFile(filename)
         self.is_open = True
+
+        if self.background:
+            self._queue = queue.Queue(self.max_queue)
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='ant-log-writer')
+            self._thread.start()
+
+    def _openFile(self, filename):
+        self.filename = filename
+        self.fd = open(filename, 'wb')
         self.packer = msgpack.Packer()
+        self.opened = time.monotonic()
+        self._segment_events = 0
+        self._wall_ns = None
+        self._monotonic_ns = None
+        self._block = []
+        self._block_size = 0
+        self._block_first = None
 
-        header = [b'ANT-LOG', 0x01]  # [MAGIC, VERSION]
+        if self.version == LOG_VERSION_1:
+            header = [b'ANT-LOG', LOG_VERSION_1]  # [MAGIC, VERSION]
+        else:
+            flags = FLAG_DELTA if self.delta else 0
+            if self.compression == COMPRESSION_ZLIB:
+                flags |= FLAG_ZLIB
+            elif self.compression == COMPRESSION_LZMA:
+                flags |= FLAG_LZMA
+            header = [b'ANT-LOG', LOG_VERSION_2, flags]  # [MAGIC, VERSION, FLAGS]
         self.fd.write(self.packer.pack(header))
 
+        if self.use_index:
+            self.index = LogIndex(LogIndex.getFilename(filename),
+                                  self.index_events, self.index_seconds)
+            self.index.create()
+
+    def _closeFile(self):
+        self._writeBlock()
+        self._finishFile(self.fd, self.index)
+        self.index = None
+
+    def _finishFile(self, fd, index):
+        fd.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(fd.fileno())
+        fd.close()
+        if index is not None:
+            index.close()
+
+    def _rotate(self):
+        self._writeBlock()
+        fd, index = self.fd, self.index
+        self.index = None
+        self.segment += 1
+        self._openFile(SegmentFilename(self.base_filename, self.segment))
+
+        if self._thread is not None:
+            self._retire(fd, index, self.segment)
+        else:
+            # Keep closing and fsyncing off the caller's path, which is
+            # often the driver's I/O with its lock held
+            self._retiring = threading.Thread(
+                target=self._retire, daemon=True, name='ant-log-rotate',
+                args=(fd, index, self.segment, self._retiring))
+            self._retiring.start()
+
+    def _retire(self, fd, index, segment, previous=None):
+        '''Closes a rotated out segment and removes those past retention. '''
+        if previous is not None:
+            previous.join()
+        try:
+            self._finishFile(fd, index)
+            if self.retention:
+                for number, name in ListSegments(self.base_filename):
+                    if number > segment - self.retention:
+                        break
+                    os.remove(name)
+                    if os.path.exists(LogIndex.getFilename(name)):
+                        os.remove(LogIndex.getFilename(name))
+        except Exception as ex:  # raised by flush() or close()
+            self._error = self._error or ex
+
+    def _joinRetiring(self):
+        if self._retiring is not None:
+            self._retiring.join()
+            self._retiring = None
+
     def close(self):
-        if self.is_open:
-            self.fd.close()
-            self.is_open = False
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self.is_open:
+                self.is_open = False
+                self._closeFile()
+        self._joinRetiring()
+        self._raiseError()
 
-    def _logEvent(self, event, data=None):
-        ev = [event, int(time.time()), data]
+    def flush(self):
+        '''Blocks until every event logged so far is written to the file. '''
+        if self._thread is not None:
+            self._queue.put(FLUSH)
+            self._queue.join()
+            self._raiseError()
+        else:
+            with self._lock:
+                self._writeBlock()
+                self._flush()
+            self._joinRetiring()
+            self._raiseError()
+
+    def getStats(self):
+        '''Events queued (accepted), written to the file and dropped. '''
+        return {'queued': self.queued,
+                'written': self.events,
+                'dropped': self.dropped,
+                'pending': self._queue.qsize() if self._queue else 0}
+
+    def _flush(self):
+        self.fd.flush()
+        if self.fsync == FSYNC_FLUSH:
+            os.fsync(self.fd.fileno())
+
+    def _run(self):
+        running = True
+        last_flush = time.monotonic()
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and batch[-1] is not None and len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch and batch[-1] is None:
+                running = False
+            try:
+                for ev in batch:
+                    try:
+                        if ev is FLUSH:
+                            self._writeBlock()
+                            self._flush()
+                        elif ev is not None:
+                            self._writeEvent(ev)
+                    except Exception as ex:  # e.g. disk full, keep draining
+                        self._error = self._error or ex
+
+                now = time.monotonic()
+                if not running or now - last_flush >= self.flush_interval:
+                    try:
+                        self._flush()
+                    except Exception as ex:
+                        self._error = self._error or ex
+                    last_flush = now
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _raiseError(self):
+        '''Re-raises the first error the writer thread ran into. '''
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _writeBlock(self):
+        if not self._block:
+            return
+
+        data = _Compress(self.compression, b''.join(self._block))
+        self.fd.write(self.packer.pack([len(self._block), self._block_first,
+                                        self._wall_ns, data]))
+        self._block = []
+        self._block_size = 0
+
+    def _writeEvent(self, ev):
+        # The pending block counts uncompressed, so it never overshoots
+        if self.segment is not None and self._segment_events and \
+           (self.max_bytes and
+                self.fd.tell() + self._block_size >= self.max_bytes or
+                self.max_seconds and
+                time.monotonic() - self.opened >= self.max_seconds):
+            self._rotate()
+
+        state = ()
+        timestamp = ev[1]
+        if self.version == LOG_VERSION_2:
+            state = (self._wall_ns, self._monotonic_ns,) if self.delta else ()
+            timestamp = ev[1] / 1e9
+
+        if self.compression is not None:
+            self._writeCompressedEvent(ev, timestamp)
+            return
+
+        if self.index is not None:
+            self.index.update(self._segment_events, timestamp, self.fd.tell(), state)
+
+        if self.delta:
+            wall_ns, monotonic_ns = ev[1], ev[2]
+            if self._wall_ns is not None:
+                ev[1] -= self._wall_ns
+                ev[2] -= self._monotonic_ns
+            self._wall_ns, self._monotonic_ns = wall_ns, monotonic_ns
+
+        self.fd.write(self.packer.pack(ev))
+        self.events += 1
+        self._segment_events += 1
+
+    def _writeCompressedEvent(self, ev, timestamp):
+        wall_ns, monotonic_ns = ev[1], ev[2]
+        if not self._block:
+            # Blocks decode independently, so they are where readers seek to
+            if self.index is not None:
+                self.index.update(self._segment_events, timestamp, self.fd.tell())
+            self._block_first = wall_ns
+        elif self.delta:
+            ev[1] -= self._wall_ns
+            ev[2] -= self._monotonic_ns
+        self._wall_ns, self._monotonic_ns = wall_ns, monotonic_ns
+
+        self._block.append(self.packer.pack(ev))
+        self._block_size += len(self._block[-1])
+        self.events += 1
+        self._segment_events += 1
+        if len(self._block) >= self.block_events:
+            self._writeBlock()
+
+    def _newEvent(self, event, data):
+        if self.version == LOG_VERSION_1:
+            ev = [event, int(time.time()), data]
+        else:
+            ev = [event, time.time_ns(), time.monotonic_ns(), data]
 
         if data is None:
             ev = ev[0:-1]
-        elif len(data) == 0:
+        return ev
+
+    def _logEvent(self, event, data=None):
+        if data is not None and len(data) == 0:
             return
 
-        self.fd.write(self.packer.pack(ev))
+        if self._thread is None:
+            # Timestamped under the lock so deltas never go backwards
+            with self._lock:
+                self._writeEvent(self._newEvent(event, data))
+                self.queued += 1
+            return
+
+        ev = self._newEvent(event, data)
+        try:
+            self._queue.put(ev, block=self.overflow == OVERFLOW_BLOCK)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.queued += 1
 
     def logOpen(self):
         self._logEvent(EVENT_OPEN)
@@ -118,7 +1093,36 @@ class LogWriter():
         self._logEvent(EVENT_CLOSE)
 
     def logRead(self, data):
-        self._logEvent(EVENT_READ, data)
+        if not self.frames:
+            self._logEvent(EVENT_READ, data)
 
     def logWrite(self, data):
-        self._logEvent(EVENT_WRITE, data)
+        if not self.frames:
+            self._logEvent(EVENT_WRITE, data)
+            return
+
+        # Writes are whole encoded messages
+        while data:
+            msg = antmsg.Message()
+            try:
+                data = data[msg.decode(data):]
+            except antex.MessageError as ex:
+                self._logEvent(EVENT_PARSE_ERROR, [ex.internal.lower(), data])
+                return
+            try:
+                msg = msg.getHandler()
+            except antex.MessageError:
+                pass
+            self._logEvent(EVENT_FRAME, FrameRecord(DIRECTION_OUT, msg))
+
+    def logFrame(self, direction, msg):
+        self._logEvent(EVENT_FRAME, FrameRecord(direction, msg))
+
+    def logReadFrame(self, msg):
+        self.logFrame(DIRECTION_IN, msg)
+
+    def logParseError(self, reason, data):
+        self._logEvent(EVENT_PARSE_ERROR, [reason, data])
+
+    def logResync(self, reason, data):
+        self._logEvent(EVENT_RESYNC, [reason, data])
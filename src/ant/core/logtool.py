@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+'''ant-log: query ANT logs from the command line.
+
+Frames are streamed from the log, so memory use does not depend on its
+size, and a time index is used to start at --start when there is one.
+'''
+
+import argparse
+import datetime
+import json
+import sys
+
+import ant.core.decode as antdec
+import ant.core.exceptions as antex
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+FORMAT_HEX = 'hex'
+FORMAT_DECODED = 'decoded'
+FORMAT_JSONL = 'jsonl'
+
+# Silence on a channel longer than this is reported as a gap (seconds)
+GAP_SECONDS = 2.0
+
+# How far before --start reading begins, so the frame completed by the
+# first read event shown has the earlier bytes it started with (seconds)
+SEEK_MARGIN = 1.0
+
+DIRECTIONS = {'in': antlog.DIRECTION_IN, 'out': antlog.DIRECTION_OUT}
+DIRECTION_NAMES = {value: key for key, value in DIRECTIONS.items()}
+
+
+def ParseTime(value):
+    '''Seconds since the epoch, or an ISO 8601 date and time. '''
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid time: %r' % value)
+
+
+def ParseInt(value):
+    '''Decimal or 0x-prefixed hexadecimal. '''
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid number: %r' % value)
+
+
+class FrameFilter():
+    '''Selects frames by time range, direction, type and channel. '''
+    def __init__(self, start=None, end=None, direction=None, types=None,
+                 channels=None):
+        self.start = start
+        self.end = end
+        self.direction = direction
+        self.types = set(types) if types else None
+        self.channels = set(channels) if channels else None
+
+    def match(self, frame):
+        if self.start is not None and frame[0] < self.start:
+            return False
+        if self.end is not None and frame[0] >= self.end:
+            return False
+        if self.direction is not None and frame[1] != self.direction:
+            return False
+        if self.types is not None and frame[2] not in self.types:
+            return False
+        if self.channels is not None and antlog.FrameChannel(frame) not in self.channels:
+            return False
+        return True
+
+
+class Summary():
+    '''Frame counts per type and channel, parse errors and channel gaps. '''
+    def __init__(self, gap=GAP_SECONDS):
+        self.gap = gap
+        self.frames = 0
+        self.types = {}
+        self.channels = {}
+        self.errors = {}
+        self.first = None
+        self.last = None
+        self.gaps = {}
+        self._last_seen = {}
+
+    def process(self, frame):
+        timestamp, _, type_, _ = frame
+        channel = antlog.FrameChannel(frame)
+
+        self.frames += 1
+        self.types[type_] = self.types.get(type_, 0) + 1
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+
+        if channel is None:
+            return
+        self.channels[channel] = self.channels.get(channel, 0) + 1
+        last_seen = self._last_seen.get(channel)
+        if last_seen is not None and timestamp - last_seen > self.gap:
+            count, longest = self.gaps.get(channel, (0, 0.0,))
+            self.gaps[channel] = (count + 1, max(longest, timestamp - last_seen),)
+        self._last_seen[channel] = timestamp
+
+    def format(self):
+        lines = ['frames:    %d' % self.frames]
+        if self.first is not None:
+            lines.append('time:      %s - %s (%.1f s)' % (
+                FormatTime(self.first), FormatTime(self.last),
+                self.last - self.first))
+
+        lines.append('per type:')
+        for type_, count in sorted(self.types.items()):
+            lines.append('  0x%02X %-32s %d' % (type_, TypeName(type_), count))
+        lines.append('per channel:')
+        for channel, count in sorted(self.channels.items()):
+            gaps, longest = self.gaps.get(channel, (0, 0.0,))
+            lines.append('  %-3d %10d frames, %d gaps over %.1f s (longest %.1f s)' %
+                         (channel, count, gaps, self.gap, longest))
+
+        lines.append('parse errors:')
+        for key in ('checksum', 'sync', 'length', 'unknown', 'discarded'):
+            lines.append('  %-10s %d' % (key, self.errors.get(key, 0)))
+        return '\n'.join(lines)
+
+
+def FormatTime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(
+        sep=' ', timespec='microseconds')
+
+
+def Decode(frame):
+    '''The typed message of a frame, or a plain Message if the type is unknown. '''
+    try:
+        return antmsg.Message(frame[2], frame[3]).getHandler()
+    except antex.MessageError:
+        return antmsg.Message(frame[2], frame[3])
+
+
+_TYPE_NAMES = {}
+
+
+def TypeName(type_):
+    if type_ not in _TYPE_NAMES:
+        name = type(Decode((None, None, type_, b'\x00',))).__name__
+        _TYPE_NAMES[type_] = name if name != 'Message' else 'unknown'
+    return _TYPE_NAMES[type_]
+
+
+def Describe(msg):
+    '''Decoded fields of the messages worth decoding. '''
+    if isinstance(msg, antmsg.ChannelEventMessage):
+        return 'id=0x%02X code=0x%02X' % (msg.getMessageID(), msg.getMessageCode())
+    if isinstance(msg, antmsg.ChannelIDMessage):
+        return 'device=%d type=%d trans=%d' % (msg.getDeviceNumber(),
+                                               msg.getDeviceType(),
+                                               msg.getTransmissionType())
+    data = msg.getPayload()
+    if isinstance(msg, antmsg.ChannelMessage):
+        data = data[1:]
+    return data.hex(' ').upper()
+
+
+def FormatFrame(frame, format_):
+    timestamp, direction, type_, payload = frame
+    channel = antlog.FrameChannel(frame)
+
+    if format_ == FORMAT_JSONL:
+        return json.dumps({'timestamp': timestamp,
+                           'direction': DIRECTION_NAMES[direction],
+                           'type': type_, 'name': TypeName(type_),
+                           'channel': channel, 'payload': payload.hex()})
+
+    prefix = '%s %-3s' % (FormatTime(timestamp), DIRECTION_NAMES[direction].upper())
+    if format_ == FORMAT_HEX:
+        return '%s %s' % (prefix, antmsg.Message(type_, payload).encode().hex(' ').upper())
+
+    msg = Decode(frame)
+    return '%s %-32s %-3s %s' % (prefix, type(msg).__name__,
+                                 '' if channel is None else channel, Describe(msg))
+
+
+def Query(filename, frame_filter, format_=FORMAT_DECODED, output=sys.stdout,
+          summary=None):
+    '''Writes the frames of a log that pass frame_filter to output.
+
+    If format_ is None frames are only counted into summary.
+    '''
+    stats = summary.errors if summary is not None else None
+    with antlog.OpenLog(filename) as reader:
+        if frame_filter.start is not None:
+            reader.seekTime(frame_filter.start - SEEK_MARGIN)
+        decoder = antdec.Decoder(stats=stats)
+
+        for event in reader:
+            if frame_filter.end is not None and event[1] >= frame_filter.end:
+                break
+            for frame in decoder.process(event):
+                if not frame_filter.match(frame):
+                    continue
+                if summary is not None:
+                    summary.process(frame)
+                if format_ is not None:
+                    output.write(FormatFrame(frame, format_) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ant-log', description=__doc__.split('\n')[0])
+    parser.add_argument('filename', help='log file, or name of a rotated log series')
+    parser.add_argument('--start', type=ParseTime,
+                        help='first time to show (epoch seconds or ISO 8601)')
+    parser.add_argument('--end', type=ParseTime, help='time to stop at')
+    parser.add_argument('--direction', choices=sorted(DIRECTIONS))
+    parser.add_argument('--type', type=ParseInt, action='append', dest='types',
+                        help='message type, may be repeated')
+    parser.add_argument('--channel', type=ParseInt, action='append', dest='channels',
+                        help='channel number, may be repeated')
+    parser.add_argument('--format', default=FORMAT_DECODED,
+                        choices=[FORMAT_HEX, FORMAT_DECODED, FORMAT_JSONL])
+    parser.add_argument('--summary', action='store_true',
+                        help='print statistics after the frames')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='print statistics only')
+    parser.add_argument('--gap', type=float, default=GAP_SECONDS,
+                        help='channel silence reported as a gap (seconds)')
+    args = parser.parse_args(argv)
+
+    frame_filter = FrameFilter(args.start, args.end, DIRECTIONS.get(args.direction),
+                               args.types, args.channels)
+    summary = Summary(args.gap) if args.summary or args.summary_only else None
+    format_ = None if args.summary_only else args.format
+
+    try:
+        Query(args.filename, frame_filter, format_, sys.stdout, summary)
+    except BrokenPipeError:
+        return 0
+    except (IOError, OSError) as ex:
+        parser.exit(1, 'ant-log: %s\n' % ex)
+
+    if summary is not None:
+        print(summary.format())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -90,16 +90,20 @@ class Message():
     def decode(self, raw):
         '''Decodes a raw sequence of bytes into an ANT message. '''
         if len(raw) < 5:
-            raise antex.MessageError('Could not decode (message is incomplete).')
+            raise antex.MessageError('Could not decode (message is incomplete).',
+                                     internal='INCOMPLETE')
 
         sync, length, type_ = struct.unpack('BBB', raw[:3])
 
         if sync != msgtypes.MESSAGE_TX_SYNC:
-            raise antex.MessageError('Could not decode (expected TX sync).')
+            raise antex.MessageError('Could not decode (expected TX sync).',
+                                     internal='SYNC')
         if length > 9:
-            raise antex.MessageError('Could not decode (payload too long).')
+            raise antex.MessageError('Could not decode (payload too long).',
+                                     internal='LENGTH')
         if len(raw) < (length + 4):
-            raise antex.MessageError('Could not decode (message is incomplete).')
+            raise antex.MessageError('Could not decode (message is incomplete).',
+                                     internal='INCOMPLETE')
 
         self.setType(type_)
         self.setPayload(raw[3:length + 3])
@@ -162,7 +166,8 @@ class Message():
             msg = SerialNumberMessage()
         else:
             raise antex.MessageError('Could not find message handler '
-                                     f'(unknown message type - {self.type_}).')
+                                     f'(unknown message type - {self.type_}).',
+                                     internal='UNKNOWN')
 
         msg.setPayload(self.getPayload())
         return msg
@@ -399,6 +404,18 @@ class ChannelBurstDataMessage(ChannelMessage):
         ChannelMessage.__init__(self, type_=msgtypes.MESSAGE_CHANNEL_BURST_DATA,
                                 payload=data, number=number)
 
+    def getSequenceNumber(self):
+        '''Returns the sequence number kept in the upper bits of the channel
+        number, 0x04 flags the last packet of a burst. '''
+        return ord(self.payload[0]) >> 5
+
+    def setSequenceNumber(self, sequence):
+        if (sequence > 0x07) or (sequence < 0x00):
+            raise antex.MessageError('Could not set sequence number '
+                                     '(out of range).')
+
+        self.payload[0] = bytes([(ord(self.payload[0]) & 0x1F) | (sequence << 5)])
+
 
 # Channel event messages
 class ChannelEventMessage(ChannelMessage):
@@ -448,6 +465,17 @@ class ChannelStatusMessage(ChannelMessage):
 
         self.payload[1] = bytes([status])
 
+    def getChannelState(self):
+        '''One of the CHANNEL_STATE_* constants. '''
+        return self.getStatus() & 0x03
+
+    def getNetworkNumber(self):
+        return (self.getStatus() >> 2) & 0x03
+
+    def getChannelType(self):
+        '''One of the CHANNEL_TYPE_* constants. '''
+        return self.getStatus() & 0xF0
+
 
 class VersionMessage(Message):
     ''' Requested Response: ANT Version (0x3E) '''
@@ -26,18 +26,45 @@
 """Node Module
 """
 
+import asyncio
+import collections
+import collections.abc
+import json
+import os
+import struct
+import tempfile
+import threading
 import time
 import uuid
 import _thread
 
+import ant.core.burst as antburst
 import ant.core.constants as msgtypes
 import ant.core.exceptions as antex
 import ant.core.message as antmsg
 import ant.core.event as antevt
+import ant.core.transmit as anttx
+
+# How long a reset waits for the stick's startup message (seconds)
+RESET_TIMEOUT = 1.0
+# How long a reset takes on sticks that don't send it (seconds)
+RESET_DELAY = 1.0
+# How long to wait for the answer to a request message (seconds)
+REQUEST_TIMEOUT = 1.0
+
+# Channel streams: messages buffered per stream and what to do when full.
+# OVERFLOW_BLOCK holds up the event pump until the consumer catches up.
+STREAM_BUFFER = 1024
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_BLOCK = 'block'
+# How often a pump held up by a full stream checks the node is still running
+STREAM_POLL = 0.1
 
 
 class NetworkKey():
-    '''Network Key (ANT+ Doco) '''
+    '''Network Key (ANT+ Doco). A key of None is not known, e.g. after a
+    warm start, and is never sent to the stick. '''
     def __init__(self, name=None, key=b'\x00' * 8):
         self._key = key
         if name:
@@ -63,6 +90,340 @@ class NetworkKey():
         self._number = number
 
 
+class Capabilities():
+    '''What a stick supports, as reported in its capabilities message.
+
+    The CAPABILITIES_* option flags are checked against the byte they
+    belong to with hasStdOption, hasAdvOption and hasAdvOption2.
+    '''
+    FIELDS = ('max_channels', 'max_networks', 'std_options', 'adv_options',
+              'adv_options2',)
+
+    def __init__(self, max_channels=0, max_networks=0, std_options=0,
+                 adv_options=0, adv_options2=0):
+        self.max_channels = max_channels
+        self.max_networks = max_networks
+        self.std_options = std_options
+        self.adv_options = adv_options
+        self.adv_options2 = adv_options2
+
+    @classmethod
+    def fromMessage(cls, msg):
+        return cls(msg.getMaxChannels(), msg.getMaxNetworks(),
+                   msg.getStdOptions(), msg.getAdvOptions(),
+                   msg.getAdvOptions2())
+
+    def hasStdOption(self, flag):
+        return bool(self.std_options & flag)
+
+    def hasAdvOption(self, flag):
+        return bool(self.adv_options & flag)
+
+    def hasAdvOption2(self, flag):
+        return bool(self.adv_options2 & flag)
+
+    def __eq__(self, other):
+        return isinstance(other, Capabilities) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return '<Capabilities %s>' % ' '.join(
+            '%s=%d' % (field, getattr(self, field)) for field in self.FIELDS)
+
+
+class StickInfo():
+    '''Capabilities, firmware version and serial number of a stick.
+
+    version and serial_number are None until they were requested.
+    '''
+    def __init__(self, capabilities, version=None, serial_number=None):
+        self.capabilities = capabilities
+        self.version = version
+        self.serial_number = serial_number
+
+    def toDict(self):
+        info = {field: getattr(self.capabilities, field)
+                for field in Capabilities.FIELDS}
+        info['version'] = self.version
+        info['serial_number'] = self.serial_number
+        return info
+
+    @classmethod
+    def fromDict(cls, info):
+        capabilities = Capabilities(*[info[field] for field in Capabilities.FIELDS])
+        return cls(capabilities, info['version'], info['serial_number'])
+
+    def __eq__(self, other):
+        return isinstance(other, StickInfo) and self.toDict() == other.toDict()
+
+    def __repr__(self):
+        return '<StickInfo version=%s serial_number=%s %r>' % (
+            self.version, self.serial_number, self.capabilities)
+
+
+def _DefaultCacheFilename():
+    cache = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'python-ant', 'sticks.json')
+
+
+class StickCache():
+    '''StickInfo of each stick seen, in a JSON file keyed by
+    Driver.getIdentity(). Defaults to python-ant/sticks.json in the user's
+    cache directory. '''
+    def __init__(self, filename=None):
+        self.filename = filename or _DefaultCacheFilename()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.filename) as fd:
+                    self._entries = json.load(fd)
+            except (IOError, OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(self.filename) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, filename = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file_:
+            json.dump(self._entries, file_, indent=1, sort_keys=True)
+        os.replace(filename, self.filename)
+
+    def get(self, key):
+        info = self._load().get(key)
+        try:
+            return StickInfo.fromDict(info) if info is not None else None
+        except (KeyError, TypeError):
+            return None
+
+    def put(self, key, info):
+        self._load()[key] = info.toDict()
+        self._save()
+
+    def invalidate(self, key=None):
+        '''Forgets one stick, or all of them. '''
+        entries = self._load()
+        if key is None:
+            entries.clear()
+        else:
+            entries.pop(key, None)
+        self._save()
+
+
+class ChannelConfig():
+    '''Everything a channel is configured with, see Channel.apply().
+
+    network is the name of a NetworkKey. Settings left as None are not sent
+    and stay at whatever the stick has.
+    '''
+    FIELDS = ('network', 'type_', 'device_type', 'device_number', 'trans_type',
+              'period', 'frequency', 'search_timeout', 'tx_power',)
+
+    def __init__(self, network, type_, device_type=0, device_number=0,
+                 trans_type=0, period=None, frequency=None, search_timeout=None,
+                 tx_power=None):
+        self.network = network
+        self.type_ = type_
+        self.device_type = device_type
+        self.device_number = device_number
+        self.trans_type = trans_type
+        self.period = period
+        self.frequency = frequency
+        self.search_timeout = search_timeout
+        self.tx_power = tx_power
+
+    def getSettings(self):
+        '''The config as Channel.settings would record it. '''
+        settings = {'assign': (self.network, self.type_,),
+                    'id': (self.device_type, self.device_number, self.trans_type,)}
+        for key in ('period', 'frequency', 'search_timeout', 'tx_power'):
+            if getattr(self, key) is not None:
+                settings[key] = getattr(self, key)
+        return settings
+
+    def __eq__(self, other):
+        return isinstance(other, ChannelConfig) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return '<ChannelConfig %s>' % ' '.join(
+            '%s=%r' % (field, getattr(self, field)) for field in self.FIELDS)
+
+
+class ChannelStream(antevt.EventCallback):
+    '''Data received on a channel, buffered for a consumer outside the
+    event pump. See Channel.stream().
+
+    Iterating blocks until data arrives and yields broadcast, acknowledged
+    and burst data messages, or lists of them when batching. `async for`
+    works the same way without blocking the event loop. Iteration ends once
+    the stream is closed and drained.
+    '''
+    TYPES = (antmsg.ChannelBroadcastDataMessage,
+             antmsg.ChannelAcknowledgedDataMessage,
+             antmsg.ChannelBurstDataMessage,)
+
+    def __init__(self, channel, max_size=STREAM_BUFFER,
+                 overflow=OVERFLOW_DROP_OLDEST, batch=None, batch_time=None):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST,
+                            OVERFLOW_BLOCK):
+            raise ValueError('Unknown overflow policy: %r' % overflow)
+        self.channel = channel
+        self.max_size = max_size
+        self.overflow = overflow
+        self.batch = batch
+        self.batch_time = batch_time
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        self._loop = None
+        self._event = None
+        channel.registerCallback(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def process(self, msg):
+        if not isinstance(msg, self.TYPES):
+            return
+
+        with self._cond:
+            self.received += 1
+            if len(self._buffer) >= self.max_size:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                else:
+                    evm = self.channel.node.evm
+                    while len(self._buffer) >= self.max_size and not self.closed:
+                        if not evm.running:
+                            # Stopping, the pump can't wait for the consumer
+                            self.dropped += 1
+                            return
+                        self._cond.wait(STREAM_POLL)
+            self._buffer.append(msg)
+            self._cond.notify_all()
+        self._wake()
+
+    def _wake(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass    # Loop closed since, nobody is waiting any more
+
+    def close(self):
+        # Releases a pump blocked on a full stream before detaching
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._wake()
+        self.channel.removeCallback(self)
+
+    def getStats(self):
+        with self._cond:
+            return {'received': self.received, 'delivered': self.delivered,
+                    'dropped': self.dropped, 'pending': len(self._buffer)}
+
+    def _take(self, count):
+        # Called with the lock held
+        items = [self._buffer.popleft()
+                 for _ in range(min(count, len(self._buffer)))]
+        self.delivered += len(items)
+        self._cond.notify_all()
+        return items
+
+    def get(self, timeout=None):
+        '''Returns the next message or batch, None on timeout or once the
+        stream is closed and drained. '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while not self._buffer:
+                if self.closed:
+                    return None
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            if self.batch is None:
+                return self._take(1)[0]
+
+            items = self._take(self.batch)
+            if self.batch_time is not None:
+                deadline = time.monotonic() + self.batch_time
+                while len(items) < self.batch and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if not self._buffer:
+                        self._cond.wait(remaining)
+                    items += self._take(self.batch - len(items))
+            return items
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.get()
+        if item is None:
+            raise StopIteration
+        return item
+
+    def __aiter__(self):
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        return self
+
+    async def _wait(self, timeout=None):
+        self._event.clear()
+        with self._cond:
+            if self._buffer or self.closed:
+                return
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def __anext__(self):
+        while True:
+            with self._cond:
+                if self._buffer:
+                    items = self._take(1 if self.batch is None else self.batch)
+                    break
+                if self.closed:
+                    raise StopAsyncIteration
+            await self._wait()
+
+        if self.batch is None:
+            return items[0]
+
+        if self.batch_time is not None:
+            deadline = time.monotonic() + self.batch_time
+            while len(items) < self.batch:
+                with self._cond:
+                    items += self._take(self.batch - len(items))
+                    if self.closed:
+                        break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or len(items) >= self.batch:
+                    break
+                await self._wait(remaining)
+        return items
+
+
 class Channel(antevt.EventCallback):
     '''A channel is used to connect two nodes together. '''
     cb_lock = _thread.allocate_lock()
@@ -70,9 +431,18 @@ class Channel(antevt.EventCallback):
     def __init__(self, node):
         self.node = node
         self.is_free = True
+        self.is_open = False
         self.name = str(uuid.uuid4())
         self.number = 0
         self.callback = []
+        # Last configuration acknowledged by the stick, replayed by restore()
+        self.settings = {}
+        # Config last apply()'d, re-applied by restore()
+        self.config = None
+        # Created by the first sendAcknowledged()
+        self.transmit = None
+        # Rebuilt by Node.attach() without a config, can't be restored
+        self.attached = False
         self.node.evm.registerCallback(self)
 
     def __del__(self):
@@ -86,6 +456,7 @@ class Channel(antevt.EventCallback):
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not assign channel.')
         self.is_free = False
+        self.settings = {'assign': (net_key, ch_type)}
 
     def setID(self, dev_type, dev_num, trans_type):
         msg = antmsg.ChannelIDMessage(number=self.number)
@@ -95,6 +466,7 @@ class Channel(antevt.EventCallback):
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not set channel ID.')
+        self.settings['id'] = (dev_type, dev_num, trans_type)
 
     def setSearchTimeout(self, timeout):
         msg = antmsg.ChannelSearchTimeoutMessage(number=self.number)
@@ -102,6 +474,7 @@ class Channel(antevt.EventCallback):
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not set channel search timeout.')
+        self.settings['search_timeout'] = timeout
 
     def setPeriod(self, counts):
         msg = antmsg.ChannelPeriodMessage(number=self.number)
@@ -109,6 +482,7 @@ class Channel(antevt.EventCallback):
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not set channel period.')
+        self.settings['period'] = counts
 
     def setFrequency(self, frequency):
         msg = antmsg.ChannelFrequencyMessage(number=self.number)
@@ -116,18 +490,83 @@ class Channel(antevt.EventCallback):
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not set channel frequency.')
+        self.settings['frequency'] = frequency
+
+    def setTXPower(self, power):
+        msg = antmsg.ChannelTXPowerMessage(number=self.number)
+        msg.setPower(power)
+        self.node.driver.write(msg.encode())
+        if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
+            raise antex.ChannelError('Could not set channel TX power.')
+        self.settings['tx_power'] = power
+
+    def apply(self, config):
+        '''Configures the channel as config says, sending only the settings
+        that differ from the ones last acknowledged, all in one transfer.
+
+        The config is kept and re-applied by restore() after the stick was
+        reset or reconnected. The channel is not opened.
+        '''
+        wanted = config.getSettings()
+        if self.settings.get('assign') != wanted['assign']:
+            if 'assign' in self.settings:
+                if self.is_open:
+                    self.close()
+                self.unassign()
+            self.assign(*wanted['assign'])
+
+        msgs = []
+        for key, value in wanted.items():
+            if key == 'assign' or self.settings.get(key) == value:
+                continue
+            if key == 'id':
+                msg = antmsg.ChannelIDMessage(number=self.number)
+                msg.setDeviceType(value[0])
+                msg.setDeviceNumber(value[1])
+                msg.setTransmissionType(value[2])
+            elif key == 'period':
+                msg = antmsg.ChannelPeriodMessage(number=self.number)
+                msg.setChannelPeriod(value)
+            elif key == 'frequency':
+                msg = antmsg.ChannelFrequencyMessage(number=self.number)
+                msg.setFrequency(value)
+            elif key == 'search_timeout':
+                msg = antmsg.ChannelSearchTimeoutMessage(number=self.number)
+                msg.setTimeout(value)
+            else:
+                msg = antmsg.ChannelTXPowerMessage(number=self.number)
+                msg.setPower(value)
+            msgs.append((key, value, msg,))
+
+        self.config = config
+        self.attached = False
+        if not msgs:
+            return
+
+        self.node.driver.write(b''.join(msg.encode() for _, _, msg in msgs))
+        failed = []
+        for key, value, msg in msgs:
+            if self.node.evm.waitForAck(msg) == msgtypes.RESPONSE_NO_ERROR:
+                self.settings[key] = value
+            else:
+                failed.append(key)
+        if failed:
+            raise antex.ChannelError('Could not configure channel (%s).' %
+                                     ', '.join(failed))
 
     def open(self):
         msg = antmsg.ChannelOpenMessage(number=self.number)
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not open channel.')
+        self.is_open = True
 
     def close(self):
         msg = antmsg.ChannelCloseMessage(number=self.number)
         self.node.driver.write(msg.encode())
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not close channel.')
+        self.is_open = False
 
         while True:
             msg = self.node.evm.waitForMessage(antmsg.ChannelEventMessage)
@@ -140,6 +579,38 @@ class Channel(antevt.EventCallback):
         if self.node.evm.waitForAck(msg) != msgtypes.RESPONSE_NO_ERROR:
             raise antex.ChannelError('Could not unassign channel.')
         self.is_free = True
+        self.settings = {}
+        self.config = None
+        self.attached = False
+
+    def restore(self):
+        '''Replays the config, or the recorded settings, on a stick that
+        lost them. '''
+        settings = self.settings
+        is_open = self.is_open
+        self.settings = {}
+        self.is_open = False
+
+        if self.config is not None:
+            self.apply(self.config)
+        elif 'assign' in settings:
+            self.assign(*settings['assign'])
+            if 'id' in settings:
+                self.setID(*settings['id'])
+            if 'search_timeout' in settings:
+                self.setSearchTimeout(settings['search_timeout'])
+            if 'period' in settings:
+                self.setPeriod(settings['period'])
+            if 'frequency' in settings:
+                self.setFrequency(settings['frequency'])
+            if 'tx_power' in settings:
+                self.setTXPower(settings['tx_power'])
+        else:
+            return
+        if is_open:
+            self.open()
+            if self.transmit is not None:
+                self.transmit.retransmit()
 
     def registerCallback(self, callback):
         self.cb_lock.acquire()
@@ -147,85 +618,350 @@ class Channel(antevt.EventCallback):
             self.callback.append(callback)
         self.cb_lock.release()
 
-    def process(self, msg):
+    def removeCallback(self, callback):
         self.cb_lock.acquire()
-        if isinstance(msg, antmsg.ChannelMessage) and \
-           msg.getChannelNumber() == self.number:
-            for callback in self.callback:
-                try:
-                    callback.process(msg)
-                except antex.CallbackError:
-                    pass  # Who cares?
+        if callback in self.callback:
+            self.callback.remove(callback)
         self.cb_lock.release()
 
+    def stream(self, max_size=STREAM_BUFFER, overflow=OVERFLOW_DROP_OLDEST,
+               batch=None, batch_time=None):
+        '''Returns a ChannelStream of the data received on this channel.
+
+        Up to max_size messages are buffered, overflow says what happens to
+        more. With batch the stream yields lists of up to batch messages;
+        with batch_time too, it waits up to batch_time seconds for a batch
+        to fill before yielding what there is.
+        '''
+        return ChannelStream(self, max_size, overflow, batch, batch_time)
+
+    def sendBurst(self, data, timeout=antburst.BURST_TIMEOUT):
+        '''Sends data as a burst transfer, raising BurstError unless the
+        stick reports it completed. Queued acknowledged data waits until
+        the burst is done. '''
+        transmit = self.transmit
+        if transmit is not None:
+            transmit.suspend(timeout)
+        try:
+            antburst.BurstSender(self).send(data, timeout)
+        finally:
+            if transmit is not None:
+                transmit.resume()
+
+    def sendAcknowledged(self, data, key=None):
+        '''Queues data to be sent as acknowledged data and returns a future
+        completing once the other end acknowledged it. Data queued with the
+        key of data still waiting replaces it. See TransmitQueue. '''
+        if self.transmit is None:
+            self.transmit = anttx.TransmitQueue(self)
+        return self.transmit.send(data, key)
+
+    def receiveBursts(self, size=antburst.BURST_BUFFER):
+        '''Returns a BurstReceiver reassembling the bursts received on this
+        channel, size is the number of bytes preallocated for one. '''
+        return antburst.BurstReceiver(self, size)
+
+    def process(self, msg):
+        # Upper bits of the channel number are the burst sequence number
+        if not isinstance(msg, antmsg.ChannelMessage) or \
+           msg.getChannelNumber() & 0x1F != self.number:
+            return
+        if isinstance(msg, antmsg.ChannelEventMessage) and \
+           msg.getMessageCode() == msgtypes.EVENT_CHANNEL_CLOSED:
+            self.is_open = False
+
+        # Callbacks run without the lock, they may block or (un)register
+        self.cb_lock.acquire()
+        try:
+            callbacks = list(self.callback)
+        finally:
+            self.cb_lock.release()
+        for callback in callbacks:
+            try:
+                callback.process(msg)
+            except antex.CallbackError:
+                pass  # Who cares?
+
+
+class ChannelList(collections.abc.Sequence):
+    '''The channels of a node, each created the first time it is used. '''
+    def __init__(self, node):
+        self.node = node
+
+    def __len__(self):
+        return self.node.max_channels
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('channel index out of range')
+        return self.node.getChannel(index)
+
 
 class Node(antevt.EventCallback):
     '''Represents a node in an ANT network. '''
     node_lock = _thread.allocate_lock()
 
-    def __init__(self, driver):
+    def __init__(self, driver, reset_timeout=RESET_TIMEOUT, cache=None):
+        '''cache, a StickCache, spares the capabilities request on start. '''
         self.driver = driver
+        self.reset_timeout = reset_timeout
+        self.cache = cache
+        self.info = None
+        # Whether the stick sends a startup message, None until a reset
+        self.startup_message = None
         self.evm = antevt.EventMachine(self.driver)
         self.evm.registerCallback(self)
+        self.evm.setRecoveryHandler(self.recover)
         self.networks = []
-        self.channels = []
+        # Created on demand by getChannel(), channels[i].number == i
+        self._channels = []
+        self.channels = ChannelList(self)
+        self.max_channels = 0
         self.running = False
         self.options = [0x00, 0x00, 0x00]
+        # Seconds spent in each phase of the last start()
+        self.timings = {}
+
+    def start(self, warm=False, networks=None, configs=None):
+        '''Starts the node, resetting the stick unless warm is True.
+
+        A warm start attaches to a stick left configured by a previous run:
+        network keys are assumed to be programmed already and channels are
+        rebuilt from what the stick reports, so paired channels keep
+        tracking. See attach().
 
-    def start(self):
+        Keys and configs can't be read back from the stick. For restore()
+        to program them again after a reset, pass networks, the NetworkKeys
+        the stick was programmed with by network number, and configs, the
+        ChannelConfig of each channel by channel number.
+        '''
         if self.running:
             raise antex.NodeError('Could not start ANT node (already started).')
 
+        self.timings = {}
+        start = time.monotonic()
         if not self.driver.isOpen():
             self.driver.open()
-
-        self.reset()
         self.evm.start()
+        self._phase('open', start)
+
+        if not warm:
+            start = time.monotonic()
+            self.reset()
+            self._phase('reset', start)
         self.running = True
-        self.init()
+        self.init(warm, networks, configs)
+
+    def _phase(self, name, start):
+        self.timings[name] = time.monotonic() - start
+
+    def getTimings(self):
+        '''Seconds spent opening the driver, resetting the stick, getting
+        capabilities, programming network keys and attaching channels
+        during the last start(). '''
+        return dict(self.timings)
 
     def stop(self, reset=True):
         if not self.running:
             raise antex.NodeError('Could not stop ANT node (not started).')
 
+        self.running = False
         if reset:
             self.reset()
         self.evm.stop()
-        self.running = False
         self.driver.close()
 
-    def reset(self):
+    def reset(self, restore=False):
+        '''Resets the stick, returning as soon as it reports it started up.
+
+        Sticks that never send the startup message get RESET_DELAY seconds
+        instead, as do resets while the event machine is not running. With
+        restore=True a running node then programs its network keys and
+        channels again, see restore().
+        '''
         msg = antmsg.SystemResetMessage()
-        self.driver.write(msg.encode())
-        time.sleep(1)
+        if not self.evm.running or self.startup_message is False:
+            self.driver.write(msg.encode())
+            time.sleep(RESET_DELAY)
+        else:
+            self.evm.clearMessages(antmsg.StartupMessage)
+            start = time.monotonic()
+            self.driver.write(msg.encode())
+            if self.evm.waitForMessage(antmsg.StartupMessage,
+                                       self.reset_timeout) is not None:
+                self.startup_message = True
+            else:
+                if self.startup_message is None:
+                    self.startup_message = False
+                time.sleep(max(0.0, RESET_DELAY - (time.monotonic() - start)))
+
+        if restore and self.running:
+            self.restore()
 
-    def init(self):
+    def init(self, warm=False, networks=None, configs=None):
         if not self.running:
             raise antex.NodeError('Could not reset ANT node (not started).')
 
-        msg = antmsg.ChannelRequestMessage()
-        msg.setMessageID(msgtypes.MESSAGE_CAPABILITIES)
+        start = time.monotonic()
+        info = None
+        if self.cache is not None:
+            key = self.driver.getIdentity()
+            info = self.cache.get(key)
+        if info is None:
+            msg = antmsg.ChannelRequestMessage()
+            msg.setMessageID(msgtypes.MESSAGE_CAPABILITIES)
+            self.driver.write(msg.encode())
+            caps = self.evm.waitForMessage(antmsg.CapabilitiesMessage)
+            info = StickInfo(Capabilities.fromMessage(caps))
+            if self.cache is not None:
+                self._requestVersion(info)
+                self.cache.put(key, info)
+        self.info = info
+        caps = info.capabilities
+        self.options = (caps.std_options,
+                        caps.adv_options,
+                        caps.adv_options2,)
+        self._phase('capabilities', start)
+
+        start = time.monotonic()
+        if warm:
+            # Already programmed, those not given are unknown
+            self.networks = list(networks or [])[:caps.max_networks]
+            self.networks += [NetworkKey(key=None) for _ in
+                              range(caps.max_networks - len(self.networks))]
+            for number, network in enumerate(self.networks):
+                network.number = number
+        else:
+            self.networks = [NetworkKey() for _ in range(caps.max_networks)]
+            self.setNetworkKeys()
+        self._phase('network_keys', start)
+
+        for channel in self._channels:
+            self.evm.removeCallback(channel)
+        self._channels = []
+        self.max_channels = caps.max_channels
+
+        if warm:
+            start = time.monotonic()
+            self.attach(configs)
+            self._phase('attach', start)
+
+    def request(self, number, message_id, class_, timeout=REQUEST_TIMEOUT):
+        '''Requests a message about channel number and waits for it. '''
+        self.evm.clearMessages(class_)
+        msg = antmsg.ChannelRequestMessage(number=number, message_id=message_id)
         self.driver.write(msg.encode())
 
-        caps = self.evm.waitForMessage(antmsg.CapabilitiesMessage)
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self.evm.waitForMessage(class_,
+                                            max(0.0, deadline - time.monotonic()))
+            if reply is None:
+                raise antex.NodeError('Could not get requested message '
+                                      '(timed out).')
+            if not isinstance(reply, antmsg.ChannelMessage) or \
+               reply.getChannelNumber() == number:
+                return reply
 
-        self.networks = []
-        for i in range(0, caps.getMaxNetworks()):
-            self.networks.append(NetworkKey())
-            self.setNetworkKey(i)
-        self.channels = []
-        for i in range(0, caps.getMaxChannels()):
-            self.channels.append(Channel(self))
-            self.channels[i].number = i
-        self.options = (caps.getStdOptions(),
-                        caps.getAdvOptions(),
-                        caps.getAdvOptions2(),)
+    def attach(self, configs=None):
+        '''Rebuilds channel state from the status and ID the stick reports
+        for each channel.
+
+        configs gives the ChannelConfig of channels by number, kept for
+        restore(). Other channels only get the settings that can be read
+        back, with the ID of the paired device rather than the one searched
+        for, and no period or frequency. restore() can't program those.
+        '''
+        configs = configs or {}
+        for number in range(self.max_channels):
+            status = self.request(number, msgtypes.MESSAGE_CHANNEL_STATUS,
+                                  antmsg.ChannelStatusMessage)
+            state = status.getChannelState()
+            if state == msgtypes.CHANNEL_STATE_UNASSIGNED:
+                continue
+
+            id_ = self.request(number, msgtypes.MESSAGE_CHANNEL_ID,
+                               antmsg.ChannelIDMessage)
+            channel = self.getChannel(number)
+            channel.is_free = False
+            channel.is_open = state in (msgtypes.CHANNEL_STATE_SEARCHING,
+                                        msgtypes.CHANNEL_STATE_TRACKING)
+            if number in configs:
+                channel.config = configs[number]
+                channel.settings = channel.config.getSettings()
+                continue
+            channel.attached = True
+            channel.settings = {
+                'assign': (self.networks[status.getNetworkNumber()].name,
+                           status.getChannelType(),),
+                'id': (id_.getDeviceType(), id_.getDeviceNumber(),
+                       id_.getTransmissionType(),),
+            }
+
+    def recover(self):
+        '''Re-applies network keys and channel configuration after the
+        stick was lost and reconnected. '''
+        if not self.running:
+            return
+
+        self.reset(restore=True)
+
+    def restore(self):
+        '''Programs network keys and channels again after a reset.
+
+        Unknown network keys are not sent, and channels on those networks
+        or attached without a config are not restored. A NodeError then
+        lists what was left out once everything else is restored.
+        '''
+        self.setNetworkKeys()
+        unknown = [network.name for network in self.networks
+                   if network.key is None]
+        skipped = []
+        for channel in self._channels:
+            network = channel.settings.get('assign', (None,))[0]
+            if channel.attached or network in unknown:
+                skipped.append(channel.number)
+            else:
+                channel.restore()
+        if skipped:
+            raise antex.NodeError('Could not restore channels %s (unknown '
+                                  'network key or config).' %
+                                  ', '.join(str(number) for number in skipped))
 
     def getCapabilities(self):
-        return (len(self.channels),
+        return (self.max_channels,
                 len(self.networks),
                 self.options,)
 
+    def _requestVersion(self, info):
+        msg = self.request(0, msgtypes.MESSAGE_VERSION, antmsg.VersionMessage)
+        info.version = msg.getVersion().rstrip(b'\x00').decode('ascii', 'replace')
+        if info.capabilities.hasAdvOption(msgtypes.CAPABILITIES_SERIAL_NUMBER_ENABLED):
+            msg = self.request(0, msgtypes.MESSAGE_SERIAL_NUMBER,
+                               antmsg.SerialNumberMessage)
+            info.serial_number = struct.unpack('<I', msg.getSerialNumber())[0]
+
+    def getStickInfo(self):
+        '''Capabilities, version and serial number of the stick, requested
+        once and kept in the cache if there is one. '''
+        if not self.running:
+            raise antex.NodeError('Could not get stick info (not started).')
+
+        if self.info.version is None:
+            self._requestVersion(self.info)
+            if self.cache is not None:
+                self.cache.put(self.driver.getIdentity(), self.info)
+        return self.info
+
+    def invalidateCache(self):
+        '''Forgets the cached info of this stick, e.g. after a firmware update. '''
+        if self.cache is not None:
+            self.cache.invalidate(self.driver.getIdentity())
+
     def setNetworkKey(self, number, key=None):
         if key:
             self.networks[number] = key
@@ -237,6 +973,33 @@ class Node(antevt.EventCallback):
         self.evm.waitForAck(msg)
         self.networks[number].number = number
 
+    def setNetworkKeys(self):
+        '''Programs every network key, sending them all before waiting for
+        the responses, and raises NodeError naming the networks the stick
+        did not accept a key for. '''
+        msgs = []
+        for number, network in enumerate(self.networks):
+            if network.key is None:
+                continue
+            msg = antmsg.NetworkKeyMessage()
+            msg.setNumber(number)
+            msg.setKey(network.key)
+            msgs.append((number, msg,))
+        if not msgs:
+            return
+
+        self.driver.write(b''.join(msg.encode() for _, msg in msgs))
+        failed = []
+        for number, msg in msgs:
+            if self.evm.waitForAck(msg, REQUEST_TIMEOUT, number) != \
+               msgtypes.RESPONSE_NO_ERROR:
+                failed.append(str(number))
+            else:
+                self.networks[number].number = number
+        if failed:
+            raise antex.NodeError('Could not set network keys (%s).' %
+                                  ', '.join(failed))
+
     def getNetworkKey(self, name):
         for netkey in self.networks:
             if netkey.name == name:
@@ -244,10 +1007,22 @@ class Node(antevt.EventCallback):
         raise antex.NodeError('Could not find network key with the '
                               'supplied name.')
 
+    def getChannel(self, number):
+        '''Returns channel number, creating it and those below it if needed. '''
+        if number >= self.max_channels:
+            raise antex.NodeError('Could not find channel (out of range).')
+        while len(self._channels) <= number:
+            channel = Channel(self)
+            channel.number = len(self._channels)
+            self._channels.append(channel)
+        return self._channels[number]
+
     def getFreeChannel(self):
-        for channel in self.channels:
+        for channel in self._channels:
             if channel.is_free:
                 return channel
+        if len(self._channels) < self.max_channels:
+            return self.getChannel(len(self._channels))
         raise antex.NodeError('Could not find free channel.')
 
     def registerEventListener(self, callback):
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""Simulated Driver
+
+Emulates the device side of the ANT serial protocol in-process so the
+Node -> Channel -> callback stack can be exercised without hardware.
+"""
+
+import random
+import struct
+import time
+
+import ant.core.constants as msgtypes
+import ant.core.driver as antdrv
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+
+# Channel periods are expressed in counts of a 32768 Hz clock
+CLOCK_RATE = 32768.0
+# Search timeouts are expressed in 2.5 second units
+SEARCH_TIMEOUT_UNIT = 2.5
+# Periods a lagging channel may catch up on in a single read
+MAX_CATCHUP = 64
+# Bytes held for the host before traffic is dropped
+MAX_OUTPUT_BUFFER = 65536
+
+STARTUP_POWER_ON_RESET = 0x00
+STARTUP_COMMAND_RESET = 0x20
+
+
+class VirtualDevice():
+    '''A simulated ANT master that channels of a SimulatedDriver can track. '''
+    def __init__(self, device_number, device_type, trans_type=0x01,
+                 period=None, ack_every=0, burst_every=0, burst_length=3,
+                 error_rate=0.0, data_source=None):
+        self.device_number = device_number
+        self.device_type = device_type
+        self.trans_type = trans_type
+        self.period = period
+        self.ack_every = ack_every
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.error_rate = error_rate
+        self.data_source = data_source
+
+    def matches(self, device_number, device_type, trans_type):
+        '''Checks a channel ID against this device (zero is a wildcard). '''
+        if device_number and device_number != self.device_number:
+            return False
+        if device_type and device_type != self.device_type:
+            return False
+        if trans_type and trans_type != self.trans_type:
+            return False
+        return True
+
+    def getData(self, counter):
+        '''Returns the 8 byte data page sent for the given message counter. '''
+        if self.data_source is not None:
+            return self.data_source(counter)
+
+        return struct.pack('<HBBI', self.device_number, self.device_type,
+                           self.trans_type, counter & 0xFFFFFFFF)
+
+
+class SimulatedChannel():
+    '''Device side state of a single channel. '''
+    def __init__(self, number):
+        self.number = number
+        self.reset()
+
+    def reset(self):
+        self.state = msgtypes.CHANNEL_STATE_UNASSIGNED
+        self.type_ = 0x00
+        self.network = 0x00
+        self.device_number = 0x0000
+        self.device_type = 0x00
+        self.trans_type = 0x00
+        self.period = 8192
+        self.timeout = 12
+        self.frequency = 66
+        self.power = msgtypes.RADIO_TX_POWER_0DB
+        self.device = None
+        self.counter = 0
+        self.next_due = 0.0
+        self.search_started = 0.0
+        self.pending = []
+        # Burst the host is sending and the ones it completed
+        self.burst = None
+        self.burst_sequence = 0
+        self.bursts = []
+
+    def isMaster(self):
+        return bool(self.type_ & 0x10)
+
+    def isOpen(self):
+        return self.state in (msgtypes.CHANNEL_STATE_SEARCHING,
+                              msgtypes.CHANNEL_STATE_TRACKING)
+
+    def getInterval(self):
+        period = self.period
+        if self.device is not None and self.device.period is not None:
+            period = self.device.period
+        return max(period, 1) / CLOCK_RATE
+
+    def getStatus(self):
+        return self.state | (self.network << 2) | (self.type_ & 0xF0)
+
+
+class SimulatedDriver(antdrv.Driver):
+    '''Driver answering the host like an ANT stick with virtual devices in range. '''
+    def __init__(self, device='SIM', max_channels=8, max_networks=8,
+                 devices=None, serial_number=b'\x01\x00\x00\x00',
+                 version=b'AJK3.04\x00\x00', tx_fail_rate=0.0, seed=None,
+                 startup_message=True, log=None, debug=False):
+        antdrv.Driver.__init__(self, device, log, debug)
+        self.startup_message = startup_message
+        self.max_channels = max_channels
+        self.max_networks = max_networks
+        self.devices = list(devices) if devices else []
+        self.serial_number = serial_number
+        self.version = version
+        self.tx_fail_rate = tx_fail_rate
+        self.random = random.Random(seed)
+        self.channels = [SimulatedChannel(i) for i in range(max_channels)]
+        self.network_keys = [b'\x00' * 8] * max_networks
+        self.counters = {'broadcast': 0, 'acknowledged': 0, 'burst': 0,
+                         'burst_tx': 0, 'rx_fail': 0, 'dropped': 0}
+        self.plugged = True
+        self._in = b''
+        self._out = bytearray()
+
+    def addDevice(self, device):
+        self.devices.append(device)
+
+    def unplug(self):
+        '''Simulates the stick being pulled out: I/O raises DeviceLostError. '''
+        self.plugged = False
+
+    def plug(self):
+        '''Simulates the stick being plugged back in with its state lost. '''
+        self._reset(STARTUP_POWER_ON_RESET)
+        self.plugged = True
+
+    def _open(self):
+        if not self.plugged:
+            raise antex.DriverError('Could not open device (not found)')
+        self._in = b''
+
+    def _close(self):
+        pass
+
+    def _read(self, count):
+        if not self.plugged:
+            raise antex.DeviceLostError('Could not read from device (unplugged)')
+
+        self._tick(time.monotonic())
+
+        data = bytes(self._out[:count])
+        del self._out[:count]
+        return data
+
+    def _write(self, data):
+        if not self.plugged:
+            raise antex.DeviceLostError('Could not write to device (unplugged)')
+
+        self._in, messages = antevt.ProcessBuffer(self._in + bytes(data))
+        for msg in messages:
+            self._handle(msg)
+
+        return len(data)
+
+    def _emit(self, msg):
+        if len(self._out) >= MAX_OUTPUT_BUFFER:
+            self.counters['dropped'] += 1
+            return
+        self._out += msg.encode()
+
+    def _respond(self, number, message_id, code=msgtypes.RESPONSE_NO_ERROR):
+        self._emit(antmsg.ChannelEventMessage(number=number,
+                                              message_id=message_id,
+                                              message_code=code))
+
+    def _event(self, number, code):
+        self._respond(number, 0x01, code)
+
+    def _reset(self, reason=STARTUP_COMMAND_RESET):
+        for channel in self.channels:
+            channel.reset()
+        self.network_keys = [b'\x00' * 8] * self.max_networks
+        self._out = bytearray()
+
+        if not self.startup_message:
+            return
+        msg = antmsg.StartupMessage()
+        msg.setPayload(bytes([reason]))
+        self._emit(msg)
+
+    def _handle(self, msg):
+        type_ = msg.getType()
+
+        if type_ == msgtypes.MESSAGE_SYSTEM_RESET:
+            self._reset()
+        elif type_ == msgtypes.MESSAGE_NETWORK_KEY:
+            number = msg.getNumber()
+            if number >= self.max_networks:
+                self._respond(number, type_, msgtypes.INVALID_NETWORK_NUMBER)
+            else:
+                self.network_keys[number] = msg.getKey()
+                self._respond(number, type_)
+        elif type_ == msgtypes.MESSAGE_TX_POWER:
+            self._respond(0, type_)
+        elif type_ == msgtypes.MESSAGE_CHANNEL_REQUEST:
+            self._handleRequest(msg)
+        elif isinstance(msg, antmsg.ChannelMessage):
+            number = msg.getChannelNumber() & 0x1F
+            if number >= self.max_channels:
+                self._respond(number, type_, msgtypes.INVALID_PARAMETER_PROVIDED)
+            else:
+                self._handleChannel(self.channels[number], msg)
+        else:
+            self._respond(0, type_, msgtypes.INVALID_MESSAGE)
+
+    def _handleRequest(self, msg):
+        number = msg.getChannelNumber()
+        message_id = msg.getMessageID()
+
+        if message_id == msgtypes.MESSAGE_CAPABILITIES:
+            self._emit(antmsg.CapabilitiesMessage(
+                max_channels=self.max_channels, max_nets=self.max_networks,
+                adv_opts=msgtypes.CAPABILITIES_NETWORK_ENABLED |
+                msgtypes.CAPABILITIES_SERIAL_NUMBER_ENABLED,
+                adv_opts2=msgtypes.CAPABILITIES_EXT_MESSAGE_ENABLED))
+        elif message_id == msgtypes.MESSAGE_VERSION:
+            self._emit(antmsg.VersionMessage(self.version))
+        elif message_id == msgtypes.MESSAGE_SERIAL_NUMBER:
+            self._emit(antmsg.SerialNumberMessage(self.serial_number))
+        elif message_id in (msgtypes.MESSAGE_CHANNEL_STATUS,
+                            msgtypes.MESSAGE_CHANNEL_ID) and \
+                number < self.max_channels:
+            channel = self.channels[number]
+            if message_id == msgtypes.MESSAGE_CHANNEL_STATUS:
+                self._emit(antmsg.ChannelStatusMessage(
+                    number=number, status=channel.getStatus()))
+            else:
+                self._emit(antmsg.ChannelIDMessage(
+                    number=number, device_number=channel.device_number,
+                    device_type=channel.device_type,
+                    trans_type=channel.trans_type))
+        else:
+            self._respond(number, msg.getType(), msgtypes.INVALID_MESSAGE)
+
+    def _handleChannel(self, channel, msg):
+        type_ = msg.getType()
+        number = channel.number
+        state = channel.state
+
+        if type_ == msgtypes.MESSAGE_CHANNEL_ASSIGN:
+            if state != msgtypes.CHANNEL_STATE_UNASSIGNED:
+                self._respond(number, type_, msgtypes.CHANNEL_IN_WRONG_STATE)
+                return
+            if msg.getNetworkNumber() >= self.max_networks:
+                self._respond(number, type_, msgtypes.INVALID_NETWORK_NUMBER)
+                return
+            channel.type_ = msg.getChannelType()
+            channel.network = msg.getNetworkNumber()
+            channel.state = msgtypes.CHANNEL_STATE_ASSIGNED
+            self._respond(number, type_)
+        elif type_ == msgtypes.MESSAGE_CHANNEL_UNASSIGN:
+            if state != msgtypes.CHANNEL_STATE_ASSIGNED:
+                self._respond(number, type_, msgtypes.CHANNEL_IN_WRONG_STATE)
+                return
+            channel.reset()
+            self._respond(number, type_)
+        elif type_ in (msgtypes.MESSAGE_CHANNEL_ID,
+                       msgtypes.MESSAGE_CHANNEL_PERIOD,
+                       msgtypes.MESSAGE_CHANNEL_SEARCH_TIMEOUT,
+                       msgtypes.MESSAGE_CHANNEL_FREQUENCY,
+                       msgtypes.MESSAGE_CHANNEL_TX_POWER):
+            if state == msgtypes.CHANNEL_STATE_UNASSIGNED:
+                self._respond(number, type_, msgtypes.CHANNEL_IN_WRONG_STATE)
+                return
+            self._configure(channel, msg)
+            self._respond(number, type_)
+        elif type_ == msgtypes.MESSAGE_CHANNEL_OPEN:
+            if state != msgtypes.CHANNEL_STATE_ASSIGNED:
+                self._respond(number, type_, msgtypes.CHANNEL_IN_WRONG_STATE)
+                return
+            channel.state = msgtypes.CHANNEL_STATE_SEARCHING
+            channel.search_started = time.monotonic()
+            self._respond(number, type_)
+        elif type_ == msgtypes.MESSAGE_CHANNEL_CLOSE:
+            if not channel.isOpen():
+                self._respond(number, type_, msgtypes.CHANNEL_NOT_OPENED)
+                return
+            self._respond(number, type_)
+            self._closeChannel(channel)
+        elif type_ == msgtypes.MESSAGE_CHANNEL_BROADCAST_DATA:
+            pass    # Nobody is listening to the host's broadcasts
+        elif type_ in (msgtypes.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                       msgtypes.MESSAGE_CHANNEL_BURST_DATA):
+            if channel.state != msgtypes.CHANNEL_STATE_TRACKING:
+                self._respond(number, type_, msgtypes.CHANNEL_NOT_OPENED)
+                return
+            self._transmit(channel, msg)
+        else:
+            self._respond(number, type_, msgtypes.INVALID_MESSAGE)
+
+    def _configure(self, channel, msg):
+        type_ = msg.getType()
+
+        if type_ == msgtypes.MESSAGE_CHANNEL_ID:
+            channel.device_number = msg.getDeviceNumber()
+            channel.device_type = msg.getDeviceType()
+            channel.trans_type = msg.getTransmissionType()
+        elif type_ == msgtypes.MESSAGE_CHANNEL_PERIOD:
+            channel.period = msg.getChannelPeriod()
+        elif type_ == msgtypes.MESSAGE_CHANNEL_SEARCH_TIMEOUT:
+            channel.timeout = msg.getTimeout()
+        elif type_ == msgtypes.MESSAGE_CHANNEL_FREQUENCY:
+            channel.frequency = msg.getFrequency()
+        elif type_ == msgtypes.MESSAGE_CHANNEL_TX_POWER:
+            channel.power = msg.getPower()
+
+    def _transmit(self, channel, msg):
+        if msg.getType() == msgtypes.MESSAGE_CHANNEL_BURST_DATA:
+            sequence = msg.getSequenceNumber()
+            if sequence & 0x03 == 0:
+                channel.burst = bytearray()
+                self._event(channel.number, msgtypes.EVENT_TRANSFER_TX_START)
+            elif channel.burst is None:
+                return
+            elif sequence & 0x03 != channel.burst_sequence:
+                channel.burst = None
+                self._respond(channel.number, msg.getType(),
+                              msgtypes.TRANSFER_SEQUENCE_NUMBER_ERROR)
+                channel.pending.append(msgtypes.EVENT_TRANSFER_TX_FAILED)
+                return
+            channel.burst_sequence = (sequence & 0x03) % 3 + 1
+            channel.burst += msg.getPayload()[1:9]
+            self.counters['burst_tx'] += 1
+            if not sequence & 0x04:
+                return  # Outcome is only reported for the last packet
+
+        if self.random.random() < self.tx_fail_rate:
+            channel.pending.append(msgtypes.EVENT_TRANSFER_TX_FAILED)
+        else:
+            channel.pending.append(msgtypes.EVENT_TRANSFER_TX_COMPLETED)
+            if channel.burst is not None:
+                channel.bursts.append(bytes(channel.burst))
+        channel.burst = None
+
+    def _closeChannel(self, channel):
+        channel.state = msgtypes.CHANNEL_STATE_ASSIGNED
+        channel.device = None
+        channel.pending = []
+        self._event(channel.number, msgtypes.EVENT_CHANNEL_CLOSED)
+
+    def _search(self, channel, now):
+        if channel.isMaster():
+            channel.state = msgtypes.CHANNEL_STATE_TRACKING
+            channel.next_due = now
+            return
+
+        tracked = [ch.device for ch in self.channels if ch.device is not None]
+        for device in self.devices:
+            if device in tracked:
+                continue
+            if device.matches(channel.device_number, channel.device_type,
+                              channel.trans_type):
+                channel.device = device
+                channel.device_number = device.device_number
+                channel.device_type = device.device_type
+                channel.trans_type = device.trans_type
+                channel.state = msgtypes.CHANNEL_STATE_TRACKING
+                channel.next_due = now
+                return
+
+        if channel.timeout != msgtypes.TIMEOUT_NEVER and \
+           now - channel.search_started >= channel.timeout * SEARCH_TIMEOUT_UNIT:
+            self._event(channel.number, msgtypes.EVENT_RX_SEARCH_TIMEOUT)
+            self._closeChannel(channel)
+
+    def _tick(self, now):
+        for channel in self.channels:
+            if channel.state == msgtypes.CHANNEL_STATE_SEARCHING:
+                self._search(channel, now)
+            if channel.state != msgtypes.CHANNEL_STATE_TRACKING:
+                continue
+
+            interval = channel.getInterval()
+            if now - channel.next_due > interval * MAX_CATCHUP:
+                channel.next_due = now - interval * MAX_CATCHUP
+            while channel.next_due <= now:
+                self._period(channel)
+                channel.next_due += interval
+
+    def _period(self, channel):
+        for code in channel.pending:
+            self._event(channel.number, code)
+        channel.pending = []
+
+        if channel.isMaster():
+            self._event(channel.number, msgtypes.EVENT_TX)
+            return
+
+        device = channel.device
+        if self.random.random() < device.error_rate:
+            self.counters['rx_fail'] += 1
+            self._event(channel.number, msgtypes.EVENT_RX_FAIL)
+            return
+
+        channel.counter += 1
+        counter = channel.counter
+        if device.burst_every and counter % device.burst_every == 0:
+            self._burst(channel, counter)
+        elif device.ack_every and counter % device.ack_every == 0:
+            self.counters['acknowledged'] += 1
+            self._emit(antmsg.ChannelAcknowledgedDataMessage(
+                number=channel.number, data=device.getData(counter)))
+        else:
+            self.counters['broadcast'] += 1
+            self._emit(antmsg.ChannelBroadcastDataMessage(
+                number=channel.number, data=device.getData(counter)))
+
+    def _burst(self, channel, counter):
+        length = max(channel.device.burst_length, 1)
+        sequence = 0
+        for i in range(length):
+            if i == length - 1:
+                sequence |= 0x04
+            self.counters['burst'] += 1
+            self._emit(antmsg.ChannelBurstDataMessage(
+                number=channel.number | (sequence << 5),
+                data=channel.device.getData(counter + i)))
+            sequence = (sequence % 3) + 1
+
+
+class FaultInjectingDriver(antdrv.Driver):
+    '''Wraps another driver and corrupts what is read from it like a flaky stick would. '''
+    def __init__(self, driver, drop_rate=0.0, flip_rate=0.0,
+                 duplicate_rate=0.0, fragment_rate=0.0, latency_rate=0.0,
+                 latency=0.05, seed=None, log=None, debug=False):
+        antdrv.Driver.__init__(self, driver.device, log, debug)
+        self.driver = driver
+        self.drop_rate = drop_rate
+        self.flip_rate = flip_rate
+        self.duplicate_rate = duplicate_rate
+        self.fragment_rate = fragment_rate
+        self.latency_rate = latency_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.counters = {'dropped': 0, 'flipped': 0, 'duplicated': 0,
+                         'fragmented': 0, 'delayed': 0}
+        self._pending = b''
+
+    def _open(self):
+        self._pending = b''
+        if not self.driver.isOpen():
+            self.driver.open()
+
+    def _close(self):
+        if self.driver.isOpen():
+            self.driver.close()
+
+    def _read(self, count):
+        if self.latency_rate and self.random.random() < self.latency_rate:
+            self.counters['delayed'] += 1
+            time.sleep(self.latency)
+
+        if len(self._pending) < count:
+            self._pending += self._corrupt(self.driver.read(count))
+
+        size = count
+        if self._pending and self.fragment_rate and \
+           self.random.random() < self.fragment_rate:
+            self.counters['fragmented'] += 1
+            size = self.random.randint(1, min(count, len(self._pending)))
+
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        return data
+
+    def _write(self, data):
+        return self.driver.write(data)
+
+    def _corrupt(self, data):
+        if not (self.drop_rate or self.flip_rate or self.duplicate_rate):
+            return data
+
+        corrupted = bytearray()
+        for byte in data:
+            if self.random.random() < self.drop_rate:
+                self.counters['dropped'] += 1
+                continue
+            if self.random.random() < self.flip_rate:
+                self.counters['flipped'] += 1
+                byte ^= 1 << self.random.randrange(8)
+            corrupted.append(byte)
+            if self.random.random() < self.duplicate_rate:
+                self.counters['duplicated'] += 1
+                corrupted.append(byte)
+
+        return bytes(corrupted)
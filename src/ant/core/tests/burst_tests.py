@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import unittest
+from unittest import mock
+
+import ant.core.burst as antburst
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+
+
+class FakeChannel():
+    def __init__(self):
+        self.callback = []
+
+    def registerCallback(self, callback):
+        self.callback.append(callback)
+
+    def removeCallback(self, callback):
+        self.callback.remove(callback)
+
+
+class FakeDriver():
+    '''Takes at most five bytes per write, like a busy USB endpoint. '''
+    def __init__(self, sender):
+        self.sender = sender
+        self.data = b''
+        self.sizes = []
+        self.fail = False
+
+    def write(self, data):
+        self.sizes.append(len(data))
+        if self.fail:
+            return 0
+        self.data += data[:5]
+        size = len(antburst.Packets(1, b'')[0])
+        if len(self.data) == size:
+            self.event(msgtypes.EVENT_TRANSFER_TX_START)
+        elif len(self.data) == 3 * size:
+            self.event(msgtypes.EVENT_TRANSFER_TX_COMPLETED)
+        return len(data[:5])
+
+    def event(self, code):
+        self.sender.process(antmsg.ChannelEventMessage(
+            number=1, message_id=0x01, message_code=code))
+
+
+def Messages(data):
+    return antevt.ProcessBuffer(b''.join(antburst.Packets(1, data)))[1]
+
+
+class PacketsTest(unittest.TestCase):
+    def test_sequence(self):
+        self.assertEqual([antburst.Sequence(i, 6) for i in range(6)],
+                         [0, 1, 2, 3, 1, 6])
+        self.assertEqual(antburst.Sequence(0, 1), 4)
+
+    def test_packets(self):
+        messages = Messages(bytes(range(20)))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual([msg.getSequenceNumber() for msg in messages], [0, 1, 6])
+        self.assertEqual([msg.getChannelNumber() & 0x1F for msg in messages], [1] * 3)
+        self.assertEqual(messages[2].getPayload()[1:], bytes(range(16, 20)) + b'\x00' * 4)
+
+
+class BurstSenderTest(unittest.TestCase):
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.channel.number = 1
+        self.sender = antburst.BurstSender(self.channel)
+        self.driver = FakeDriver(self.sender)
+        self.channel.node = mock.Mock(driver=self.driver)
+
+    def test_short_writes(self):
+        self.sender.send(bytes(range(20)), timeout=1)
+        self.assertEqual(self.driver.data,
+                         b''.join(antburst.Packets(1, bytes(range(20)))))
+        # One packet per write at most
+        self.assertEqual(max(self.driver.sizes), len(antburst.Packets(1, b'')[0]))
+        self.assertEqual(self.channel.callback, [])
+
+    def test_write_failed(self):
+        self.driver.fail = True
+        self.assertRaises(antex.BurstError, self.sender.send, bytes(20), 1)
+        self.assertEqual(self.channel.callback, [])
+
+
+class BurstReceiverTest(unittest.TestCase):
+    def setUp(self):
+        self.receiver = antburst.BurstReceiver(FakeChannel(), size=16)
+
+    def test_reassemble(self):
+        data = bytes(range(40))
+        for msg in Messages(data) + Messages(b'\xFF' * 8):
+            self.receiver.process(msg)
+        self.assertEqual(self.receiver.get(timeout=0), data)
+        self.assertEqual(self.receiver.get(timeout=0), b'\xFF' * 8)
+        self.assertEqual(self.receiver.completed, 2)
+        self.assertIsNone(self.receiver.get(timeout=0))
+
+    def test_sequence_error(self):
+        messages = Messages(bytes(40))
+        del messages[2]
+        for msg in messages:
+            self.receiver.process(msg)
+        self.assertRaises(antex.BurstError, self.receiver.get, 0)
+        self.assertIsNone(self.receiver.get(timeout=0))
+        self.assertEqual(self.receiver.failed, 1)
+
+    def test_rx_failed(self):
+        messages = Messages(bytes(40))
+        for msg in messages[:2]:
+            self.receiver.process(msg)
+        self.receiver.process(antmsg.ChannelEventMessage(
+            number=1, message_id=0x01,
+            message_code=msgtypes.EVENT_TRANSFER_RX_FAILED))
+        for msg in messages[2:]:
+            self.receiver.process(msg)
+        self.assertRaises(antex.BurstError, self.receiver.get, 0)
+        self.assertIsNone(self.receiver.get(timeout=0))
+
+    def test_close(self):
+        self.receiver.close()
+        self.assertIsNone(self.receiver.get())
+        self.assertIsNone(self.receiver.get())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import random
+import tempfile
+import unittest
+
+import ant.core.decode as antdec
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+LOG_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                        'python-ant.decodetest.ant'])
+
+
+def WriteCapture(filename, seed=1, **kwargs):
+    '''Broadcasts split into random reads, with some corrupted frames. '''
+    rnd = random.Random(seed)
+    lw = antlog.LogWriter(filename, **kwargs)
+    lw.logOpen()
+    stream = b''
+    for i in range(2000):
+        msg = antmsg.ChannelBroadcastDataMessage(number=i % 8,
+                                                 data=bytes([i % 256]) * 8)
+        frame = msg.encode()
+        if rnd.random() < 0.02:
+            frame = frame[:3] + b'\x00' + frame[4:]
+        if rnd.random() < 0.01:
+            lw.logWrite(antmsg.ChannelOpenMessage(number=1).encode())
+        stream += frame
+        while len(stream) > 20 or (stream and rnd.random() < 0.3):
+            size = rnd.randint(1, 20)
+            lw.logRead(stream[:size])
+            stream = stream[size:]
+    lw.logClose()
+    lw.close()
+
+
+class DecodeTest(unittest.TestCase):
+    def tearDown(self):
+        for filename in [LOG_LOCATION, antlog.LogIndex.getFilename(LOG_LOCATION)]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def check(self, **kwargs):
+        WriteCapture(LOG_LOCATION, **kwargs)
+        expected = list(antdec.Frames(antlog.LogReader(LOG_LOCATION)))
+        self.assertTrue(len(expected) > 1900)
+
+        for chunk_events in (50, 333, antdec.CHUNK_EVENTS):
+            frames = antdec.Decode(LOG_LOCATION, workers=2,
+                                   chunk_events=chunk_events)
+            self.assertEqual(frames, expected)
+
+    def test_v1(self):
+        self.check()
+
+    def test_index(self):
+        self.check(index=True, index_events=100)
+
+    def test_delta(self):
+        self.check(version=antlog.LOG_VERSION_2, delta=True)
+
+    def test_compressed(self):
+        self.check(version=antlog.LOG_VERSION_2, delta=True,
+                   compression=antlog.COMPRESSION_ZLIB, block_events=200)
+
+    def test_chunks(self):
+        WriteCapture(LOG_LOCATION, version=antlog.LOG_VERSION_2, delta=True)
+        chunks = antdec.FindChunks(LOG_LOCATION, chunk_events=500)
+        self.assertTrue(os.path.exists(antlog.LogIndex.getFilename(LOG_LOCATION)))
+        self.assertEqual([(entry[0], count) for entry, count in chunks[:2]],
+                         [(0, 1000), (1000, 1000)])
+        self.assertEqual(chunks[-1][1], None)
+
+    def test_counts(self):
+        WriteCapture(LOG_LOCATION)
+        frames = list(antdec.Frames(antlog.LogReader(LOG_LOCATION)))
+        counts = antdec.Decode([LOG_LOCATION, LOG_LOCATION], antdec.TypeCounter(),
+                               workers=2, chunk_events=100)
+        self.assertEqual(counts[(antlog.DIRECTION_IN, 0x4E)],
+                         2 * sum(1 for frame in frames if frame[2] == 0x4E))
+        self.assertEqual(sum(counts.values()), 2 * len(frames))
+
+    def test_frame_records(self):
+        lw = antlog.LogWriter(LOG_LOCATION, frames=True)
+        lw.logWrite(antmsg.ChannelOpenMessage(number=1).encode())
+        lw.logFrame(antlog.DIRECTION_IN, antmsg.ChannelEventMessage(number=1))
+        lw.close()
+        self.assertEqual(antdec.Decode(LOG_LOCATION, workers=1),
+                         list(antdec.Frames(antlog.LogReader(LOG_LOCATION))))
+        self.assertEqual([frame[1:3] for frame in antdec.Decode(LOG_LOCATION)],
+                         [(antlog.DIRECTION_OUT, 0x4B), (antlog.DIRECTION_IN, 0x40)])
+
+
+class MergeFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.filenames = [LOG_LOCATION + '.%d' % i for i in range(2)]
+        for seed, filename in enumerate(self.filenames):
+            WriteCapture(filename, seed)
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def test_merge(self):
+        readers = [antlog.LogReader(filename) for filename in self.filenames]
+        merged = list(antdec.MergeFrames(readers))
+        self.assertEqual([frame[0] for _, frame in merged],
+                         sorted(frame[0] for _, frame in merged))
+        for source, filename in enumerate(self.filenames):
+            self.assertEqual([frame for frame_source, frame in merged
+                              if frame_source == source],
+                             list(antdec.Frames(antlog.LogReader(filename))))
+
+    def test_duplicates(self):
+        readers = [antlog.LogReader(filename) for filename in self.filenames]
+        merged = list(antdec.MergeFrames(readers, duplicates=True, window=10.0))
+        sources = [source for source, frame in merged if frame[2] == 0x4E]
+        # Both captures hold the same broadcasts, apart from corrupted ones
+        self.assertTrue(sources.count(1) < sources.count(0) / 10)
@@ -24,6 +24,9 @@
 ##############################################################################
 
 import unittest
+from unittest import mock
+
+import usb.core
 
 import ant.core.driver as antdrv
 import ant.core.exceptions as antex
@@ -82,6 +85,126 @@ class DriverTest(unittest.TestCase):
         self.driver.close()
 
 
+class HexDumpTest(unittest.TestCase):
+    def test_lines(self):
+        self.assertEqual(antdrv.HexDump(bytes(range(10)), 'READ'),
+                         '========== [READ] ==========\n'
+                         '0000 00 01 02 03 04 05 06 07\n'
+                         '0008 08 09')
+
+
+class ShortDriver(DummyDriver):
+    def _write(self, data):
+        return min(len(data), 2)
+
+
+class DebugTracerTest(unittest.TestCase):
+    def test_trace(self):
+        tracer = antdrv.DebugTracer(read_rate=0.5)
+        driver = DummyDriver('superdrive', debug=tracer)
+        driver.open()
+        with self.assertLogs('ant.core.driver', 'DEBUG') as logs:
+            for _ in range(10):
+                driver.read(4)
+            driver.write(b'\xFF')
+            tracer.flush()
+        driver.close()
+
+        self.assertEqual(tracer.traced, 6)
+        self.assertEqual(tracer.skipped, 5)
+        self.assertEqual(len(logs.records), 6)
+        self.assertTrue(logs.output[-1].endswith('0000 FF'))
+
+    def test_short_write(self):
+        tracer = antdrv.DebugTracer()
+        driver = ShortDriver('superdrive', debug=tracer)
+        with self.assertLogs('ant.core.driver', 'DEBUG') as logs:
+            self.assertRaises(antex.DriverError, driver.write, b'\xFF')
+            driver.open()
+            self.assertEqual(driver.write(b'\x01\x02\x03'), 2)
+            tracer.flush()
+        driver.close()
+
+        self.assertEqual(tracer.traced, 1)
+        self.assertTrue(logs.output[-1].endswith('0000 01 02'))
+
+    def test_disabled(self):
+        tracer = antdrv.DebugTracer()
+        tracer.trace(b'\x00', 'READ')
+        self.assertEqual(tracer.traced, 0)
+
+
+class FailingDriver(DummyDriver):
+    def _open(self):
+        raise antex.DriverError('Could not open device (not found)')
+
+
+class DriverPoolTest(unittest.TestCase):
+    def test_open_close(self):
+        pool = antdrv.DriverPool([DummyDriver('a'), DummyDriver('b')])
+        pool.open()
+        self.assertTrue(all(driver.isOpen() for driver in pool))
+        pool.close()
+        self.assertFalse(any(driver.isOpen() for driver in pool))
+
+    def test_open_failure(self):
+        pool = antdrv.DriverPool([DummyDriver('a'), FailingDriver('b')])
+        self.assertRaises(antex.DriverError, pool.open)
+        self.assertFalse(pool[0].isOpen())
+
+
+class FakeUSBDevice():
+    def __init__(self, bus, address, serial):
+        self.bus = bus
+        self.address = address
+        self.idProduct = 0x1008
+        self.serial = serial
+
+
+class USB2DriverTest(unittest.TestCase):
+    def setUp(self):
+        devices = [FakeUSBDevice(1, 4, '123'), FakeUSBDevice(2, 7, '456')]
+        self.patches = [
+            mock.patch.object(antdrv, '_findUSBDevices', return_value=devices),
+            mock.patch.object(antdrv, '_getUSBSerial', lambda dev: dev.serial)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_enumerate(self):
+        infos = antdrv.DriverFactory.enumerate()
+        self.assertEqual([info.serial for info in infos], ['123', '456'])
+        self.assertEqual(len(antdrv.DriverFactory.createPool()), 2)
+
+    def test_find(self):
+        self.assertEqual(antdrv.USB2Driver()._find().serial, '123')
+        self.assertEqual(antdrv.USB2Driver(index=1)._find().serial, '456')
+        self.assertEqual(antdrv.USB2Driver(index=2)._find(), None)
+        self.assertEqual(antdrv.USB2Driver(serial='456')._find().address, 7)
+        self.assertEqual(antdrv.USB2Driver(serial='789')._find(), None)
+        info = antdrv.USBDeviceInfo(2, 7, 0x1008)
+        self.assertEqual(antdrv.USB2Driver(info)._find().serial, '456')
+
+    def test_identity(self):
+        self.assertEqual(antdrv.USB2Driver(serial='456').getIdentity(), 'USB:456')
+        self.assertRaises(antex.DriverError, antdrv.USB2Driver().getIdentity)
+        driver = antdrv.USB2Driver(index=1)
+        driver._dev = driver._find()
+        self.assertEqual(driver.getIdentity(), 'USB:456')
+
+    def test_open_usb_error(self):
+        # Still enumerating after a replug
+        driver = antdrv.USB2Driver()
+        with mock.patch.object(FakeUSBDevice, 'set_configuration', create=True,
+                               side_effect=usb.core.USBError('Busy')):
+            self.assertRaises(antex.DriverError, driver.open)
+        self.assertFalse(driver.isOpen())
+
+
 # How do you even test this without hardware?
 class USB1DriverTest(unittest.TestCase):
     def _open(self):
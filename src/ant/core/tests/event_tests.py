@@ -23,8 +23,62 @@
 #
 ##############################################################################
 
-# import unittest
+import unittest
 
-# from ant.core.event import *
+import ant.core.event as antevt
+import ant.core.message as antmsg
 
 # TODO: How exactly do you properly test threaded code?
+
+FRAME = antmsg.ChannelBroadcastDataMessage(number=1, data=b'\x01' * 8).encode()
+RESET = antmsg.SystemResetMessage().encode()
+
+
+class ProcessBufferTest(unittest.TestCase):
+    def test_complete(self):
+        buffer_, messages = antevt.ProcessBuffer(FRAME + RESET)
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(isinstance(messages[0], antmsg.ChannelBroadcastDataMessage))
+        self.assertTrue(isinstance(messages[1], antmsg.SystemResetMessage))
+
+    def test_incomplete(self):
+        buffer_, messages = antevt.ProcessBuffer(FRAME + RESET[:3])
+        self.assertEqual(buffer_, RESET[:3])
+        self.assertEqual(len(messages), 1)
+        buffer_, messages = antevt.ProcessBuffer(buffer_ + RESET[3:])
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 1)
+
+    def test_garbage(self):
+        stats = {}
+        buffer_, messages = antevt.ProcessBuffer(b'\x00\x17' + FRAME, stats)
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(stats['sync'], 1)
+        self.assertEqual(stats['discarded'], 2)
+
+    def test_checksum(self):
+        stats = {}
+        corrupted = FRAME[:-1] + bytes([FRAME[-1] ^ 0x01])
+        buffer_, messages = antevt.ProcessBuffer(corrupted + RESET, stats)
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(isinstance(messages[0], antmsg.SystemResetMessage))
+        self.assertEqual(stats['checksum'], 1)
+        self.assertEqual(stats['frames'], 1)
+
+    def test_dropped_byte(self):
+        buffer_, messages = antevt.ProcessBuffer(FRAME[:5] + FRAME[6:] + RESET)
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(isinstance(messages[0], antmsg.SystemResetMessage))
+
+    def test_unknown(self):
+        stats = {}
+        unknown = antmsg.Message(type_=0xFE, payload=b'\x00').encode()
+        buffer_, messages = antevt.ProcessBuffer(unknown + RESET, stats)
+        self.assertEqual(buffer_, b'')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(stats['unknown'], 1)
+        self.assertEqual(stats['discarded'], len(unknown))
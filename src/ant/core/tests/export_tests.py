@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy
+    import ant.core.export as antexp
+except ImportError:
+    numpy = None
+
+import ant.core.decode as antdec
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+LOG_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                        'python-ant.exporttest.ant'])
+NPZ_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                        'python-ant.exporttest.npz'])
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ExportNpzTest(unittest.TestCase):
+    def setUp(self):
+        lw = antlog.LogWriter(LOG_LOCATION, version=antlog.LOG_VERSION_2)
+        lw.logOpen()
+        lw.logWrite(antmsg.ChannelIDMessage(number=1).encode())
+        lw.logRead(antmsg.ChannelIDMessage(number=1, device_number=0x1234,
+                                           device_type=0x78,
+                                           trans_type=0x01).encode())
+        for i in range(250):
+            data = antmsg.ChannelBroadcastDataMessage(number=i % 2,
+                                                      data=bytes([i]) * 8)
+            lw.logRead(data.encode())
+        lw.logRead(antmsg.SystemResetMessage().encode())
+        lw.close()
+
+    def tearDown(self):
+        for filename in [LOG_LOCATION, NPZ_LOCATION]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_export(self):
+        self.assertEqual(antexp.ExportNpz(LOG_LOCATION, NPZ_LOCATION, row_group=100),
+                         253)
+        self.assertEqual(len(list(antexp.LoadGroups(NPZ_LOCATION))), 3)
+
+        columns = antexp.LoadNpz(NPZ_LOCATION)
+        frames = list(antdec.Frames(antlog.LogReader(LOG_LOCATION)))
+        self.assertEqual(columns['timestamp'].tolist(), [f[0] for f in frames])
+        self.assertEqual(columns['type'].tolist(), [f[2] for f in frames])
+        self.assertEqual(columns['direction'][0], antlog.DIRECTION_OUT)
+        self.assertEqual(columns['channel'].tolist()[0:4], [1, 1, 0, 1])
+        self.assertEqual(columns['channel'][-1], -1)
+
+        self.assertEqual(columns['payload'].shape, (253, 9))
+        self.assertEqual(bytes(columns['payload'][2]), b'\x00' * 9)
+        self.assertEqual(bytes(columns['payload'][3][:columns['length'][3]]),
+                         b'\x01' + b'\x01' * 8)
+
+        # Device IDs are known once the channel ID response was seen
+        self.assertEqual(columns['device_number'].tolist()[0:4], [0, 0x1234, 0, 0x1234])
+        self.assertEqual(columns['device_type'][3], 0x78)
+        self.assertEqual(columns['trans_type'][3], 0x01)
+
+    def test_columns(self):
+        antexp.ExportNpz(LOG_LOCATION, NPZ_LOCATION)
+        columns = antexp.LoadNpz(NPZ_LOCATION, ['type'])
+        self.assertEqual(list(columns), ['type'])
+        self.assertEqual(len(columns['type']), 253)
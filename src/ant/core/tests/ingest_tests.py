@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import os
+import tempfile
+import unittest
+
+import ant.core.decode as antdec
+import ant.core.ingest as antingest
+import ant.core.log as antlog
+import ant.core.message as antmsg
+
+SERIES_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                           'python-ant.ingesttest.ant'])
+DB_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                       'python-ant.ingesttest.db'])
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        for _, name in antlog.ListSegments(SERIES_LOCATION):
+            os.remove(name)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DB_LOCATION + suffix):
+                os.remove(DB_LOCATION + suffix)
+
+    def write(self, first, count):
+        lw = antlog.LogWriter(SERIES_LOCATION, max_bytes=500)
+        lw.logRead(antmsg.ChannelIDMessage(number=0, device_number=0x1234,
+                                           device_type=0x78).encode())
+        for i in range(first, first + count):
+            frame = antmsg.ChannelBroadcastDataMessage(number=i % 2,
+                                                       data=bytes([i % 256]) * 8)
+            # Frames straddle segment boundaries
+            lw.logRead(frame.encode()[:7])
+            lw.logRead(frame.encode()[7:])
+        lw.close()
+
+    def test_ingest(self):
+        self.write(0, 200)
+        with antingest.Database(DB_LOCATION) as database:
+            self.assertEqual(database.ingest(SERIES_LOCATION), 201)
+            self.assertEqual(database.ingest(SERIES_LOCATION), 0)
+
+            self.write(200, 100)
+            self.assertEqual(database.ingest(SERIES_LOCATION), 101)
+
+            rows = database.execute('SELECT timestamp, direction, type, payload '
+                                    'FROM frames ORDER BY rowid').fetchall()
+            with antlog.LogSeriesReader(SERIES_LOCATION) as reader:
+                self.assertEqual(rows, list(antdec.Frames(reader)))
+
+            counts = database.execute(
+                'SELECT channel, device_number, COUNT(*) FROM frames '
+                'WHERE type = 0x4E GROUP BY channel, device_number').fetchall()
+            self.assertEqual(counts, [(0, 0x1234, 150), (1, None, 150)])
+
+            plan = database.execute('EXPLAIN QUERY PLAN SELECT * FROM frames '
+                                    'WHERE channel = 1 AND type = 0x4E').fetchall()
+            self.assertIn('frames_channel_type', str(plan))
@@ -25,11 +25,19 @@
 
 import os
 import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+import ant.core.event as antevt
 import ant.core.log as log
+import ant.core.message as antmsg
 
 LOG_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
                         'python-ant.logtest.ant'])
+SERIES_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                           'python-ant.logtest-series.ant'])
 
 
 class LogReaderTest(unittest.TestCase):
@@ -81,6 +89,206 @@ class LogReaderTest(unittest.TestCase):
         self.assertTrue(isinstance(t1[1], int))
         self.assertEqual(len(t5), 2)
 
+    def test_iter(self):
+        events = list(self.log)
+        self.assertEqual([event[0] for event in events],
+                         [log.EVENT_OPEN, log.EVENT_READ, log.EVENT_WRITE,
+                          log.EVENT_READ, log.EVENT_CLOSE])
+        self.assertEqual(list(self.log), [])
+
+    def test_stream(self):
+        lw = log.LogWriter(LOG_LOCATION)
+        for i in range(10000):
+            lw.logRead(i.to_bytes(20, 'little'))
+        lw.close()
+
+        with log.LogReader(LOG_LOCATION) as lr:
+            events = list(lr)
+        self.assertFalse(lr.is_open)
+        self.assertEqual(len(events), 10000)
+        self.assertEqual(events[-1][2], (9999).to_bytes(20, 'little'))
+
+    def test_unknown_format(self):
+        with open(LOG_LOCATION, 'wb') as fd:
+            fd.write(b'NOT-A-LOG')
+        self.assertRaises(IOError, log.LogReader, LOG_LOCATION)
+
+
+class LogIndexTest(unittest.TestCase):
+    def setUp(self):
+        # One event per second, starting at 1000
+        clock = iter(range(1000, 2000))
+        with mock.patch('time.time', lambda: next(clock)):
+            lw = log.LogWriter(LOG_LOCATION, index=True, index_events=10,
+                               index_seconds=1000)
+            for i in range(100):
+                lw.logRead(bytes([i]))
+            lw.close()
+        self.index_location = log.LogIndex.getFilename(LOG_LOCATION)
+
+    def tearDown(self):
+        if os.path.exists(self.index_location):
+            os.remove(self.index_location)
+
+    def test_entries(self):
+        index = log.LogIndex(self.index_location).load()
+        self.assertEqual([entry[0] for entry in index.entries],
+                         list(range(0, 100, 10)))
+        self.assertEqual(index.entries[3][1], 1030)
+        self.assertEqual(index.findEvent(35), index.entries[3])
+        self.assertEqual(index.findTime(1030), index.entries[2])
+
+    def test_seek(self):
+        lr = log.LogReader(LOG_LOCATION)
+        lr.seek(35)
+        self.assertEqual(lr.read()[2], bytes([35]))
+        self.assertEqual(lr.event_number, 36)
+        lr.seekTime(1072)
+        self.assertEqual(lr.read()[2], bytes([72]))
+        lr.seek(0)
+        self.assertEqual(len(list(lr)), 100)
+        lr.seek(500)
+        self.assertEqual(lr.read(), None)
+        lr.close()
+
+    def test_seek_without_index(self):
+        os.remove(self.index_location)
+        lr = log.LogReader(LOG_LOCATION)
+        lr.seek(35)
+        self.assertEqual(lr.read()[2], bytes([35]))
+        lr.seekTime(1072)
+        self.assertEqual(lr.read()[2], bytes([72]))
+        lr.close()
+
+    def test_build(self):
+        written = log.LogIndex(self.index_location).load().entries
+        os.remove(self.index_location)
+        self.assertEqual(log.BuildIndex(LOG_LOCATION, events=10).entries, written)
+
+    def test_build_resume(self):
+        written = log.LogIndex(self.index_location).load().entries
+        with open(self.index_location, 'rb+') as fd:
+            fd.truncate(os.path.getsize(self.index_location) - 10)
+        self.assertTrue(len(log.LogIndex(self.index_location).load().entries) < 10)
+
+        log.BuildIndex(LOG_LOCATION, events=10)
+        self.assertEqual(log.LogIndex(self.index_location).load().entries, written)
+
+
+class LogVersion2Test(unittest.TestCase):
+    def write(self, **kwargs):
+        # One event every 1.5 ms
+        wall = iter(range(10 ** 18, 2 * 10 ** 18, 1500000))
+        monotonic = iter(range(5000, 10 ** 18, 1500000))
+        with mock.patch('time.time_ns', lambda: next(wall)), \
+             mock.patch('time.monotonic_ns', lambda: next(monotonic)):
+            lw = log.LogWriter(LOG_LOCATION, version=log.LOG_VERSION_2, **kwargs)
+            lw.logOpen()
+            for i in range(100):
+                lw.logRead(bytes([i]))
+            lw.close()
+
+    def tearDown(self):
+        index_location = log.LogIndex.getFilename(LOG_LOCATION)
+        if os.path.exists(index_location):
+            os.remove(index_location)
+
+    def check(self):
+        lr = log.LogReader(LOG_LOCATION)
+        self.assertEqual(lr.version, log.LOG_VERSION_2)
+        events = list(lr)
+        self.assertEqual(len(events), 101)
+        self.assertEqual(events[0], [log.EVENT_OPEN, 1e9])
+        self.assertEqual(events[-1][2], bytes([99]))
+        self.assertAlmostEqual(events[-1][1] - events[0][1], 0.15)
+        self.assertEqual(lr.wall_ns, 10 ** 18 + 100 * 1500000)
+        self.assertEqual(lr.monotonic_ns, 5000 + 100 * 1500000)
+
+    def test_absolute(self):
+        self.write()
+        self.check()
+
+    def test_delta(self):
+        self.write()
+        size = os.path.getsize(LOG_LOCATION)
+        self.write(delta=True)
+        self.assertTrue(os.path.getsize(LOG_LOCATION) < size)
+        self.check()
+
+    def test_seek_delta(self):
+        self.write(delta=True, index=True, index_events=10)
+        lr = log.LogReader(LOG_LOCATION)
+        lr.seek(55)
+        self.assertEqual(lr.read()[2], bytes([54]))
+        self.assertEqual(lr.wall_ns, 10 ** 18 + 55 * 1500000)
+        lr.seekTime(1e9 + 0.03)
+        self.assertEqual(lr.read()[2], bytes([19]))
+        self.assertEqual(lr.monotonic_ns, 5000 + 20 * 1500000)
+
+    def test_monotonic(self):
+        self.write(delta=True, compression=log.COMPRESSION_ZLIB, block_events=30)
+        events = list(log.OpenLog(LOG_LOCATION, monotonic=True))
+        self.assertEqual(events[0], [log.EVENT_OPEN, 1e9, None, 5000 / 1e9])
+        self.assertEqual(events[-1][2:],
+                         [bytes([99]), (5000 + 100 * 1500000) / 1e9])
+
+        lw = log.LogWriter(LOG_LOCATION)
+        lw.logRead(b'\x01')
+        lw.close()
+        self.assertEqual(log.LogReader(LOG_LOCATION, monotonic=True).read()[2:],
+                         [b'\x01', None])
+
+    def test_build_index_delta(self):
+        self.write(delta=True, index=True, index_events=10)
+        written = log.LogIndex(log.LogIndex.getFilename(LOG_LOCATION)).load().entries
+        self.tearDown()
+        self.assertEqual(log.BuildIndex(LOG_LOCATION, events=10).entries, written)
+
+    def test_unknown_version(self):
+        self.assertRaises(ValueError, log.LogWriter, LOG_LOCATION, version=3)
+
+    def test_compressed(self):
+        for compression in (log.COMPRESSION_ZLIB, log.COMPRESSION_LZMA):
+            self.write(compression=compression, block_events=16)
+            self.assertEqual(log.LogReader(LOG_LOCATION).compression, compression)
+            self.check()
+            self.write(compression=compression, block_events=16, delta=True)
+            self.check()
+
+    def test_compressed_requires_version_2(self):
+        self.assertRaises(ValueError, log.LogWriter, LOG_LOCATION,
+                          compression=log.COMPRESSION_ZLIB)
+        self.assertRaises(ValueError, log.LogWriter, LOG_LOCATION,
+                          version=log.LOG_VERSION_2, compression='snappy')
+
+    def test_seek_compressed(self):
+        self.write(compression=log.COMPRESSION_ZLIB, block_events=16, delta=True)
+        for _ in range(2):
+            lr = log.LogReader(LOG_LOCATION)
+            lr.seek(55)
+            self.assertEqual(lr.read()[2], bytes([54]))
+            self.assertEqual(lr.wall_ns, 10 ** 18 + 55 * 1500000)
+            lr.seekTime(1e9 + 0.03)
+            self.assertEqual(lr.read()[2], bytes([19]))
+            self.assertEqual(lr.event_number, 21)
+            lr.close()
+
+            # Again with an index, entries can only point at blocks
+            index = log.BuildIndex(LOG_LOCATION, events=10)
+            self.assertEqual([entry[0] for entry in index.entries],
+                             [0, 16, 32, 48, 64, 80, 96])
+
+    def test_compressed_background(self):
+        lw = log.LogWriter(LOG_LOCATION, version=log.LOG_VERSION_2,
+                           compression=log.COMPRESSION_ZLIB, background=True)
+        for i in range(10):
+            lw.logRead(bytes([i]))
+        lw.flush()
+        self.assertEqual(len(list(log.LogReader(LOG_LOCATION))), 10)
+        lw.logRead(b'\xFF')
+        lw.close()
+        self.assertEqual(len(list(log.LogReader(LOG_LOCATION))), 11)
+
 
 class LogWriterTest(unittest.TestCase):
     def setUp(self):
@@ -97,3 +305,287 @@ class LogWriterTest(unittest.TestCase):
         # Redundant, any error in log* methods will cause the LogReader test
         # suite to fail.
         pass
+
+
+class BackgroundLogWriterTest(unittest.TestCase):
+    def test_log(self):
+        lw = log.LogWriter(LOG_LOCATION, background=True, flush_interval=0.01,
+                           fsync=log.FSYNC_FLUSH)
+        for i in range(5000):
+            lw.logRead(i.to_bytes(4, 'little'))
+        lw.flush()
+        self.assertEqual(lw.getStats(), {'queued': 5000, 'written': 5000,
+                                         'dropped': 0, 'pending': 0})
+        self.assertEqual(len(list(log.LogReader(LOG_LOCATION))), 5000)
+
+        lw.logClose()
+        lw.close()
+        events = list(log.LogReader(LOG_LOCATION))
+        self.assertEqual(len(events), 5001)
+        self.assertEqual(events[4999][2], (4999).to_bytes(4, 'little'))
+        self.assertEqual(events[-1][0], log.EVENT_CLOSE)
+
+    def test_overflow(self):
+        lw = log.LogWriter(LOG_LOCATION, background=True, max_queue=10)
+        with mock.patch.object(lw, '_writeEvent', lambda ev: time.sleep(0.01)):
+            for i in range(100):
+                lw.logRead(b'\x00')
+            stats = lw.getStats()
+            self.assertTrue(stats['dropped'] > 0)
+            self.assertEqual(stats['queued'] + stats['dropped'], 100)
+            lw.close()
+
+    def test_counts(self):
+        lw = log.LogWriter(LOG_LOCATION, background=True, max_queue=100)
+
+        def log_reads():
+            for _ in range(2000):
+                lw.logRead(b'\x00')
+
+        threads = [threading.Thread(target=log_reads) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        lw.close()
+        stats = lw.getStats()
+        self.assertEqual(stats['queued'] + stats['dropped'], 8000)
+        self.assertEqual(stats['written'], stats['queued'])
+
+    def test_error(self):
+        lw = log.LogWriter(LOG_LOCATION, background=True)
+        write = lw._writeEvent
+
+        def failing(ev):
+            if ev[2] == b'\x01':
+                raise OSError(28, 'No space left on device')
+            write(ev)
+
+        with mock.patch.object(lw, '_writeEvent', failing):
+            for i in range(3):
+                lw.logRead(bytes([i]))
+            self.assertRaises(OSError, lw.flush)
+            # The writer thread carried on
+            lw.flush()
+            lw.logRead(b'\x01')
+            self.assertRaises(OSError, lw.close)
+        self.assertEqual([event[2] for event in log.LogReader(LOG_LOCATION)],
+                         [b'\x00', b'\x02'])
+
+
+class RotatingLogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        for _, name in log.ListSegments(SERIES_LOCATION):
+            os.remove(name)
+            if os.path.exists(log.LogIndex.getFilename(name)):
+                os.remove(log.LogIndex.getFilename(name))
+
+    def test_size(self):
+        lw = log.LogWriter(SERIES_LOCATION, index=True, index_events=10,
+                           max_bytes=1000)
+        for i in range(500):
+            lw.logRead(i.to_bytes(4, 'little'))
+        lw.close()
+
+        segments = log.ListSegments(SERIES_LOCATION)
+        self.assertTrue(len(segments) > 1)
+        for number, name in segments:
+            self.assertEqual(name, log.SegmentFilename(SERIES_LOCATION, number))
+            self.assertTrue(os.path.getsize(name) < 1100)
+
+        series = log.OpenLog(SERIES_LOCATION)
+        self.assertIsInstance(series, log.LogSeriesReader)
+        events = list(series)
+        self.assertEqual([event[2] for event in events],
+                         [i.to_bytes(4, 'little') for i in range(500)])
+
+        series.seek(321)
+        self.assertEqual(series.read()[2], (321).to_bytes(4, 'little'))
+        self.assertEqual(series.event_number, 322)
+        series.close()
+
+    def test_time(self):
+        clock = [0.0]
+        with mock.patch('time.monotonic', lambda: clock[0]):
+            lw = log.LogWriter(SERIES_LOCATION, version=log.LOG_VERSION_2,
+                               delta=True, compression=log.COMPRESSION_ZLIB,
+                               max_seconds=60)
+            for i in range(300):
+                clock[0] = i
+                lw.logRead(i.to_bytes(4, 'little'))
+        lw.close()
+        self.assertEqual(len(log.ListSegments(SERIES_LOCATION)), 5)
+
+        with log.LogSeriesReader(SERIES_LOCATION) as series:
+            self.assertEqual(len(list(series)), 300)
+            series.seekTime(0)
+            self.assertEqual(series.read()[2], (0).to_bytes(4, 'little'))
+
+    def test_compressed_size(self):
+        lw = log.LogWriter(SERIES_LOCATION, version=log.LOG_VERSION_2,
+                           compression=log.COMPRESSION_ZLIB, max_bytes=1000,
+                           retention=2)
+        for i in range(500):
+            lw.logRead(i.to_bytes(4, 'little'))
+        lw.close()
+
+        # The pending block counts, rather than overshooting by a whole one
+        segments = log.ListSegments(SERIES_LOCATION)
+        self.assertEqual(len(segments), 2)
+        for _, name in segments:
+            self.assertTrue(os.path.getsize(name) < 1000)
+        with log.LogSeriesReader(SERIES_LOCATION) as series:
+            self.assertEqual(list(series)[-1][2], (499).to_bytes(4, 'little'))
+
+    def test_retention(self):
+        for _ in range(2):
+            lw = log.LogWriter(SERIES_LOCATION, background=True, max_bytes=200,
+                               retention=3)
+            for i in range(200):
+                lw.logRead(i.to_bytes(4, 'little'))
+            lw.close()
+
+        segments = log.ListSegments(SERIES_LOCATION)
+        self.assertEqual(len(segments), 3)
+        self.assertTrue(segments[0][0] > 3)
+        self.assertEqual(segments[-1][0] - segments[0][0], 2)
+        with log.LogSeriesReader(SERIES_LOCATION) as series:
+            self.assertEqual(list(series)[-1][2], (199).to_bytes(4, 'little'))
+
+
+class FrameLogTest(unittest.TestCase):
+    def test_frames(self):
+        lw = log.LogWriter(LOG_LOCATION, version=log.LOG_VERSION_2, frames=True)
+        lw.logOpen()
+        lw.logWrite(antmsg.ChannelOpenMessage(number=2).encode() +
+                    antmsg.SystemResetMessage().encode())
+        lw.logRead(b'\xa4\x01\x6f\x00')
+
+        burst = antmsg.ChannelBurstDataMessage(1, b'\x00' * 8)
+        burst.setChannelNumber((3 << 5) | 1)
+        data = b'\x00\x01' + antmsg.ChannelEventMessage(number=4).encode() + \
+            antmsg.Message(0x99, b'\x01').encode() + burst.encode()
+        buffer_, messages = antevt.ProcessBuffer(data, hook=lw)
+        self.assertEqual(buffer_, b'')
+        lw.close()
+
+        events = list(log.LogReader(LOG_LOCATION))
+        self.assertEqual([event[0] for event in events],
+                         [log.EVENT_OPEN, log.EVENT_FRAME, log.EVENT_FRAME,
+                          log.EVENT_RESYNC, log.EVENT_FRAME,
+                          log.EVENT_PARSE_ERROR, log.EVENT_FRAME])
+        self.assertEqual(events[1][2], [log.DIRECTION_OUT, 0x4B, 2, b'\x02'])
+        self.assertEqual(events[2][2], [log.DIRECTION_OUT, 0x4A, None, b'\x00'])
+        self.assertEqual(events[3][2], ['sync', b'\x00\x01'])
+        self.assertEqual(events[5][2][0], 'unknown')
+        self.assertEqual(events[6][2][2], 1)
+
+        frames = list(log.ReadFrames(log.LogReader(LOG_LOCATION)))
+        self.assertEqual(len(frames), 4)
+        self.assertIsInstance(frames[2][2], antmsg.ChannelEventMessage)
+        self.assertEqual(frames[2][1], log.DIRECTION_IN)
+        self.assertEqual(frames[3][2].getPayload(), burst.getPayload())
+
+    def test_stream_order(self):
+        lw = log.LogWriter(LOG_LOCATION, version=log.LOG_VERSION_2, frames=True)
+        data = antmsg.ChannelEventMessage(number=1).encode() + b'\x00\x01' + \
+            antmsg.ChannelEventMessage(number=2).encode()
+        antevt.ProcessBuffer(data, hook=lw)
+        lw.close()
+
+        # Records come in the order their bytes were received
+        events = list(log.LogReader(LOG_LOCATION))
+        self.assertEqual([event[0] for event in events],
+                         [log.EVENT_FRAME, log.EVENT_RESYNC, log.EVENT_FRAME])
+        self.assertEqual([events[0][2][2], events[2][2][2]], [1, 2])
+
+    def test_threads(self):
+        lw = log.LogWriter(LOG_LOCATION, version=log.LOG_VERSION_2, delta=True,
+                           compression=log.COMPRESSION_ZLIB, block_events=7,
+                           index=True, index_events=5, frames=True)
+        msg = antmsg.ChannelBroadcastDataMessage(number=1, data=b'\x01' * 8)
+
+        def pump():
+            for _ in range(500):
+                lw.logReadFrame(msg)
+
+        threads = [threading.Thread(target=pump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(500):
+            lw.logWrite(msg.encode())
+        for thread in threads:
+            thread.join()
+        lw.close()
+
+        events = list(log.LogReader(LOG_LOCATION))
+        self.assertEqual(len(events), 2500)
+        timestamps = [event[1] for event in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+
+class MergeReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.filenames = [LOG_LOCATION + '.%d' % i for i in range(3)]
+        clock = [0]
+        with mock.patch('time.time_ns', lambda: clock[0]):
+            writers = [log.LogWriter(filename, version=log.LOG_VERSION_2,
+                                     frames=True)
+                       for filename in self.filenames]
+            for i in range(30):
+                clock[0] = i * 10 ** 8
+                # Every stick sees device frames on a channel of its own,
+                # stick 2 only every other one, and each stick sends
+                for source, writer in enumerate(writers):
+                    if source < 2 or i % 2:
+                        writer.logFrame(log.DIRECTION_IN,
+                                        antmsg.ChannelBroadcastDataMessage(
+                                            number=source, data=bytes([i]) * 8))
+                    writer.logWrite(antmsg.ChannelOpenMessage(number=i).encode())
+            for writer in writers:
+                writer.close()
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def test_merge(self):
+        events = list(log.MergeReader([log.LogReader(filename)
+                                       for filename in self.filenames]))
+        self.assertEqual(len(events), 30 * 3 + 75)
+        self.assertEqual([event[1] for _, event in events],
+                         sorted(event[1] for _, event in events))
+        self.assertEqual([source for source, _ in events[0:4]], [0, 0, 1, 1])
+
+    def test_duplicates(self):
+        events = list(log.MergeReader([log.LogReader(filename)
+                                       for filename in self.filenames],
+                                      duplicates=True))
+        frames = [(source, event[2]) for source, event in events
+                  if event[2][0] == log.DIRECTION_IN]
+        self.assertEqual(len(frames), 30)
+        self.assertEqual(set(source for source, _ in frames), {0})
+        # Writes are never duplicates
+        self.assertEqual(len(events) - len(frames), 90)
+
+    def test_devices(self):
+        # Two sticks paired with different devices that send the same data
+        with mock.patch('time.time_ns', lambda: 0):
+            for number, filename in enumerate(self.filenames[0:2]):
+                writer = log.LogWriter(filename, version=log.LOG_VERSION_2,
+                                       frames=True)
+                writer.logFrame(log.DIRECTION_IN, antmsg.ChannelIDMessage(
+                    number=number, device_number=number + 1, device_type=120))
+                writer.logFrame(log.DIRECTION_IN,
+                                antmsg.ChannelBroadcastDataMessage(
+                                    number=number, data=b'\x01' * 8))
+                writer.close()
+
+        events = list(log.MergeReader([log.LogReader(filename)
+                                       for filename in self.filenames[0:2]],
+                                      duplicates=True))
+        self.assertEqual([(source, event[2][1]) for source, event in events],
+                         [(0, 0x51), (0, 0x4E), (1, 0x51), (1, 0x4E)])
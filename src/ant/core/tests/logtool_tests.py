@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ant.core.log as antlog
+import ant.core.logtool as antlogtool
+import ant.core.message as antmsg
+
+LOG_LOCATION = ''.join([tempfile.gettempdir(), os.path.sep,
+                        'python-ant.logtooltest.ant'])
+
+
+class LogToolTest(unittest.TestCase):
+    def setUp(self):
+        # Two broadcasts a second on channels 0 and 1 and a 10 s silence
+        # on channel 1, each frame split over two reads
+        clock = [1000.0]
+        with mock.patch('time.time_ns', lambda: int(clock[0] * 1e9)):
+            lw = antlog.LogWriter(LOG_LOCATION, version=antlog.LOG_VERSION_2,
+                                  index=True, index_events=10)
+            lw.logOpen()
+            lw.logWrite(antmsg.ChannelOpenMessage(number=1).encode())
+            for i in range(60):
+                clock[0] = 1000.0 + i * 0.5
+                if 20 <= i < 40 and i % 2:
+                    continue
+                frame = antmsg.ChannelBroadcastDataMessage(number=i % 2,
+                                                           data=bytes([i]) * 8).encode()
+                if i == 50:
+                    frame = frame[:-1] + b'\x00'
+                lw.logRead(frame[:5])
+                lw.logRead(frame[5:])
+            lw.close()
+
+    def tearDown(self):
+        for filename in [LOG_LOCATION, antlog.LogIndex.getFilename(LOG_LOCATION)]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def run_tool(self, *args):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(antlogtool.main([LOG_LOCATION] + list(args)), 0)
+        return stdout.getvalue().splitlines()
+
+    def test_filters(self):
+        lines = self.run_tool('--format', 'jsonl', '--start', '1010',
+                              '--end', '1020', '--channel', '0')
+        frames = [json.loads(line) for line in lines]
+        self.assertEqual(len(frames), 10)
+        self.assertTrue(all(frame['channel'] == 0 for frame in frames))
+        self.assertEqual(frames[0]['timestamp'], 1010.0)
+        self.assertEqual(frames[0]['payload'], '00' + '14' * 8)
+
+        lines = self.run_tool('--format', 'jsonl', '--direction', 'out')
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         ['ChannelOpenMessage'])
+
+        self.assertEqual(self.run_tool('--type', '0x4B', '--format', 'hex')[0][-14:],
+                         'A4 01 4B 01 EF')
+
+    def test_decoded(self):
+        lines = self.run_tool('--start', '1000', '--end', '1000.1')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith(
+            'OUT ChannelOpenMessage               1   '))
+        self.assertTrue(lines[1].endswith(
+            'IN  ChannelBroadcastDataMessage      0   00 00 00 00 00 00 00 00'))
+
+    def test_summary(self):
+        lines = self.run_tool('--summary-only')
+        self.assertIn('frames:    50', lines)
+        self.assertIn('  0x4E ChannelBroadcastDataMessage      49', lines)
+        self.assertIn('  1           21 frames, 1 gaps over 2.0 s (longest 11.0 s)',
+                      lines)
+        self.assertIn('  checksum   1', lines)
@@ -0,0 +1,615 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import asyncio
+import os
+import struct
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+import ant.core.node as antnode
+import ant.core.simulator as antsim
+
+
+def readMessages(driver, reads=10):
+    buffer_ = b''
+    for _ in range(reads):
+        buffer_ += driver.read(20)
+    return antevt.ProcessBuffer(buffer_)[1]
+
+
+class Collector(antevt.EventCallback):
+    def __init__(self):
+        self.messages = []
+
+    def process(self, msg):
+        self.messages.append(msg)
+
+
+class SimulatedDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.device = antsim.VirtualDevice(1234, 120, period=328)
+        self.driver = antsim.SimulatedDriver(max_channels=4, max_networks=2,
+                                             devices=[self.device], seed=1)
+        self.driver.open()
+
+    def tearDown(self):
+        self.driver.close()
+
+    def test_reset(self):
+        self.driver.write(antmsg.SystemResetMessage().encode())
+        messages = readMessages(self.driver)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(isinstance(messages[0], antmsg.StartupMessage))
+
+    def test_capabilities(self):
+        msg = antmsg.ChannelRequestMessage(message_id=msgtypes.MESSAGE_CAPABILITIES)
+        self.driver.write(msg.encode())
+        caps = readMessages(self.driver)[0]
+        self.assertTrue(isinstance(caps, antmsg.CapabilitiesMessage))
+        self.assertEqual(caps.getMaxChannels(), 4)
+        self.assertEqual(caps.getMaxNetworks(), 2)
+
+    def test_config(self):
+        self.driver.write(antmsg.ChannelAssignMessage(number=1).encode())
+        self.driver.write(antmsg.ChannelAssignMessage(number=1).encode())
+        self.driver.write(antmsg.ChannelAssignMessage(number=2, network=5).encode())
+        codes = [msg.getMessageCode() for msg in readMessages(self.driver)]
+        self.assertEqual(codes, [msgtypes.RESPONSE_NO_ERROR,
+                                 msgtypes.CHANNEL_IN_WRONG_STATE,
+                                 msgtypes.INVALID_NETWORK_NUMBER])
+
+    def test_traffic(self):
+        self.driver.write(antmsg.ChannelAssignMessage(number=0).encode())
+        self.driver.write(antmsg.ChannelIDMessage(number=0, device_type=120).encode())
+        self.driver.write(antmsg.ChannelOpenMessage(number=0).encode())
+        readMessages(self.driver)
+        time.sleep(0.05)
+
+        messages = readMessages(self.driver, 50)
+        self.assertTrue(len(messages) > 1)
+        for msg in messages:
+            self.assertTrue(isinstance(msg, antmsg.ChannelBroadcastDataMessage))
+        self.assertEqual(messages[0].getPayload()[1:3], b'\xD2\x04')
+
+        status = antmsg.ChannelRequestMessage(number=0)
+        self.driver.write(status.encode())
+        status = readMessages(self.driver)[-1]
+        self.assertEqual(status.getStatus() & 0x03, msgtypes.CHANNEL_STATE_TRACKING)
+
+    def test_burst(self):
+        self.device.burst_every = 1
+        self.device.burst_length = 5
+        self.driver.write(antmsg.ChannelAssignMessage(number=0).encode())
+        self.driver.write(antmsg.ChannelOpenMessage(number=0).encode())
+        messages = [msg for msg in readMessages(self.driver)
+                    if isinstance(msg, antmsg.ChannelBurstDataMessage)][:5]
+        self.assertEqual([msg.getChannelNumber() >> 5 for msg in messages],
+                         [0, 1, 2, 3, 5])
+
+
+class FaultInjectingDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.device = antsim.VirtualDevice(1234, 120, period=33)
+        self.sim = antsim.SimulatedDriver(devices=[self.device], seed=1)
+
+    def test_fragment(self):
+        driver = antsim.FaultInjectingDriver(self.sim, fragment_rate=1.0, seed=1)
+        driver.open()
+        self.assertTrue(self.sim.isOpen())
+        driver.write(antmsg.SystemResetMessage().encode())
+        messages = readMessages(driver, 20)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(isinstance(messages[0], antmsg.StartupMessage))
+        self.assertTrue(driver.counters['fragmented'] > 1)
+        driver.close()
+        self.assertFalse(self.sim.isOpen())
+
+    def test_corrupt(self):
+        driver = antsim.FaultInjectingDriver(self.sim, drop_rate=0.01,
+                                             flip_rate=0.01, duplicate_rate=0.01,
+                                             seed=1)
+        driver.open()
+        driver.write(antmsg.ChannelAssignMessage(number=0).encode())
+        driver.write(antmsg.ChannelOpenMessage(number=0).encode())
+        time.sleep(0.05)
+
+        stats = {}
+        buffer_ = b''
+        for _ in range(200):
+            buffer_, _ = antevt.ProcessBuffer(buffer_ + driver.read(20), stats)
+        driver.close()
+
+        self.assertTrue(stats['frames'] > 0)
+        self.assertTrue(stats['frames'] <= self.sim.counters['broadcast'] + 2)
+        self.assertTrue(stats['discarded'] > 0)
+
+
+class SimulatedNodeTest(unittest.TestCase):
+    def test_channels(self):
+        devices = [antsim.VirtualDevice(i + 1, 120, period=328) for i in range(8)]
+        driver = antsim.SimulatedDriver(devices=devices, seed=1)
+        node = antnode.Node(driver)
+        node.start()
+        self.assertEqual(node.getCapabilities()[0:2], (8, 8))
+
+        collectors = []
+        for _ in range(8):
+            channel = node.getFreeChannel()
+            channel.assign(node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE)
+            channel.setID(120, 0, 0)
+            channel.setPeriod(328)
+            channel.open()
+            collector = Collector()
+            channel.registerCallback(collector)
+            collectors.append(collector)
+
+        time.sleep(0.2)
+        node.stop()
+
+        for collector in collectors:
+            self.assertTrue(collector.messages)
+
+    def test_reset(self):
+        node = antnode.Node(antsim.SimulatedDriver())
+        start = time.monotonic()
+        node.start()
+        node.stop()
+        self.assertTrue(node.startup_message)
+        self.assertTrue(time.monotonic() - start < antnode.RESET_DELAY)
+
+    def test_reset_fallback(self):
+        node = antnode.Node(antsim.SimulatedDriver(startup_message=False),
+                            reset_timeout=0.05)
+        with mock.patch('ant.core.node.RESET_DELAY', 0.2):
+            start = time.monotonic()
+            node.start()
+            self.assertFalse(node.startup_message)
+            self.assertTrue(time.monotonic() - start >= 0.2)
+
+            # Known not to send it, so later resets just wait
+            start = time.monotonic()
+            node.stop()
+            self.assertTrue(time.monotonic() - start >= 0.2)
+
+    def test_init(self):
+        driver = antsim.SimulatedDriver(max_channels=15, max_networks=8)
+        node = antnode.Node(driver)
+        node.start()
+        self.assertEqual(node.getCapabilities()[0:2], (15, 8))
+        self.assertEqual(set(node.getTimings()),
+                         {'open', 'reset', 'capabilities', 'network_keys'})
+        self.assertEqual([network.number for network in node.networks],
+                         list(range(8)))
+
+        # Channels only exist once asked for
+        callbacks = len(node.evm.callbacks)
+        self.assertEqual(len(node.channels), 15)
+        channel = node.getFreeChannel()
+        self.assertEqual(channel.number, 0)
+        self.assertEqual(len(node.evm.callbacks), callbacks + 1)
+        channel.assign(node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE)
+        self.assertEqual(node.getFreeChannel().number, 1)
+        self.assertEqual(node.getChannel(14).number, 14)
+        self.assertIs(node.channels[-1], node.getChannel(14))
+        self.assertRaises(IndexError, node.channels.__getitem__, 15)
+        self.assertRaises(antex.NodeError, node.getChannel, 15)
+        node.stop()
+
+    def test_apply(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(7, 120, period=8070)])
+        node = antnode.Node(driver)
+        node.start()
+        channel = node.getFreeChannel()
+        config = antnode.ChannelConfig(node.networks[0].name,
+                                       msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+                                       device_type=120, period=8070, frequency=57,
+                                       tx_power=msgtypes.RADIO_TX_POWER_PLUS4DB)
+        channel.apply(config)
+        channel.open()
+        self.assertEqual(channel.settings, config.getSettings())
+        simulated = driver.channels[0]
+        self.assertEqual((simulated.period, simulated.frequency, simulated.power),
+                         (8070, 57, msgtypes.RADIO_TX_POWER_PLUS4DB))
+
+        # Only what changed is sent
+        with mock.patch.object(driver, 'write', wraps=driver.write) as write:
+            channel.apply(antnode.ChannelConfig(
+                node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+                device_type=120, period=4035, frequency=57,
+                tx_power=msgtypes.RADIO_TX_POWER_PLUS4DB))
+            self.assertEqual(len(write.call_args_list), 1)
+            self.assertEqual(write.call_args_list[0][0][0][2],
+                             msgtypes.MESSAGE_CHANNEL_PERIOD)
+        self.assertEqual(simulated.period, 4035)
+
+        # A plain reset leaves the channel unconfigured
+        node.reset()
+        self.assertEqual(simulated.state, msgtypes.CHANNEL_STATE_UNASSIGNED)
+
+        # Restoring re-applies the config and reopens the channel
+        node.reset(restore=True)
+        self.assertEqual(simulated.period, 4035)
+        self.assertEqual(simulated.frequency, 57)
+        self.assertTrue(channel.is_open)
+        self.assertNotEqual(simulated.state, msgtypes.CHANNEL_STATE_UNASSIGNED)
+
+        # A different channel type needs the channel assigned again
+        channel.apply(antnode.ChannelConfig(node.networks[0].name,
+                                            msgtypes.CHANNEL_TYPE_TWOWAY_TRANSMIT,
+                                            device_type=120, device_number=3))
+        self.assertFalse(channel.is_open)
+        self.assertEqual(simulated.type_, msgtypes.CHANNEL_TYPE_TWOWAY_TRANSMIT)
+        self.assertEqual(channel.settings, {
+            'assign': (node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_TRANSMIT),
+            'id': (120, 3, 0)})
+        node.stop()
+
+    def test_warm_start(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(7, 120, period=328)])
+        node = antnode.Node(driver)
+        node.start()
+        channel = node.channels[2]
+        channel.assign(node.networks[1].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE)
+        channel.setID(120, 0, 0)
+        channel.setPeriod(328)
+        channel.open()
+        time.sleep(0.1)
+        node.stop(reset=False)
+
+        node = antnode.Node(driver)
+        start = time.monotonic()
+        node.start(warm=True)
+        self.assertTrue(time.monotonic() - start < 0.5)
+        self.assertEqual(driver.channels[2].state, msgtypes.CHANNEL_STATE_TRACKING)
+
+        self.assertEqual([channel.is_free for channel in node.channels],
+                         [True, True, False] + [True] * 5)
+        channel = node.channels[2]
+        self.assertTrue(channel.is_open)
+        self.assertEqual(channel.settings, {
+            'assign': (node.networks[1].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE),
+            'id': (120, 7, 1)})
+
+        collector = Collector()
+        channel.registerCallback(collector)
+        time.sleep(0.1)
+        node.stop()
+        self.assertTrue(collector.messages)
+
+    def test_warm_restore(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(7, 120, period=328)])
+        key = antnode.NetworkKey('N:ANT+', b'\xB9\xA5\x21\xFB\xBD\x72\xC3\x45')
+        config = antnode.ChannelConfig('N:ANT+', msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+                                       device_type=120, period=328, frequency=57)
+        node = antnode.Node(driver)
+        node.start()
+        node.setNetworkKey(0, key)
+        node.getChannel(1).apply(config)
+        node.getChannel(1).open()
+        node.stop(reset=False)
+
+        # Without the key and config nothing is replayed with zero keys
+        node = antnode.Node(driver)
+        node.start(warm=True)
+        self.assertRaises(antex.NodeError, node.reset, restore=True)
+        self.assertEqual(driver.network_keys[0], b'\x00' * 8)
+        self.assertEqual(driver.channels[1].state, msgtypes.CHANNEL_STATE_UNASSIGNED)
+        node.stop(reset=False)
+
+        # With them the channel comes back as it was configured
+        node.start()
+        node.setNetworkKey(0, key)
+        node.getChannel(1).apply(config)
+        node.getChannel(1).open()
+        node.stop(reset=False)
+
+        node = antnode.Node(driver)
+        node.start(warm=True, networks=[key], configs={1: config})
+        node.reset(restore=True)
+        self.assertEqual(driver.network_keys[0], key.key)
+        self.assertEqual((driver.channels[1].period, driver.channels[1].frequency),
+                         (328, 57))
+        # Searching for any device again, not just the one paired before
+        self.assertEqual(node.channels[1].settings['id'], (120, 0, 0))
+        self.assertTrue(node.channels[1].is_open)
+        node.stop()
+
+    def test_recovery(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(1, 120, period=328)])
+        node = antnode.Node(driver)
+        node.start()
+
+        channel = node.getFreeChannel()
+        channel.assign(node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE)
+        channel.setID(120, 0, 0)
+        channel.setPeriod(328)
+        channel.open()
+
+        driver.unplug()
+        time.sleep(0.3)
+        driver.plug()
+
+        deadline = time.monotonic() + 10
+        while node.evm.getMetrics()['recoveries'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        metrics = node.evm.getMetrics()
+
+        self.assertEqual(metrics['disconnects'], 1)
+        self.assertEqual(metrics['reconnects'], 1)
+        self.assertEqual(metrics['recoveries'], 1)
+        self.assertTrue(metrics['last_outage'] >= 0.3)
+        self.assertTrue(metrics['last_recovery'] < metrics['last_outage'])
+        self.assertEqual(driver.channels[0].state, msgtypes.CHANNEL_STATE_TRACKING)
+        self.assertEqual(driver.channels[0].period, 328)
+        self.assertTrue(channel.is_open)
+
+        node.stop()
+
+
+class ChannelStreamTest(unittest.TestCase):
+    def setUp(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(1, 120, period=328)])
+        self.node = antnode.Node(driver)
+        self.node.start()
+        self.channel = self.node.getFreeChannel()
+        self.channel.apply(antnode.ChannelConfig(
+            self.node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+            device_type=120, period=328))
+
+    def tearDown(self):
+        if self.node.running:
+            self.node.stop()
+
+    def test_stream(self):
+        with self.channel.stream() as stream:
+            self.channel.open()
+            messages = [next(stream) for _ in range(5)]
+        for msg in messages:
+            self.assertIsInstance(msg, antmsg.ChannelBroadcastDataMessage)
+        self.assertEqual(stream.getStats()['delivered'], 5)
+        # A closed stream ends once drained
+        pending = stream.getStats()['pending']
+        self.assertEqual(len(list(stream)), pending)
+        self.assertIsNone(stream.get())
+
+    def test_overflow(self):
+        newest = self.channel.stream(max_size=2, overflow=antnode.OVERFLOW_DROP_NEWEST)
+        oldest = self.channel.stream(max_size=2)
+        self.channel.open()
+        time.sleep(0.1)
+        newest.close()
+        oldest.close()
+        for stream in (newest, oldest):
+            stats = stream.getStats()
+            self.assertEqual(stats['pending'], 2)
+            self.assertTrue(stats['dropped'] > 0)
+            self.assertEqual(stats['received'], stats['dropped'] + 2)
+        self.assertRaises(ValueError, self.channel.stream, overflow='spill')
+
+    def test_block(self):
+        stream = self.channel.stream(max_size=1, overflow=antnode.OVERFLOW_BLOCK)
+        self.channel.open()
+        time.sleep(0.1)
+        # The pump is blocked on the full stream, closing releases it
+        stream.close()
+        collector = Collector()
+        self.channel.registerCallback(collector)
+        time.sleep(0.1)
+        self.assertTrue(collector.messages)
+
+    def test_stop_blocked(self):
+        stream = self.channel.stream(max_size=1, overflow=antnode.OVERFLOW_BLOCK)
+        self.channel.open()
+        time.sleep(0.1)
+        # The pump is blocked on the full stream, stopping must not wait for it
+        stopper = threading.Thread(target=self.node.stop, daemon=True)
+        stopper.start()
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+        self.assertTrue(stream.getStats()['dropped'] > 0)
+
+    def test_loop_closed(self):
+        async def first(stream):
+            async for msg in stream:
+                return msg
+
+        stream = self.channel.stream()
+        self.channel.open()
+        asyncio.run(asyncio.wait_for(first(stream), 5))
+        # The loop is gone but the stream is still fed
+        collector = Collector()
+        self.channel.registerCallback(collector)
+        time.sleep(0.1)
+        self.assertTrue(collector.messages)
+        stream.close()
+
+    def test_batch(self):
+        stream = self.channel.stream(batch=4, batch_time=0.5)
+        self.channel.open()
+        self.assertEqual(len(stream.get()), 4)
+        stream.close()
+
+        # With nothing more arriving a batch is cut short after batch_time
+        stream = self.channel.stream(batch=4, batch_time=0.05)
+        self.channel.close()
+        self.channel.process(antmsg.ChannelBroadcastDataMessage(number=0))
+        start = time.monotonic()
+        self.assertEqual(len(stream.get(timeout=1)), 1)
+        self.assertTrue(time.monotonic() - start >= 0.04)
+        stream.close()
+
+    def test_async(self):
+        async def consume(stream):
+            messages = []
+            async for msg in stream:
+                messages.append(msg)
+                if len(messages) == 3:
+                    stream.close()
+            return messages
+
+        stream = self.channel.stream()
+        self.channel.open()
+        messages = asyncio.run(asyncio.wait_for(consume(stream), 5))
+        self.assertTrue(len(messages) >= 3)
+
+        async def batches(stream):
+            async for batch in stream:
+                stream.close()
+                return batch
+
+        stream = self.channel.stream(batch=3, batch_time=1)
+        self.assertEqual(len(asyncio.run(asyncio.wait_for(batches(stream), 5))), 3)
+
+
+class BurstTest(unittest.TestCase):
+    def setUp(self):
+        self.device = antsim.VirtualDevice(1, 120, period=328)
+        self.driver = antsim.SimulatedDriver(devices=[self.device])
+        self.node = antnode.Node(self.driver)
+        self.node.start()
+        self.channel = self.node.getFreeChannel()
+        self.channel.apply(antnode.ChannelConfig(
+            self.node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+            device_type=120, period=328))
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_receive(self):
+        self.device.burst_every = 2
+        self.device.burst_length = 5
+        with self.channel.receiveBursts(size=8) as receiver:
+            self.channel.open()
+            data = receiver.get(timeout=2)
+        counter = struct.unpack('<I', data[4:8])[0]
+        self.assertEqual(data, b''.join(self.device.getData(counter + i)
+                                        for i in range(5)))
+
+    def test_send(self):
+        with self.channel.stream() as stream:
+            self.channel.open()
+            stream.get(timeout=2)  # Tracking once data arrives
+        data = bytes(range(256)) * 3
+        self.channel.sendBurst(data)
+        self.assertEqual(self.driver.channels[0].bursts[-1], data)
+
+        self.driver.tx_fail_rate = 1.0
+        self.assertRaises(antex.BurstError, self.channel.sendBurst, data)
+
+
+class TransmitTest(unittest.TestCase):
+    def test_acknowledged(self):
+        driver = antsim.SimulatedDriver(devices=[antsim.VirtualDevice(1, 17, period=328)])
+        node = antnode.Node(driver)
+        node.start()
+        channel = node.getFreeChannel()
+        channel.apply(antnode.ChannelConfig(
+            node.networks[0].name, msgtypes.CHANNEL_TYPE_TWOWAY_RECEIVE,
+            device_type=17, period=328))
+        with channel.stream() as stream:
+            channel.open()
+            stream.get(timeout=2)
+
+        futures = [channel.sendAcknowledged(bytes([0x31, i]) + bytes(6), key='resistance')
+                   for i in range(5)]
+        for future in futures:
+            self.assertIsNone(future.result(timeout=2))
+        # The first went out straight away, the rest merged into the last
+        self.assertEqual(channel.transmit.counters['sent'], 2)
+
+        driver.tx_fail_rate = 1.0
+        future = channel.sendAcknowledged(bytes(8))
+        self.assertRaises(antex.TransferError, future.result, 2)
+        self.assertEqual(channel.transmit.counters['retries'], channel.transmit.retries)
+        node.stop()
+
+
+class NetworkKeyTest(unittest.TestCase):
+    def test_rejected(self):
+        driver = antsim.SimulatedDriver(max_networks=2)
+        node = antnode.Node(driver)
+        node.start()
+        driver.max_networks = 1
+        self.assertRaises(antex.NodeError, node.setNetworkKeys)
+        self.assertIsNone(node.evm.waitForAck(antmsg.NetworkKeyMessage(), 0.05))
+        node.stop()
+
+
+class StickCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), 'sticks.json')
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rmdir(os.path.dirname(self.filename))
+
+    def test_cache(self):
+        driver = antsim.SimulatedDriver(max_channels=15, serial_number=b'\x39\x30\x00\x00')
+        node = antnode.Node(driver, cache=antnode.StickCache(self.filename))
+        node.start()
+        info = node.getStickInfo()
+        node.stop()
+        self.assertEqual(info.version, 'AJK3.04')
+        self.assertEqual(info.serial_number, 12345)
+        self.assertEqual(info.capabilities.max_channels, 15)
+        self.assertTrue(info.capabilities.hasAdvOption(
+            msgtypes.CAPABILITIES_SERIAL_NUMBER_ENABLED))
+        self.assertTrue(info.capabilities.hasAdvOption2(
+            msgtypes.CAPABILITIES_EXT_MESSAGE_ENABLED))
+
+        # Started again, nothing is requested from the stick
+        cache = antnode.StickCache(self.filename)
+        self.assertEqual(cache.get(driver.getIdentity()), info)
+        node = antnode.Node(driver, cache=cache)
+        with mock.patch.object(driver, 'write', wraps=driver.write) as write:
+            node.start()
+            self.assertEqual(node.getStickInfo(), info)
+            self.assertEqual(node.getCapabilities()[0], 15)
+            requests = [call for call in write.call_args_list
+                        if call[0][0][2] == msgtypes.MESSAGE_CHANNEL_REQUEST]
+            self.assertEqual(requests, [])
+
+        node.invalidateCache()
+        self.assertIsNone(cache.get(driver.getIdentity()))
+        node.stop()
+
+    def test_no_cache(self):
+        driver = antsim.SimulatedDriver()
+        node = antnode.Node(driver)
+        with mock.patch.object(driver, 'getIdentity') as identity:
+            node.start()
+        identity.assert_not_called()
+        self.assertIsNone(node.info.version)
+        self.assertEqual(node.getStickInfo().version, 'AJK3.04')
+        node.stop()
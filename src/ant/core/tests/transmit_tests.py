@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+import unittest
+
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+import ant.core.transmit as anttx
+
+
+class FakeDriver():
+    def __init__(self):
+        self.written = []
+        self.lost = False
+
+    def write(self, data):
+        if self.lost:
+            raise antex.DeviceLostError('Could not write to device (unplugged)')
+        self.written += antevt.ProcessBuffer(data)[1]
+        return len(data)
+
+
+class FakeNode():
+    def __init__(self):
+        self.driver = FakeDriver()
+
+
+class FakeChannel():
+    def __init__(self):
+        self.number = 2
+        self.node = FakeNode()
+
+    def registerCallback(self, callback):
+        pass
+
+    def removeCallback(self, callback):
+        pass
+
+
+def Event(code):
+    return antmsg.ChannelEventMessage(number=2, message_id=0x01, message_code=code)
+
+
+class TransmitQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.queue = anttx.TransmitQueue(self.channel, retries=1)
+
+    def written(self):
+        return [msg.getPayload()[1:] for msg in self.channel.node.driver.written]
+
+    def test_one_in_flight(self):
+        first = self.queue.send(b'\x01' * 8)
+        second = self.queue.send(b'\x02' * 8)
+        self.assertEqual(self.written(), [b'\x01' * 8])
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertIsNone(first.result(0))
+        self.assertFalse(second.done())
+        self.assertEqual(self.written(), [b'\x01' * 8, b'\x02' * 8])
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertIsNone(second.result(0))
+        self.assertIsNone(self.queue.in_flight)
+
+    def test_retry(self):
+        future = self.queue.send(b'\x01' * 8)
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_FAILED))
+        self.assertFalse(future.done())
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_FAILED))
+        self.assertRaises(antex.TransferError, future.result, 0)
+        self.assertEqual(len(self.written()), 2)
+        self.assertEqual(self.queue.counters['retries'], 1)
+
+    def test_merge(self):
+        self.queue.send(b'\x01' * 8, key='setpoint')
+        old = self.queue.send(b'\x02' * 8, key='setpoint')
+        other = self.queue.send(b'\x03' * 8, key='mode')
+        new = self.queue.send(b'\x04' * 8, key='setpoint')
+        for _ in range(3):
+            self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        # The one in flight is never replaced
+        self.assertEqual(self.written(), [b'\x01' * 8, b'\x04' * 8, b'\x03' * 8])
+        self.assertTrue(old.done() and new.done() and other.done())
+        self.assertEqual(self.queue.counters['merged'], 1)
+
+    def test_closed(self):
+        futures = [self.queue.send(b'\x01' * 8), self.queue.send(b'\x02' * 8)]
+        self.queue.process(Event(msgtypes.EVENT_CHANNEL_CLOSED))
+        for future in futures:
+            self.assertRaises(antex.TransferError, future.result, 0)
+
+    def test_error_response(self):
+        future = self.queue.send(b'\x01' * 8)
+        self.queue.process(antmsg.ChannelEventMessage(
+            number=2, message_id=msgtypes.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+            message_code=msgtypes.CHANNEL_NOT_OPENED))
+        self.assertRaises(antex.TransferError, future.result, 0)
+
+    def test_callback_sends(self):
+        future = self.queue.send(b'\x01' * 8)
+        future.add_done_callback(lambda _: self.queue.send(b'\x02' * 8))
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertEqual(self.written(), [b'\x01' * 8, b'\x02' * 8])
+
+    def test_write_error(self):
+        self.channel.node.driver.lost = True
+        future = self.queue.send(b'\x01' * 8)
+        self.assertRaises(antex.TransferError, future.result, 0)
+        self.assertEqual(self.queue.counters['sent'], 0)
+
+        # The queue carries on once the device is back
+        self.channel.node.driver.lost = False
+        future = self.queue.send(b'\x02' * 8)
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertIsNone(future.result(0))
+
+    def test_in_progress(self):
+        future = self.queue.send(b'\x01' * 8)
+        self.queue.process(antmsg.ChannelEventMessage(
+            number=2, message_id=msgtypes.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+            message_code=msgtypes.TRANSFER_IN_PROGRESS))
+        self.assertEqual(len(self.written()), 1)
+        # Retried on the outcome of the transfer that was in progress
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertEqual(len(self.written()), 2)
+        self.assertFalse(future.done())
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertIsNone(future.result(0))
+
+    def test_suspend(self):
+        self.queue.send(b'\x01' * 8)
+        self.assertRaises(antex.TransferError, self.queue.suspend, 0)
+        self.assertEqual(self.queue.suspended, 0)
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.queue.suspend(0)
+        future = self.queue.send(b'\x02' * 8)
+        # Outcomes of a burst are not taken for the queued message
+        self.queue.process(Event(msgtypes.EVENT_TRANSFER_TX_COMPLETED))
+        self.assertFalse(future.done())
+        self.assertEqual(len(self.written()), 1)
+        self.queue.resume()
+        self.assertEqual(len(self.written()), 2)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+# Copyright (c) 2020, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+"""Acknowledged Data Transmission
+
+Queues acknowledged data messages for a channel and reports whether each
+one got through.
+"""
+
+import collections
+import concurrent.futures
+import threading
+
+import ant.core.constants as msgtypes
+import ant.core.event as antevt
+import ant.core.exceptions as antex
+import ant.core.message as antmsg
+
+# Attempts after the first before a message is given up on
+ACK_RETRIES = 3
+
+
+class Transmission():
+    '''An acknowledged data message waiting to be sent, and the futures of
+    the messages it superseded. '''
+    def __init__(self, data, key):
+        self.data = data
+        self.key = key
+        self.attempts = 0
+        self.futures = [concurrent.futures.Future()]
+
+
+class TransmitQueue(antevt.EventCallback):
+    '''Sends the acknowledged data queued for a channel one message at a
+    time. See Channel.sendAcknowledged().
+
+    The stick sends acknowledged data at the channel's next period and
+    reports the outcome with EVENT_TRANSFER_TX_COMPLETED or
+    EVENT_TRANSFER_TX_FAILED, the next message is only written after that.
+    Failed messages are retried up to retries times, a message the stick
+    refused because another transfer was in progress is retried a period
+    later. A message queued with the key of one still waiting replaces its
+    data, and the futures of both complete when it is sent.
+
+    Futures are completed outside the queue's lock, so their callbacks may
+    queue more data.
+    '''
+    def __init__(self, channel, retries=ACK_RETRIES):
+        self.channel = channel
+        self.retries = retries
+        self.in_flight = None
+        self.pending = collections.deque()
+        self.counters = {'sent': 0, 'completed': 0, 'failed': 0,
+                         'retries': 0, 'merged': 0}
+        # Set when the stick had another transfer in progress
+        self.deferred = False
+        # Number of suspend() calls not resume()'d yet
+        self.suspended = 0
+        self._cond = threading.Condition()
+        channel.registerCallback(self)
+
+    def close(self):
+        self.channel.removeCallback(self)
+        self.fail('Transmit queue closed.')
+
+    def send(self, data, key=None):
+        '''Queues data and returns a future completing with None once the
+        other end acknowledged it, or failing with TransferError. '''
+        done = []
+        with self._cond:
+            if key is not None:
+                for transmission in self.pending:
+                    if transmission.key == key:
+                        transmission.data = data
+                        future = concurrent.futures.Future()
+                        transmission.futures.append(future)
+                        self.counters['merged'] += 1
+                        return future
+
+            transmission = Transmission(data, key)
+            future = transmission.futures[-1]
+            self.pending.append(transmission)
+            if self.in_flight is None:
+                self._next(done)
+        self._complete(done)
+        return future
+
+    def _complete(self, done):
+        # Called without the lock, done callbacks may call send()
+        for futures, error in done:
+            for future in futures:
+                if future.done():
+                    continue    # Cancelled by its owner
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(antex.TransferError(error))
+
+    def _write(self, done):
+        # Called with the lock held, fails the message in flight if the
+        # driver could not take it
+        msg = antmsg.ChannelAcknowledgedDataMessage(number=self.channel.number,
+                                                    data=self.in_flight.data)
+        data = msg.encode()
+        self.in_flight.attempts += 1
+        self.deferred = False
+        try:
+            if self.channel.node.driver.write(data) == len(data):
+                self.counters['sent'] += 1
+                return
+            error = 'Could not send acknowledged data (short write).'
+        except antex.DriverError as ex:
+            error = 'Could not send acknowledged data (%s).' % ex
+        self._finish(done, error)
+
+    def _next(self, done):
+        # Called with the lock held
+        self.in_flight = None
+        while self.pending and not self.suspended and self.in_flight is None:
+            self.in_flight = self.pending.popleft()
+            self._write(done)
+        self._cond.notify_all()
+
+    def _finish(self, done, error=None):
+        # Called with the lock held
+        done.append((self.in_flight.futures, error,))
+        self.counters['completed' if error is None else 'failed'] += 1
+        self.in_flight = None
+
+    def _retry(self, done, error):
+        # Called with the lock held
+        if self.in_flight.attempts > self.retries:
+            self._finish(done, error)
+            self._next(done)
+        else:
+            self.counters['retries'] += 1
+            self._write(done)
+            if self.in_flight is None:
+                self._next(done)
+
+    def retransmit(self):
+        '''Writes the message in flight again, for a stick that was reset
+        before answering. '''
+        done = []
+        with self._cond:
+            if self.in_flight is not None:
+                self.in_flight.attempts -= 1
+                self._write(done)
+                if self.in_flight is None:
+                    self._next(done)
+        self._complete(done)
+
+    def suspend(self, timeout=None):
+        '''Stops writing queued messages, for a burst to have the channel to
+        itself, once the message in flight is done. Raises TransferError if
+        it isn't done within timeout seconds. Not to be called from the
+        event pump. '''
+        with self._cond:
+            self.suspended += 1
+            if not self._cond.wait_for(lambda: self.in_flight is None, timeout):
+                self.suspended -= 1
+                raise antex.TransferError('Acknowledged data still in flight.')
+
+    def resume(self):
+        '''Undoes suspend() and writes the next queued message. '''
+        done = []
+        with self._cond:
+            self.suspended -= 1
+            if self.in_flight is None:
+                self._next(done)
+        self._complete(done)
+
+    def fail(self, error):
+        '''Fails the message in flight and everything queued. '''
+        done = []
+        with self._cond:
+            if self.in_flight is not None:
+                self.pending.appendleft(self.in_flight)
+            for transmission in self.pending:
+                done.append((transmission.futures, error,))
+                self.counters['failed'] += 1
+            self.pending.clear()
+            self.in_flight = None
+            self.deferred = False
+            self._cond.notify_all()
+        self._complete(done)
+
+    def process(self, msg):
+        if isinstance(msg, antmsg.ChannelEventMessage) and \
+                msg.getMessageID() == 0x01 and \
+                msg.getMessageCode() == msgtypes.EVENT_CHANNEL_CLOSED:
+            self.fail('Channel closed.')
+            return
+
+        done = []
+        with self._cond:
+            if self.in_flight is None:
+                return
+            if self.deferred and (not isinstance(msg, antmsg.ChannelEventMessage)
+                                  or msg.getMessageID() == 0x01):
+                # Data or an event from the stick, a period went by
+                self._retry(done, 'Transfer in progress.')
+            elif not isinstance(msg, antmsg.ChannelEventMessage):
+                pass
+            elif msg.getMessageID() == 0x01:
+                code = msg.getMessageCode()
+                if code == msgtypes.EVENT_TRANSFER_TX_COMPLETED:
+                    self._finish(done)
+                    self._next(done)
+                elif code == msgtypes.EVENT_TRANSFER_TX_FAILED:
+                    self._retry(done, 'Acknowledged data not acknowledged.')
+            elif msg.getMessageID() == msgtypes.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA:
+                code = msg.getMessageCode()
+                if code == msgtypes.TRANSFER_IN_PROGRESS:
+                    self.deferred = True
+                elif code != msgtypes.RESPONSE_NO_ERROR:
+                    self._finish(done, 'Could not send acknowledged data '
+                                 '(0x%02X).' % code)
+                    self._next(done)
+        self._complete(done)